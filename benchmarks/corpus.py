@@ -0,0 +1,127 @@
+"""
+Generator of a synthetic tree to benchmark the stages on (see pipeline.py), templated on the samples in testdata.
+The tree is reproducible for a seed and consists of:
+    tiny/        many tiny text, csv and xml files, 100 per folder
+    variants/    copies of the samples, every copy with a unique trailer (same format, different checksum)
+    duplicates/  exact copies of the samples
+    deep/        a chain of nested folders with a tiny file per level
+    large/       large media files, a video sample padded to the given size
+
+    uv run python benchmarks/corpus.py /tmp/corpus --tiny 10000
+"""
+
+import random
+import shutil
+from pathlib import Path
+from typing import Annotated, Any
+
+import typer
+from typer import secho
+
+ROOT = Path(__file__).parent.parent
+TESTDATA = ROOT / "testdata"
+# the sample that is padded to large media files
+LARGE = TESTDATA / "non-intra slice.mp4"
+CHUNK = 1 << 20
+
+TINY = {
+    "txt": "{words}\n",
+    "csv": "id,name,value\n{id},{words},{value}\n",
+    "xml": '<?xml version="1.0" encoding="UTF-8"?>\n<record id="{id}"><name>{words}</name></record>\n',
+}
+WORDS = ["archive", "record", "scan", "letter", "photo", "report", "minutes", "draft", "final", "copy"]
+
+
+def samples() -> list[Path]:
+    """Return the samples of testdata, the smallest first"""
+    return sorted((path for path in TESTDATA.rglob("*") if path.is_file()), key=lambda path: path.stat().st_size)
+
+
+def generate(
+    dest: Path,
+    tiny: int = 5000,
+    variants: int = 200,
+    duplicates: int = 50,
+    depth: int = 32,
+    large: int = 2,
+    large_mb: int = 64,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """
+    Generate the tree in dest, returns what it consists of: the options, the number of files and their size
+    :param tiny the number of tiny files
+    :param variants the number of copies of the samples with a unique trailer
+    :param duplicates the number of exact copies of the samples
+    :param depth the number of nested folders
+    :param large the number of large media files
+    :param large_mb the size of a large media file in MB
+    :param seed the seed of the random content
+    """
+    rng = random.Random(seed)  # noqa: S311
+    templates = samples()
+    dest.mkdir(parents=True, exist_ok=True)
+
+    for i in range(tiny):
+        ext, template = list(TINY.items())[i % len(TINY)]
+        text = template.format(id=i, words=" ".join(rng.choices(WORDS, k=rng.randint(1, 40))), value=rng.random())
+        path = dest / "tiny" / f"{i // 100:04d}" / f"tiny_{i:06d}.{ext}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+    for i in range(variants):
+        sample = templates[i % len(templates)]
+        path = dest / "variants" / f"{i // 100:04d}" / f"{i:05d}_{sample.name}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(sample.read_bytes() + rng.randbytes(16))
+
+    for i in range(duplicates):
+        sample = templates[i % len(templates)]
+        path = dest / "duplicates" / f"{i % 10:02d}" / f"{i:05d}_{sample.name}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(sample, path)
+
+    folder = dest / "deep"
+    for level in range(depth):
+        folder /= f"level_{level:03d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"note_{level:03d}.txt").write_text(" ".join(rng.choices(WORDS, k=8)))
+
+    for i in range(large):
+        path = dest / "large" / f"large_{i:03d}.mp4"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            f.write(LARGE.read_bytes())
+            # the padding after the last box is ignored by the demuxers
+            while (missing := large_mb * 1_000_000 - f.tell()) > 0:
+                f.write(rng.randbytes(min(missing, CHUNK)))
+
+    files = [path for path in dest.rglob("*") if path.is_file()]
+    return {
+        "tiny": tiny,
+        "variants": variants,
+        "duplicates": duplicates,
+        "depth": depth,
+        "large": large,
+        "large_mb": large_mb,
+        "seed": seed,
+        "files": len(files),
+        "bytes": sum(path.stat().st_size for path in files),
+    }
+
+
+def main(
+    dest: Annotated[Path, typer.Argument(help="the dir to generate the tree in")],
+    tiny: Annotated[int, typer.Option(help="number of tiny files")] = 5000,
+    variants: Annotated[int, typer.Option(help="number of copies of the samples with a unique trailer")] = 200,
+    duplicates: Annotated[int, typer.Option(help="number of exact copies of the samples")] = 50,
+    depth: Annotated[int, typer.Option(help="number of nested folders")] = 32,
+    large: Annotated[int, typer.Option(help="number of large media files")] = 2,
+    large_mb: Annotated[int, typer.Option(help="size of a large media file in MB")] = 64,
+    seed: Annotated[int, typer.Option(help="seed of the random content")] = 0,
+) -> None:
+    corpus = generate(dest, tiny, variants, duplicates, depth, large, large_mb, seed)
+    secho(f"generated {corpus['files']} files, {corpus['bytes'] / 1e6:.1f} MB in {dest}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,106 @@
+"""
+Memory of the stack, in bytes per file on a synthetic stack (by default a million files).
+Exits with 1 if the stack exceeds its budget. The full sfinfos of a sample are measured for comparison.
+
+    uv run python benchmarks/memory.py
+"""
+
+import hashlib
+import sys
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Annotated, Any
+
+import typer
+from typer import colors, secho
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, f"{ROOT}")
+
+from fileidentification.definitions.models import LogMsg, SfInfo  # noqa: E402
+from fileidentification.tasks.stack import Stack  # noqa: E402
+
+# the formats of the synthetic files: puid, format name, mimetype, extension
+FORMATS = [
+    ("fmt/43", "JPEG File Interchange Format", "image/jpeg", "jpg"),
+    ("fmt/353", "Tagged Image File Format", "image/tiff", "tif"),
+    ("fmt/199", "MPEG-4 Media File", "video/mp4", "mp4"),
+    ("fmt/276", "Acrobat PDF 1.7 - Portable Document Format", "application/pdf", "pdf"),
+    ("fmt/412", "Microsoft Word for Windows", "application/vnd.openxmlformats", "docx"),
+]
+
+
+def synthetic(files: int, folders: int = 1000) -> Iterator[SfInfo]:
+    """Yield the sfinfos of a probed tree, every file with a match and its media info"""
+    for i in range(files):
+        puid, name, mime, ext = FORMATS[i % len(FORMATS)]
+        yield SfInfo(
+            filename=Path(f"archive/folder_{i % folders:04d}/file_{i:07d}.{ext}"),
+            filesize=1000 + i,
+            modified="2024-05-01T12:00:00Z",
+            errors="",
+            md5=hashlib.md5(f"{i}".encode()).hexdigest(),  # noqa: S324
+            matches=[
+                {
+                    "ns": "pronom",
+                    "id": puid,
+                    "format": name,
+                    "version": "",
+                    "mime": mime,
+                    "class": "",
+                    "basis": f"extension match {ext}; byte match at [[0 14] [{1000 + i} 2]]",
+                    "warning": "",
+                }
+            ],
+            media_info=[LogMsg(name="ffmpeg", msg=f"{mime} 1920x1080 stream of file_{i:07d}")],
+        )
+
+
+def deep_size(obj: Any) -> int:
+    """Return the size of obj and of all the objects it references in bytes, shared objects are counted once"""
+    seen: set[int] = set()
+    size = 0
+    todo = [obj]
+    while todo:
+        el = todo.pop()
+        if id(el) in seen or isinstance(el, type):
+            continue
+        seen.add(id(el))
+        size += sys.getsizeof(el)
+        if isinstance(el, dict):
+            todo.extend(el.keys())
+            todo.extend(el.values())
+        elif isinstance(el, list | tuple | set | frozenset):
+            todo.extend(el)
+        else:
+            if hasattr(el, "__dict__"):
+                todo.append(el.__dict__)
+            slots = (slot for cls in type(el).__mro__ for slot in getattr(cls, "__slots__", ()))
+            todo.extend(getattr(el, slot) for slot in slots if slot != "__dict__" and hasattr(el, slot))
+    return size
+
+
+def main(
+    files: Annotated[int, typer.Option(help="number of files of the synthetic stack")] = 1_000_000,
+    sample: Annotated[int, typer.Option(help="number of files of the sample of full sfinfos")] = 20_000,
+    budget: Annotated[int, typer.Option(help="budget of the stack in bytes per file")] = 1500,
+) -> None:
+    start = time.perf_counter()
+    stack = Stack()
+    stack.extend(synthetic(files))
+    secho(f"built a stack of {len(stack)} files in {time.perf_counter() - start:.1f} s")
+    per_file = deep_size(stack) / files
+    secho(
+        f"{'stack':<24} {per_file:8.0f} bytes per file  (budget {budget})",
+        fg=colors.GREEN if per_file <= budget else colors.RED,
+    )
+    # for comparison, the sfinfos without the stack
+    secho(f"{'sfinfos':<24} {deep_size(list(synthetic(sample))) / sample:8.0f} bytes per file")
+
+    if per_file > budget:
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,215 @@
+"""
+Time and memory of every stage of a run on a synthetic tree (see corpus.py): identify, hash, probe,
+apply policies, convert, move, log write and log read. The results are written to a json file
+(by default benchmarks/results/<commit>.json), which can be compared with the results of another commit.
+
+    uv run python benchmarks/pipeline.py --tiny 20000
+    uv run python benchmarks/pipeline.py --compare benchmarks/results/<other commit>.json
+"""
+
+import io
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from contextlib import redirect_stdout, suppress
+from datetime import UTC, datetime
+from functools import partial
+from pathlib import Path
+from typing import Annotated, Any
+
+import typer
+from typer import colors, secho
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, f"{ROOT}")
+
+from corpus import generate  # noqa: E402
+
+from fileidentification.definitions.settings import HashAlgo, LogFormat  # noqa: E402
+from fileidentification.filehandling import FileHandler  # noqa: E402
+from fileidentification.tasks.hashing import hash_file  # noqa: E402
+from fileidentification.tasks.logfile import LogReader  # noqa: E402
+from fileidentification.tasks.os_tasks import move_tmp, set_filepaths  # noqa: E402
+from fileidentification.tasks.workers import ordered_map  # noqa: E402
+from fileidentification.wrappers.converter import SOFFICE  # noqa: E402
+
+RESULTS = ROOT / "benchmarks" / "results"
+# the programs of the conversions, the convert stage is skipped without them
+PROGRAMS = ["ffmpeg", "magick", SOFFICE]
+
+
+def _commit() -> str:
+    cmd = ["git", "-C", f"{ROOT}", "rev-parse", "--short", "HEAD"]
+    res = subprocess.run(cmd, capture_output=True, text=True, check=False)
+    return res.stdout.strip() or "unknown"
+
+
+def _rss_mb() -> float:
+    """Return the current resident memory of the process in MB, 0 if unknown"""
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except OSError:
+        return 0.0
+    return pages * resource.getpagesize() / 1e6
+
+
+class Stages:
+    """Runs the stages one by one, and records the time, the files and bytes handled and the memory of each"""
+
+    def __init__(self) -> None:
+        self.results: dict[str, dict[str, Any]] = {}
+
+    def run(self, name: str, fn: Callable[[], Any], files: int, size: int) -> None:
+        start = time.perf_counter()
+        # the tables and messages of the stages are not of interest here
+        with redirect_stdout(io.StringIO()), suppress(SystemExit):
+            fn()
+        seconds = time.perf_counter() - start
+        self.results[name] = {
+            "seconds": round(seconds, 4),
+            "files": files,
+            "bytes": size,
+            "files_per_s": round(files / seconds, 2) if seconds else None,
+            "mb_per_s": round(size / seconds / 1e6, 2) if seconds else None,
+            "rss_mb": round(_rss_mb(), 1),
+            # ru_maxrss is in KiB on linux
+            "maxrss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+        secho(f"{name:<12} {seconds:9.3f} s  {files:>8} files  {self.results[name]['maxrss_mb']:8.1f} MB maxrss")
+
+
+def pipeline(root: Path, jobs: int, catalog: bool, log_format: LogFormat, convert: bool) -> dict[str, Any]:
+    """Run the stages on the tree in root, returns their results"""
+    # before the tmp dir is created in root
+    tree = _tree(root)
+    fh = FileHandler()
+    set_filepaths(fh.fp, root, None, log_format)
+    fh.mode.QUIET = True
+    fh.mode.JOBS = jobs
+    fh.mode.CATALOG = catalog
+    fh.mode.LOGFORMAT = log_format
+    # the hashing is measured as a stage of its own
+    fh.mode.FIXITY = False
+    fh.mode.PROGRESS_INTERVAL = 0
+    fh._open_stack(root)  # noqa: SLF001
+    stages = Stages()
+
+    def totals(view: str) -> tuple[int, int]:
+        totals = fh.stack.totals(view).values()
+        return sum(files for files, _ in totals), sum(size for _, size in totals)
+
+    def hash_all() -> None:
+        active = list(fh.stack.active())
+        digests = ordered_map(partial(hash_file, algo=HashAlgo.MD5), [sfinfo.path for sfinfo in active], jobs)
+        for sfinfo, md5 in zip(active, digests, strict=True):
+            sfinfo.md5 = md5
+            fh.stack.update(sfinfo)
+
+    def policies() -> None:
+        for sfinfo in fh.stack.active():
+            fh.ba.append(sfinfo)
+        fh.ba.duplicates = fh.stack.duplicates()
+        fh._manage_policies()  # noqa: SLF001
+
+    def read_log() -> None:
+        for _ in LogReader(fh.fp.LOGJSON):
+            pass
+
+    stages.run("identify", partial(fh._scan, root), *tree)  # noqa: SLF001
+    stages.run("hash", hash_all, *totals("active"))
+    with redirect_stdout(io.StringIO()):
+        policies()
+    stages.run("probe", fh.assert_integrity, *totals("active"))
+    stages.run("policies", fh.apply_policies, *totals("active"))
+    if convert:
+        stages.run("convert", fh.convert, *totals("pending"))
+    moving = totals("converted")
+    stages.run("move", partial(move_tmp, fh.stack, fh.policies, fh.log_tables, remove_original=False), *moving)
+    files = len(fh.stack)
+    # write_logs exits the run
+    stages.run("log_write", fh.write_logs, files, 0)
+    stages.results["log_write"]["bytes"] = fh.fp.LOGJSON.stat().st_size
+    stages.run("log_read", read_log, files, fh.fp.LOGJSON.stat().st_size)
+    return stages.results
+
+
+def _tree(root: Path) -> tuple[int, int]:
+    files = [path for path in root.rglob("*") if path.is_file()]
+    return len(files), sum(path.stat().st_size for path in files)
+
+
+def _compare(results: dict[str, Any], base: dict[str, Any]) -> None:
+    """Print the change of the time and memory per stage against the results base"""
+    secho(f"\ncompared with {base['commit']} ({base['created']})")
+    for name, stage in results["stages"].items():
+        if name not in base["stages"]:
+            continue
+        before = base["stages"][name]
+        change = (stage["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0.0
+        secho(
+            f"{name:<12} {before['seconds']:9.3f} s -> {stage['seconds']:9.3f} s {change:+7.1f} %  "
+            f"maxrss {before['maxrss_mb']:8.1f} -> {stage['maxrss_mb']:8.1f} MB",
+            fg=colors.RED if change > 10 else colors.GREEN if change < -10 else None,
+        )
+
+
+def main(
+    tiny: Annotated[int, typer.Option(help="number of tiny files")] = 5000,
+    variants: Annotated[int, typer.Option(help="number of copies of the samples with a unique trailer")] = 200,
+    duplicates: Annotated[int, typer.Option(help="number of exact copies of the samples")] = 50,
+    depth: Annotated[int, typer.Option(help="number of nested folders")] = 32,
+    large: Annotated[int, typer.Option(help="number of large media files")] = 2,
+    large_mb: Annotated[int, typer.Option(help="size of a large media file in MB")] = 64,
+    seed: Annotated[int, typer.Option(help="seed of the random content")] = 0,
+    jobs: Annotated[int, typer.Option(help="number of parallel workers")] = 1,
+    catalog: Annotated[bool, typer.Option(help="keep the sfinfos in the sqlite catalog")] = False,
+    log_format: Annotated[LogFormat, typer.Option(help="format of the log")] = LogFormat.JSON,
+    convert: Annotated[bool, typer.Option(help="run the conversions (needs ffmpeg, magick and soffice)")] = True,
+    workdir: Annotated[Path | None, typer.Option(help="dir to generate the tree in, a tmp dir if not set")] = None,
+    output: Annotated[Path | None, typer.Option(help="json file of the results")] = None,
+    compare: Annotated[Path | None, typer.Option(help="json file of results to compare with")] = None,
+) -> None:
+    if convert and (missing := [name for name in PROGRAMS if not shutil.which(name)]):
+        secho(f"{missing} not found, skipping the conversions", fg=colors.YELLOW)
+        convert = False
+    tmp = None if workdir else Path(tempfile.mkdtemp(prefix="fid-bench-"))
+    root = (workdir or tmp or Path()) / "corpus"
+    try:
+        start = time.perf_counter()
+        corpus = generate(root, tiny, variants, duplicates, depth, large, large_mb, seed)
+        secho(
+            f"generated {corpus['files']} files, {corpus['bytes'] / 1e6:.1f} MB in {time.perf_counter() - start:.1f} s"
+        )
+        stages = pipeline(root, jobs, catalog, log_format, convert)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    commit = _commit()
+    results = {
+        "commit": commit,
+        "created": f"{datetime.now(UTC)}",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"jobs": jobs, "catalog": catalog, "log_format": log_format, "convert": convert},
+        "corpus": corpus,
+        "stages": stages,
+        "seconds": round(sum(stage["seconds"] for stage in stages.values()), 4),
+    }
+    output = output or RESULTS / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=4))
+    secho(f"{'total':<12} {results['seconds']:9.3f} s, written to {output}")
+
+    if compare:
+        _compare(results, json.loads(compare.read_text()))
+
+
+if __name__ == "__main__":
+    typer.run(main)
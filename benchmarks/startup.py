@@ -0,0 +1,99 @@
+"""
+Startup time of the cli, which is launched once per run (e.g. by fidr.sh).
+Exits with 1 if the median of a measurement exceeds its budget, if identify.py --help imports a module
+of the stages (measured with python -X importtime) or if the precompiled format index is outdated.
+
+    uv run python benchmarks/startup.py
+"""
+
+import marshal
+import statistics
+import subprocess
+import sys
+import time
+import zlib
+from collections.abc import Callable
+from pathlib import Path
+from typing import Annotated, Any
+
+import typer
+from typer import colors, secho
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, f"{ROOT}")
+
+from fileidentification.definitions.formats import FormatIndex  # noqa: E402
+from fileidentification.definitions.settings import FMTINDEX, FMTJSN  # noqa: E402
+
+# modules that are loaded by the stages of a run
+DEFERRED = ["fileidentification.filehandling", "pydantic", "rich.progress", "pygfried", "sqlite3", "multiprocessing"]
+
+
+def _median(fn: Callable[[], Any], runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _importtime(cmd: list[str]) -> dict[str, int]:
+    """Run cmd with python -X importtime, returns the cumulative import time in us per module"""
+    res = subprocess.run([sys.executable, "-X", "importtime", *cmd], check=True, capture_output=True, text=True)
+    modules: dict[str, int] = {}
+    for line in res.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and "[us]" not in line:
+            _, cumulative, name = line.removeprefix("import time:").split("|")
+            modules[name.rstrip()] = int(cumulative)
+    return modules
+
+
+def _check(name: str, seconds: float, budget: float) -> bool:
+    ok = seconds <= budget
+    secho(
+        f"{name:<32} {seconds * 1000:8.1f} ms  (budget {budget * 1000:.0f} ms)", fg=colors.GREEN if ok else colors.RED
+    )
+    return ok
+
+
+def main(
+    runs: Annotated[int, typer.Option(help="number of runs per measurement")] = 10,
+    cli_budget: Annotated[float, typer.Option(help="budget of identify.py --help in seconds")] = 1.5,
+    import_budget: Annotated[float, typer.Option(help="budget of the imports of --help in seconds")] = 1.0,
+    index_budget: Annotated[float, typer.Option(help="budget of the first format lookup in seconds")] = 0.005,
+) -> None:
+    crc, _ = marshal.loads(FMTINDEX.read_bytes())  # noqa: S302
+    if crc != zlib.crc32(FMTJSN.read_bytes()):
+        secho(f"{FMTINDEX.name} is outdated, run: uv run python update.py --index-only", fg=colors.RED)
+        raise typer.Exit(1)
+
+    # the stages must not be loaded for the help
+    imported = _importtime([f"{ROOT / 'identify.py'}", "--help"])
+    if loaded := [module for module in DEFERRED if any(name.strip() == module for name in imported)]:
+        secho(f"identify.py --help imports {loaded}", fg=colors.RED)
+        raise typer.Exit(1)
+    # the top level imports (not indented) add up to the total import time
+    imports = sum(us for name, us in imported.items() if not name.startswith("  ")) / 1e6
+
+    cmd = [sys.executable, f"{ROOT / 'identify.py'}", "--help"]
+    results = [
+        _check("imports of identify.py --help", imports, import_budget),
+        _check(
+            "identify.py --help",
+            _median(lambda: subprocess.run(cmd, check=True, capture_output=True), runs),
+            cli_budget,
+        ),
+        _check("first format lookup", _median(lambda: FormatIndex(FMTJSN, FMTINDEX)["fmt/43"], runs), index_budget),
+    ]
+    # for comparison, the lookup without the precompiled index
+    json_only = _median(lambda: FormatIndex(FMTJSN, Path())["fmt/43"], runs)
+    secho(f"{'first format lookup (json)':<32} {json_only * 1000:8.1f} ms")
+
+    if not all(results):
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
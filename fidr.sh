@@ -4,39 +4,49 @@
 add_volumes=()
 params=()
 while [ $# -gt 0 ]; do
-    # options
-    if [[ $1 == "-p" ]] || [[ $1 == "-ep" ]] || [[ $1 == "--policies-path" ]]; then
+    case $1 in
+    # options with a path to mount
+    -p | -ep | --policies-path)
         policies_path=$(realpath "$2")
         add_volumes+=("-v" "$policies_path:$policies_path")
         params+=("$1" "$policies_path")
         shift 2
-    fi
-    if [[ $1 == "--tmp-dir" ]]; then
+        ;;
+    --tmp-dir | --cache-dir)
         mkdir -p "$2"
-        tmp_dir=$(realpath "$2")
-        add_volumes+=("-v" "$tmp_dir:$tmp_dir")
-        params+=("$1" "$tmp_dir")
+        dir=$(realpath "$2")
+        add_volumes+=("-v" "$dir:$dir")
+        params+=("$1" "$dir")
         shift 2
-    fi
-    if [[ $1 == "-"* ]] || [[ $1 == "--"* ]]; then
-      params+=("$1")
-      shift
-    fi
+        ;;
+    # options that take a value
+    -tf | --test-filetype | -j | --jobs | --include | --exclude | --symlinks | --hash | --log-format | --slots | \
+    --cpus | --cache-size | --progress-interval | --decode | --decode-segments | --decode-seconds | \
+    --decode-time-budget | --decode-size-budget | --timeout | --memory-budget | --cpu-time-limit | --concurrency | \
+    --checkpoint-files | --checkpoint-interval)
+        params+=("$1" "$2")
+        shift 2
+        ;;
+    -*)
+        params+=("$1")
+        shift
+        ;;
     # input folder (argument)
-    if [ ! -z "$1" -a "$1" != " " ] && [[ $1 != "-"* ]]; then
-      # assert input folder
-      if [[ !  $(realpath "$1") ]]; then
-        exit 1
-      fi
-      input_dir=$(realpath "$1")
-      mnt_dir="$input_dir"
-      # if its a file
-      if [[ -f $1 ]]; then
-        mnt_dir="${mnt_dir%/*}"
-      fi
-      add_volumes+=("-v" "$mnt_dir:$mnt_dir")
-      shift
-    fi
+    *)
+        # assert input folder
+        if [[ ! $(realpath "$1") ]]; then
+          exit 1
+        fi
+        input_dir=$(realpath "$1")
+        mnt_dir="$input_dir"
+        # if its a file
+        if [[ -f $1 ]]; then
+          mnt_dir="${mnt_dir%/*}"
+        fi
+        add_volumes+=("-v" "$mnt_dir:$mnt_dir")
+        shift
+        ;;
+    esac
 done
 
 # run the command
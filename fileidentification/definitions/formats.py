@@ -0,0 +1,70 @@
+import json
+import marshal
+import zlib
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+from typing import Any, NamedTuple
+
+# marshal format of the index, readable by all supported python versions
+MARSHALVERSION = 4
+
+
+class PronomFormat(NamedTuple):
+    name: str
+    file_extensions: tuple[str, ...]
+
+
+def _formats(fmtjson: bytes) -> dict[str, tuple[str, tuple[str, ...]]]:
+    return {puid: (info.get("name", ""), tuple(info["file_extensions"])) for puid, info in json.loads(fmtjson).items()}
+
+
+def compile_index(fmtjson: Path, index: Path) -> None:
+    """Write the precompiled index of fmtjson, along with the checksum of fmtjson to detect an outdated index"""
+    data = fmtjson.read_bytes()
+    index.write_bytes(marshal.dumps((zlib.crc32(data), _formats(data)), MARSHALVERSION))
+
+
+class FormatIndex(Mapping[str, PronomFormat]):
+    """
+    The names and file extensions of the PRONOM formats by puid. they are loaded on first access from the
+    precompiled index (see update.py), or parsed from fmtjson if there is no index or it does not match fmtjson.
+    """
+
+    def __init__(self, fmtjson: Path, index: Path) -> None:
+        self.fmtjson = fmtjson
+        self.index = index
+        self._formats: dict[str, tuple[str, tuple[str, ...]]] | None = None
+        self._puids: dict[str, tuple[str, ...]] | None = None
+
+    def _load(self) -> dict[str, tuple[str, tuple[str, ...]]]:
+        if self._formats is None:
+            data = self.fmtjson.read_bytes()
+            try:
+                # the index is shipped with the package next to the json
+                crc, formats = marshal.loads(self.index.read_bytes())  # noqa: S302
+                self._formats = formats if crc == zlib.crc32(data) else _formats(data)
+            except (OSError, ValueError, EOFError, TypeError):
+                self._formats = _formats(data)
+        return self._formats
+
+    def __getitem__(self, puid: str) -> PronomFormat:
+        return PronomFormat(*self._load()[puid])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __contains__(self, puid: Any) -> bool:
+        return puid in self._load()
+
+    def puids(self, ext: str) -> tuple[str, ...]:
+        """Return the puids of the formats with the file extension ext (without dot, case insensitive)"""
+        if self._puids is None:
+            puids: dict[str, list[str]] = {}
+            for puid, (_, exts) in self._load().items():
+                for el in exts:
+                    puids.setdefault(el.lower(), []).append(puid)
+            self._puids = {k: tuple(v) for k, v in puids.items()}
+        return self._puids.get(ext.lower().lstrip("."), ())
@@ -1,4 +1,3 @@
-import hashlib
 import re
 from datetime import UTC, datetime
 from pathlib import Path
@@ -6,13 +5,24 @@ from typing import Any, Self
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
-from fileidentification.definitions.settings import Bin, FDMsg, PLMsg, PVErr
+from fileidentification.definitions.settings import (
+    Bin,
+    DecodeDepth,
+    FDMsg,
+    HashAlgo,
+    LogFormat,
+    PLMsg,
+    PVErr,
+    Symlinks,
+)
 
 
 class LogMsg(BaseModel):
     name: str
     msg: str
     timestamp: datetime | None = None
+    # the error codes in the msg of a program and how often they occurred
+    codes: dict[str, int] | None = None
 
     def model_post_init(self, context: Any, /) -> None:
         if not self.timestamp:
@@ -37,6 +47,8 @@ class SfInfo(BaseModel):
     modified: str
     errors: str
     md5: str = Field(default_factory=str)
+    # the algorithm of the checksum in md5, if it is not md5
+    hash_algo: HashAlgo | None = None
     matches: list[dict[str, Any]] = Field(default_factory=list)
     # added during processing
     status: Status = Field(default_factory=Status)
@@ -51,14 +63,14 @@ class SfInfo(BaseModel):
     path: Path = Field(default_factory=Path, exclude=True)
     root_folder: Path = Field(default_factory=Path, exclude=True)
     tdir: Path = Field(default_factory=Path, exclude=True)
+    # row of the sfinfo, if the stack is kept in a catalog
+    rowid: int | None = Field(default=None, exclude=True)
 
     def model_post_init(self, context: Any, /) -> None:
         if not self.status:
             self.status = Status()
         if not self.processed_as:
             self.processed_as = self._fetch_puid()
-        if not self.md5:
-            self.md5 = get_md5(self.filename)
 
     def _fetch_puid(self) -> str | None:
         if self.matches:
@@ -102,6 +114,11 @@ class LogTables(BaseModel):
             self.diagnostics[fdgm.name] = []
         self.diagnostics[fdgm.name].append(sfinfo)
 
+    def merge(self, other: "LogTables") -> None:
+        for name, sfinfos in other.diagnostics.items():
+            self.diagnostics.setdefault(name, []).extend(sfinfos)
+        self.processing_errors.extend(other.processing_errors)
+
     def dump_errors(self) -> list[SfInfo] | None:
         if self.processing_errors:
             for el in self.processing_errors:
@@ -110,29 +127,34 @@ class LogTables(BaseModel):
         return None
 
 
+class PuidStats(BaseModel):
+    """number and combined size of the files of a puid, and its smallest file"""
+
+    count: int = 0
+    size: int = 0
+    smallest: SfInfo | None = None
+
+
 class BasicAnalytics(BaseModel):
-    filehashes: dict[str, list[Path]] = Field(default_factory=dict)
-    puid_unique: dict[str, list[SfInfo]] = Field(default_factory=dict)
+    puid_unique: dict[str, PuidStats] = Field(default_factory=dict)
     siegfried_errors: list[SfInfo] = Field(default_factory=list)
+    duplicates: dict[str, list[Path]] = Field(default_factory=dict)
     blank: list[str] | None = None
 
     def append(self, sfinfo: SfInfo) -> None:
         if sfinfo.processed_as:
-            if sfinfo.md5 not in self.filehashes:
-                self.filehashes[sfinfo.md5] = []
-            self.filehashes[sfinfo.md5].append(sfinfo.filename)
             if sfinfo.processed_as not in self.puid_unique:
-                self.puid_unique[sfinfo.processed_as] = []
-            self.puid_unique[sfinfo.processed_as].append(sfinfo)
+                self.puid_unique[sfinfo.processed_as] = PuidStats()
+            stats = self.puid_unique[sfinfo.processed_as]
+            stats.count += 1
+            stats.size += sfinfo.filesize
+            if not stats.smallest or sfinfo.filesize < stats.smallest.filesize:
+                stats.smallest = sfinfo
         if sfinfo.errors and sfinfo.errors != FDMsg.EMPTYSOURCE:
             self.siegfried_errors.append(sfinfo)
 
     def smallest_file(self, puid: str) -> SfInfo:
-        return sorted(self.puid_unique[puid], key=lambda x: x.filesize, reverse=False)[0]
-
-    @property
-    def duplicates(self) -> dict[str, list[Path]]:
-        return {k: v for k, v in self.filehashes.items() if len(v) != 1}
+        return self.puid_unique[puid].smallest  # type: ignore[return-value]
 
 
 # models for policies
@@ -180,6 +202,49 @@ class PoliciesFile(BaseModel):
     policies: Policies = Field(default_factory=Policies)
 
 
+class DecodeParams(BaseModel):
+    """
+    how much of a video or audio file ffmpeg decodes in verbose mode.
+    depth: DecodeDepth, the whole file, its keyframes, evenly spaced segments or its first and last seconds
+    segments: int, the number of segments
+    seconds: float, the length of a segment, respectively of the start and of the end
+    time_budget: float | None, seconds after which the decode of a file is stopped
+    size_budget: int | None, bytes of a file that are decoded at most (estimated by its duration)
+    """
+
+    depth: DecodeDepth = DecodeDepth.FULL
+    segments: int = 5
+    seconds: float = 30
+    time_budget: float | None = None
+    size_budget: int | None = None
+
+
+class ToolLimits(BaseModel):
+    """
+    the limits of the external programs (ffmpeg, imagemagick, soffice).
+    timeouts: dict[str, float], seconds per bin after which a program is killed along with its child processes
+    memory: int | None, bytes of memory (address space) of a program
+    cpu_time: int | None, seconds of cpu time of a program
+    concurrency: int, number of programs that run at once, e.g. probes that wait for slow storage
+    """
+
+    timeouts: dict[str, float] = Field(default_factory=dict)
+    memory: int | None = None
+    cpu_time: int | None = None
+    concurrency: int = 64
+
+
+class CheckpointParams(BaseModel):
+    """
+    how often the journal of a run is written to disk (see journal.Journal), whichever comes first.
+    files: int, changes of files after which the journal is written
+    seconds: float, seconds after which the journal is written
+    """
+
+    files: int = 1000
+    seconds: float = 10
+
+
 # Settings for the Filehandler Class
 class Mode(BaseModel):
     """
@@ -188,26 +253,63 @@ class Mode(BaseModel):
     VERBOSE: bool, do verbose analysis of video and image files
     STRICT: bool, move files that are not listed in policies to FAILED instead of skipping them
     QUIET: bool, just print warnings and errors
+    JOBS: int, number of parallel workers
+    INCLUDE: list[str], glob patterns of the files to analyse, all files if empty
+    EXCLUDE: list[str], glob patterns of the files and folders to skip
+    SYMLINKS: Symlinks, whether to skip symbolic links, add linked files or also follow linked folders
+    HASH_ALGO: HashAlgo, the algorithm of the checksum of the files
+    MMAP: bool, memory map the files for hashing
+    FIXITY: bool, hash all files, otherwise only the files that can be duplicates of each other
+    INCREMENTAL: bool, rescan the root folder for new, changed and vanished files if there is a log
+    LOGFORMAT: LogFormat, write the log as json or as json lines
+    CATALOG: bool, keep the sfinfos in a sqlite catalog in the tmp dir instead of in memory
+    SLOTS: dict[str, int], number of conversions that run at once per bin, one by one if empty
+    CPUS: int | None, the cpu budget of the conversions, all cpus if None
+    CACHE_DIR: Path | None, the dir of the cache of the conversions, no cache if None
+    CACHE_SIZE: int, the size in bytes beyond which the least recently used conversions are evicted from the cache
+    PROGRESS_INTERVAL: float, seconds between the progress lines if the output is not a terminal, none if 0 (default)
+    DECODE: DecodeParams, how much of a video or audio file is decoded in verbose mode
+    LIMITS: ToolLimits, the timeouts and resource limits of the external programs
+    STREAM: bool, identify, probe and convert the files at once instead of stage by stage
+    RESUME: bool, continue an interrupted run from its journal
+    JOURNAL: bool, journal the changes of the files, so that the run can be resumed if it is interrupted
+    CHECKPOINT: CheckpointParams, how often the journal of the run is written to disk
     """
 
     REMOVEORIGINAL: bool = False
     VERBOSE: bool = False
     STRICT: bool = False
     QUIET: bool = False
+    JOBS: int = 1
+    INCLUDE: list[str] = Field(default_factory=list)
+    EXCLUDE: list[str] = Field(default_factory=list)
+    SYMLINKS: Symlinks = Symlinks.FILES
+    HASH_ALGO: HashAlgo = HashAlgo.MD5
+    MMAP: bool = False
+    FIXITY: bool = True
+    INCREMENTAL: bool = False
+    LOGFORMAT: LogFormat = LogFormat.JSON
+    CATALOG: bool = False
+    SLOTS: dict[str, int] = Field(default_factory=dict)
+    CPUS: int | None = None
+    CACHE_DIR: Path | None = None
+    CACHE_SIZE: int = 10 * 1024**3
+    PROGRESS_INTERVAL: float = 0
+    DECODE: DecodeParams = Field(default_factory=DecodeParams)
+    LIMITS: ToolLimits = Field(default_factory=ToolLimits)
+    STREAM: bool = False
+    RESUME: bool = False
+    JOURNAL: bool = False
+    CHECKPOINT: CheckpointParams = Field(default_factory=CheckpointParams)
 
 
 class FilePaths(BaseModel, validate_assignment=True):
     TMP_DIR: Path = Field(default_factory=Path)
     POLJSON: Path = Field(default_factory=Path)
     LOGJSON: Path = Field(default_factory=Path)
-
-
-def get_md5(path: str | Path) -> str:
-    md5 = hashlib.md5()  # noqa: S324
-    with open(path, "rb") as s:  # noqa: PTH123
-        for chunk in iter(lambda: s.read(4096), b""):
-            md5.update(chunk)
-    return md5.hexdigest()
+    INDEXJSON: Path = Field(default_factory=Path)
+    CATALOG: Path = Field(default_factory=Path)
+    JOURNAL: Path = Field(default_factory=Path)
 
 
 def sfinfo2csv(sfinfo: SfInfo) -> dict[str, str | int]:
@@ -1,7 +1,7 @@
-import json
 from enum import StrEnum
 from pathlib import Path
-from typing import Any
+
+from fileidentification.definitions.formats import FormatIndex
 
 # default policies
 DEFAULTPOLICIES: Path = Path(__file__).parent / "default_policies.json"
@@ -10,6 +10,9 @@ DEFAULTPOLICIES: Path = Path(__file__).parent / "default_policies.json"
 TMP_DIR = "__fileidentification"  # added to root folder
 LOGJSON = "_log.json"
 POLJSON = "_policies.json"
+INDEXJSON = "_index.json"
+CATALOG = "_catalog.sqlite"
+JOURNAL = "_journal.jsonl"
 RMV_DIR = "_REMOVED"
 
 
@@ -21,9 +24,10 @@ class DroidSigURL(StrEnum):
     CDN = "https://cdn.nationalarchives.gov.uk/documents/DROID_SignatureFile_"
 
 
-# dict that resolves the puid to possible ext and file format name
+# resolves the puid to possible ext and file format name, the index is precompiled from the json by update.py
 FMTJSN: Path = Path(__file__).parent / "fmt2ext.json"
-FMT2EXT: dict[str, Any] = json.loads(FMTJSN.read_text())
+FMTINDEX: Path = Path(__file__).parent / "fmt2ext.marshal"
+FMT2EXT = FormatIndex(FMTJSN, FMTINDEX)
 
 
 class Bin(StrEnum):
@@ -34,6 +38,38 @@ class Bin(StrEnum):
     EMPTY = ""
 
 
+class HashAlgo(StrEnum):
+    """hash algorithms (of hashlib) available to compute the checksum of the files"""
+
+    MD5 = "md5"
+    SHA256 = "sha256"
+    BLAKE2B = "blake2b"
+
+
+class LogFormat(StrEnum):
+    """format of the log, json (one document) or json lines (one sfinfo per line)"""
+
+    JSON = "json"
+    JSONL = "jsonl"
+
+
+class Symlinks(StrEnum):
+    """how symbolic links are treated when walking the root folder"""
+
+    SKIP = "skip"
+    FILES = "files"
+    FOLLOW = "follow"
+
+
+class DecodeDepth(StrEnum):
+    """how much of a video or audio file ffmpeg decodes in verbose mode"""
+
+    FULL = "full"
+    KEYFRAMES = "keyframes"
+    SEGMENTS = "segments"
+    ENDS = "ends"
+
+
 class LOPath(StrEnum):
     """path where LibreOffice exec is according to os"""
 
@@ -87,6 +123,7 @@ class FDMsg(StrEnum):
     ERROR = "file is corrupt"
     WARNING = "file has warnings"
     EXTMISMATCH = "extension mismatch"
+    TIMEOUT = "probe timed out"
 
 
 class FPMsg(StrEnum):
@@ -95,6 +132,11 @@ class FPMsg(StrEnum):
     PUIDFAIL = "failed to get fmt type"
     CONVFAILED = "conversion failed"
     NOTEXPECTEDFMT = "converted file does not match the expected fmt."
+    CHANGED = "file changed since the last scan"
+    VANISHED = "file not found in the root folder anymore"
+    REUSED = "reused the conversion of a file with the same content from the cache"
+    PARTIALDECODE = "the file was not decoded completely in verbose mode"
+    TIMEOUT = "conversion timed out"
 
 
 class REencMsg(StrEnum):
@@ -1,16 +1,20 @@
 import csv
 import json
 import os
+import shutil
 import sys
+from collections.abc import Iterable, Iterator
+from contextlib import nullcontext
 from datetime import UTC, datetime
+from itertools import chain
 from pathlib import Path
 
-import pygfried
-from rich.progress import Progress, SpinnerColumn, TextColumn
 from typer import colors, secho
 
 from fileidentification.definitions.models import (
     BasicAnalytics,
+    CheckpointParams,
+    DecodeParams,
     FilePaths,
     LogMsg,
     LogOutput,
@@ -20,9 +24,21 @@ from fileidentification.definitions.models import (
     PoliciesFile,
     PolicyParams,
     SfInfo,
+    ToolLimits,
     sfinfo2csv,
 )
-from fileidentification.definitions.settings import CSVFIELDS, DEFAULTPOLICIES, FMT2EXT
+from fileidentification.definitions.settings import (
+    CSVFIELDS,
+    DEFAULTPOLICIES,
+    FMT2EXT,
+    RMV_DIR,
+    DecodeDepth,
+    FDMsg,
+    FPMsg,
+    HashAlgo,
+    LogFormat,
+    Symlinks,
+)
 from fileidentification.tasks.console_output import (
     print_diagnostic,
     print_duplicates,
@@ -31,61 +47,357 @@ from fileidentification.tasks.console_output import (
     print_processing_errors,
     print_siegfried_errors,
 )
-from fileidentification.tasks.conversion import convert_file
-from fileidentification.tasks.inspection import assert_file_integrity, inspect_file
+from fileidentification.tasks.index import is_unchanged, load_index, write_index
+from fileidentification.tasks.journal import Journal, base, read_base, read_journal, replay
+from fileidentification.tasks.logfile import LogReader, LogWriter, find_log
 from fileidentification.tasks.os_tasks import move_tmp, set_filepaths
-from fileidentification.tasks.policies import apply_policy
+from fileidentification.tasks.progress import StageProgress
+from fileidentification.tasks.stack import Stack
 
 
 class FileHandler:
-    """Main class. It can create, verify and apply policies, test the files on errors, convert and move them."""
+    """
+    Main class. It can create, verify and apply policies, test the files on errors, convert and move them.
+    The modules of the stages are imported when the stage runs, so that a run only loads what it needs.
+    """
 
     def __init__(self) -> None:
         self.mode: Mode = Mode()
         self.policies: dict[str, PolicyParams] = {}
         self.log_tables = LogTables()
         self.ba = BasicAnalytics()
-        self.stack: list[SfInfo] = []
+        self.stack: Stack = Stack()
         self.fp: FilePaths = FilePaths()
+        self.journal: Journal | None = None
+
+    def _walk(self, root_folder: Path) -> Iterable[Path]:
+        """Return the files in root_folder to analyse"""
+        from fileidentification.tasks.walker import walk_files
+
+        if root_folder.is_file():
+            return [root_folder]
+        return walk_files(
+            root_folder,
+            skip=[self.fp.TMP_DIR],
+            include=self.mode.INCLUDE,
+            exclude=self.mode.EXCLUDE,
+            symlinks=self.mode.SYMLINKS,
+        )
+
+    def _identify(self, files: Iterable[Path], root_folder: Path) -> Iterator[SfInfo]:
+        """Analyse the files with pygfried, yields their sfinfos with the processing paths set"""
+        from fileidentification.tasks.identification import identify_files
+
+        identified = identify_files(
+            files, jobs=self.mode.JOBS, algo=self.mode.HASH_ALGO, use_mmap=self.mode.MMAP, fixity=self.mode.FIXITY
+        )
+        for sfinfo in identified:
+            sfinfo.set_processing_paths(root_folder, self.fp.TMP_DIR, initial=True)
+            yield sfinfo
+
+    def _progress(self, stage: str, description: str, view: str | None = None, by_bin: bool = False) -> StageProgress:
+        """
+        Return the progress of a stage
+        :param view the view of the stack with the files of the stage (see Stack.totals), their total is unknown if None
+        :param by_bin if true, the progress is broken down by the bin of the policies of the files
+        the changes of the files are journaled under the name of the stage from here on
+        """
+        if self.journal:
+            self.journal.stage = stage
+        if not view:
+            return StageProgress(stage, description, interval=self.mode.PROGRESS_INTERVAL)
+        totals = self.stack.totals(view)
+        bins: dict[str, tuple[int, int]] = {}
+        if by_bin:
+            for puid, (files, size) in totals.items():
+                bin_files, bin_size = bins.get(self._bin(puid), (0, 0))
+                bins[self._bin(puid)] = (bin_files + files, bin_size + size)
+        total = (sum(files for files, _ in totals.values()), sum(size for _, size in totals.values()))
+        return StageProgress(stage, description, total, bins, self.mode.PROGRESS_INTERVAL)
+
+    def _bin(self, puid: str | None) -> str:
+        return self.policies.get(f"{puid}", PolicyParams()).bin or "other"
+
+    def _limit_tools(
+        self, timeouts: list[str] | None, memory_budget: float | None, cpu_time: int | None, concurrency: int
+    ) -> None:
+        """
+        Set the timeouts and resource limits of the external programs
+        :param memory_budget the memory in GB of the programs that run at once, shared by the workers
+        :param concurrency the number of programs that run at once
+        """
+        from fileidentification.wrappers.process import configure, tool_timeouts
+
+        workers = max(self.mode.JOBS, sum(self.mode.SLOTS.values()), 1)
+        self.mode.LIMITS = ToolLimits(
+            timeouts=tool_timeouts(timeouts),
+            memory=int(memory_budget * 1024**3 / workers) if memory_budget else None,
+            cpu_time=cpu_time,
+            concurrency=concurrency,
+        )
+        configure(self.mode.LIMITS)
+
+    def _can_stream(self) -> bool:
+        """Return True if the files can be streamed through the stages, which needs a run without a log"""
+        if self.stack or find_log(self.fp.LOGJSON) or (self.mode.RESUME and self.fp.JOURNAL.is_file()):
+            secho("there is a log or journal of a previous run, the stages run one after the other", fg=colors.YELLOW)
+            return False
+        if not self.mode.FIXITY:
+            # the duplicates are not known before all files are found
+            print_msg("the files are all hashed while streaming", self.mode.QUIET)
+            self.mode.FIXITY = True
+        return True
+
+    def _open_stack(self, root_folder: Path) -> None:
+        """Keep the sfinfos in a catalog in the tmp dir if in catalog mode, otherwise in memory"""
+        if self.mode.CATALOG:
+            from fileidentification.tasks.catalog import Catalog
+
+            self.stack = Catalog(self.fp.CATALOG, root_folder, self.fp.TMP_DIR)
+        else:
+            self.stack = Stack(root_folder, self.fp.TMP_DIR)
 
     def _load_sfinfos(self, root_folder: Path) -> None:
         """
         Add sfinfos to stack.
         Checks whether a log json at default location exists. if so, it adds the sfinfos to the stack from there,
-        otherwhise it scans the root_folder with pygfried and adds its output as sfinfos to the stack
+        otherwhise it scans the root_folder with pygfried and adds its output as sfinfos to the stack.
+        if the run is resumed, the stack of the interrupted run is rebuilt from its journal instead
         """
-        initial = True
-        # if there is a log, try to read from there
-        if self.fp.LOGJSON.is_file():
-            initial = False
-            self.stack.extend([SfInfo(**metadata) for metadata in json.loads(self.fp.LOGJSON.read_text())["files"]])
+        if not (self.mode.RESUME and self._resume(root_folder)):
+            self._load_stack(root_folder)
 
-        # else scan the root_folder with pygfried
-        if not self.stack:
-            with Progress(
-                SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True
-            ) as prog:
-                prog.add_task(description="Analysing files with pygfried ...", total=None)
-                self.stack.extend(
-                    [
-                        SfInfo(**pygfried.identify(f"{f}", detailed=True)["files"][0])  # type: ignore[arg-type]
-                        for f in root_folder.glob("**/*")
-                        if f.is_file()
-                    ]
-                )
-                if root_folder.is_file():
-                    self.stack.append(SfInfo(**pygfried.identify(f"{root_folder}", detailed=True)["files"][0]))  # type: ignore[arg-type]
+        if not self.mode.FIXITY:
+            self._hash_duplicates()
 
-        # append path values run basic analytics
-        for sfinfo in self.stack:
-            if not sfinfo.status.removed:
-                sfinfo.set_processing_paths(root_folder, self.fp.TMP_DIR, initial=initial)
-            if not (sfinfo.status.removed or sfinfo.dest):
-                self.ba.append(sfinfo)
+        # run basic analytics
+        for sfinfo in self.stack.active():
+            self.ba.append(sfinfo)
+        self.ba.duplicates = self.stack.duplicates()
 
         print_siegfried_errors(ba=self.ba)
         print_duplicates(duplicates=self.ba.duplicates, mode=self.mode)
 
+    def _load_stack(self, root_folder: Path) -> None:
+        rescan = self.mode.INCREMENTAL
+        logpath = None
+        # the catalog of a previous run is the log, if there is a log otherwise, try to read from there
+        if not self.stack and (logpath := find_log(self.fp.LOGJSON)):
+            rescan = not self._read_log(logpath, root_folder) or rescan
+        # the changes of the files are journaled from here on
+        self._start_journal(logpath)
+        if self.stack and rescan:
+            self._rescan(root_folder)
+
+        # else scan the root_folder with pygfried
+        if not self.stack:
+            self._scan(root_folder)
+
+    def _start_journal(self, logpath: Path | None = None) -> None:
+        """
+        Journal the changes of the files on top of what the stack was loaded from, the log at logpath if any.
+        if the run is not journaled (see Mode.JOURNAL), the journal of an interrupted run is discarded
+        """
+        if self.fp.JOURNAL.is_file():
+            secho(
+                f"{self.fp.JOURNAL} of an interrupted run is discarded, an interrupted run is continued with --resume",
+                fg=colors.YELLOW,
+            )
+            self.fp.JOURNAL.unlink()
+        if not self.mode.JOURNAL:
+            return
+        # what was loaded into the catalog is persisted before
+        self.stack.commit()
+        self.journal = Journal(self.fp.JOURNAL, self.stack, self.mode.CHECKPOINT, base(logpath, self.mode.CATALOG))
+        self.journal.follow(self.log_tables)
+        self.stack.journal = self.journal.record
+
+    def _resume(self, root_folder: Path) -> bool:
+        """
+        Rebuild the stack of an interrupted run: load what the run loaded its stack from and replay the changes in
+        its journal. then reconcile it with the files (see _reconcile) and rescan the root_folder for the files the
+        run did not get to or renamed. returns False if there is no run to resume
+        """
+        run_base = read_base(self.fp.JOURNAL)
+        if run_base is None:
+            secho(
+                f"there is no journal of an interrupted run in {self.fp.TMP_DIR}, starting a new run", fg=colors.YELLOW
+            )
+            return False
+        if run_base.get("catalog") and not self.mode.CATALOG:
+            secho("the interrupted run kept the sfinfos in the catalog, resume it with --catalog", fg=colors.RED)
+            sys.exit(1)
+        if logpath := run_base.get("log"):
+            if base(find_log(Path(logpath)), catalog=False) != run_base:
+                secho(f"{logpath} was written after the journal, the run was complete", fg=colors.YELLOW)
+                self.fp.JOURNAL.unlink()
+                return False
+            self._read_log(Path(logpath), root_folder)
+
+        # the journal is continued, the replayed changes are not journaled again
+        journal = Journal(self.fp.JOURNAL, self.stack, self.mode.CHECKPOINT)
+        # the rows of the interrupted run -> the rows of the rebuilt stack
+        rows: dict[int | None, int | None] = {}
+        with self._progress("replay", "Replaying the journal of the interrupted run ...") as progress:
+            for record in read_journal(self.fp.JOURNAL):
+                if record is None:
+                    rows = {}
+                    continue
+                if record.error:
+                    sfinfo = SfInfo(**record.fields)
+                    sfinfo.rowid = rows.get(record.row, record.row if record.row in self.stack else None)
+                    self.log_tables.processing_errors.append((record.error, sfinfo))
+                elif replayed := replay(self.stack, record, rows):
+                    journal.handle(record.stage, replayed)
+                    progress.advance(replayed.filesize)
+
+        self.journal, self.stack.journal = journal, journal.record
+        journal.follow(self.log_tables)
+        journal.stage = "resume"
+        self._reconcile()
+        self._rescan(root_folder)
+        print_msg(f"Resumed the interrupted run from {self.fp.JOURNAL}", self.mode.QUIET)
+        return True
+
+    def _reconcile(self) -> None:
+        """
+        Reconcile the stack that was rebuilt from the journal with the files, for the changes that the interrupted
+        run made on the files but did not journal anymore: the files it removed, the converted files it moved,
+        the origins of the converted files that are still pending and the orphaned conversions in the tmp dir
+        """
+        from fileidentification.wrappers.converter import working_dir
+
+        for sfinfo in self.stack.active():
+            if not sfinfo.path.is_file() and (sfinfo.tdir / RMV_DIR / sfinfo.filename).is_file():
+                sfinfo.status.removed = True
+                self.stack.update(sfinfo)
+
+        converted: set[Path] = set()
+        for sfinfo in self.stack.converted():
+            parent = self.stack.parent(sfinfo)
+            if sfinfo.filename.is_file():
+                converted.add(sfinfo.filename.parent)
+                if parent and parent.status.pending:
+                    parent.status.pending = False
+                    self.stack.update(parent)
+            elif moved := self._moved(sfinfo):
+                sfinfo.filename, sfinfo.dest = moved, None
+                sfinfo.status.added = True
+                self.stack.update(sfinfo)
+            else:
+                # the converted file is gone, its origin is converted again
+                self.stack.remove([sfinfo])
+                if parent and self.journal:
+                    parent.status.pending = True
+                    self.stack.update(parent)
+                    self.journal.handle("policies", parent)
+
+        # the conversions of the pending files that ended after the journal are done again, the working dirs of the
+        # failed conversions are kept
+        handled = self.journal.handled if self.journal else lambda *_: False
+        pending = [sfinfo for sfinfo in self.stack.pending() if not handled("convert", sfinfo)]
+        orphans = [wdir for sfinfo in pending if (wdir := working_dir(sfinfo)) not in converted]
+        orphans += list(self.fp.TMP_DIR.glob(".soffice_*"))
+        for wdir in orphans:
+            shutil.rmtree(wdir, ignore_errors=True)
+
+    def _moved(self, sfinfo: SfInfo) -> Path | None:
+        """Return the filename a converted file was moved to (see os_tasks.move_tmp), None if it was not moved"""
+        dest = sfinfo.root_folder / sfinfo.dest / sfinfo.filename.name  # type: ignore[operator]
+        for path in [dest.with_stem(f"{dest.stem}_{sfinfo.md5[:6]}"), dest]:
+            if path.is_file() and path.stat().st_size == sfinfo.filesize:
+                return sfinfo.dest / path.name  # type: ignore[operator]
+        return None
+
+    def _todo(self, stage: str, sfinfos: Iterator[SfInfo]) -> Iterator[SfInfo]:
+        """Return the sfinfos of a stage, without the ones the interrupted run handled if it is resumed"""
+        return self.journal.unhandled(stage, sfinfos) if self.journal else sfinfos
+
+    def _hash_duplicates(self) -> None:
+        """Hash the files that can be duplicates, if the files are not all hashed"""
+        from fileidentification.tasks.duplicates import hash_duplicates
+
+        with self._progress("duplicates", "Looking for duplicates ...") as progress:
+            hashed = hash_duplicates(self.stack.active, self.mode.HASH_ALGO, self.mode.JOBS, self.mode.MMAP)
+            for sfinfo in hashed:
+                self.stack.update(sfinfo)
+                progress.advance(sfinfo.filesize)
+
+    def _read_log(self, logpath: Path, root_folder: Path) -> bool:
+        """Add the sfinfos of the log to the stack, returns False if the log is incomplete (it is to be rescanned)"""
+        log = LogReader(logpath)
+        for sfinfo in log:
+            if not sfinfo.status.removed:
+                sfinfo.set_processing_paths(root_folder, self.fp.TMP_DIR, initial=False)
+            self.stack.append(sfinfo)
+        if not log.complete:
+            secho(f"{logpath} is incomplete, rescanning {root_folder}", fg=colors.YELLOW)
+        return log.complete
+
+    def _scan(self, root_folder: Path) -> None:
+        """Analyse the files in root_folder with pygfried, the json lines log is written while scanning"""
+        with (
+            self._progress("scan", "Analysing files with pygfried ...") as progress,
+            LogWriter(self.fp.LOGJSON) if self.mode.LOGFORMAT == LogFormat.JSONL else nullcontext() as log,
+        ):
+            for sfinfo in self._identify(self._walk(root_folder), root_folder):
+                self.stack.append(sfinfo)
+                if log:
+                    log.write(sfinfo)
+                progress.advance(sfinfo.filesize)
+
+    def _rescan(self, root_folder: Path) -> None:
+        """
+        Compare the files in root_folder with the stack loaded from the log and the file index.
+        New and changed files are analysed with pygfried, the files that vanished are flagged as removed.
+        """
+        index = load_index(self.fp.INDEXJSON)
+        base = root_folder.parent if root_folder.is_file() else root_folder
+        known = {sfinfo.filename: (sfinfo.filesize, sfinfo.modified, sfinfo.md5) for sfinfo in self.stack.active()}
+        # filename -> previous checksum
+        changed: dict[Path, str] = {}
+
+        def new_or_changed() -> Iterator[Path]:
+            for path in self._walk(root_folder):
+                filename = path.relative_to(base)
+                if filename in known:
+                    filesize, modified, md5 = known.pop(filename)
+                    try:
+                        if is_unchanged(filesize, modified, path.stat(), index.get(f"{filename}")):
+                            continue
+                    except OSError:
+                        continue
+                    changed[filename] = md5
+                yield path
+
+        rescanned: list[SfInfo] = []
+        with self._progress("rescan", "Analysing new and changed files with pygfried ...") as progress:
+            for sfinfo in self._identify(new_or_changed(), root_folder):
+                rescanned.append(sfinfo)
+                progress.advance(sfinfo.filesize)
+        self._apply_rescan(rescanned, changed, vanished=set(known))
+
+        print_msg(
+            f"Rescanned {root_folder}: {len(rescanned) - len(changed)} new, {len(changed)} changed, "
+            f"{len(known)} vanished files",
+            self.mode.QUIET,
+        )
+
+    def _apply_rescan(self, rescanned: list[SfInfo], changed: dict[Path, str], vanished: set[Path]) -> None:
+        """Replace the sfinfos of the changed files, add the new ones and flag the vanished files as removed"""
+        self.stack.remove([sfinfo for filename in changed if (sfinfo := self.stack.by_filename(filename))])
+        for sfinfo in rescanned:
+            if sfinfo.filename in changed:
+                msg = f"{FPMsg.CHANGED}, previous checksum {changed[sfinfo.filename]}"
+                sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
+            self.stack.append(sfinfo)
+        # flag the files that are not in the root_folder anymore
+        for filename in vanished:
+            if sfinfo := self.stack.by_filename(filename):
+                sfinfo.status.removed = True
+                sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=FPMsg.VANISHED))
+                self.stack.update(sfinfo)
+
     # policies stuff
     def _load_policies(self, policies_path: Path) -> Policies:
         """Load and validate an existing policies.json"""
@@ -117,7 +429,7 @@ class FileHandler:
             jsonfile.comment += " blank policies"
             for puid in self.ba.puid_unique:
                 jsonfile.policies.update(
-                    {puid: PolicyParams(format_name=FMT2EXT[puid]["name"], remove_original=self.mode.REMOVEORIGINAL)}
+                    {puid: PolicyParams(format_name=FMT2EXT[puid].name, remove_original=self.mode.REMOVEORIGINAL)}
                 )
             # write out policies with name of the folder, return policies
             jsonfile.name.write_text(jsonfile.model_dump_json(indent=4, exclude_none=True))
@@ -131,17 +443,13 @@ class FileHandler:
         jsonfile.comment += f" updating from {outpath}" if extend else ""
         self.ba.blank = []
         for puid in self.ba.puid_unique:
-            if puid in default_policies:
-                jsonfile.policies.update({puid: default_policies[puid]})
-            # if there are no default values of this filetype and not run in strict mode
-            if not self.mode.STRICT and puid not in default_policies:
-                jsonfile.policies.update({puid: PolicyParams(format_name=FMT2EXT[puid]["name"])})
-                self.ba.blank.append(puid)
             # if it is run in extend mode, add the existing policy if there is any
             if extend and puid in self.policies:
                 jsonfile.policies.update({puid: self.policies[puid]})
-                if puid in self.ba.blank:
-                    self.ba.blank.remove(puid)
+            elif policy := self._default_policy(puid, default_policies):
+                jsonfile.policies.update({puid: policy})
+                if puid not in default_policies:
+                    self.ba.blank.append(puid)
             # set remove original
             if puid in jsonfile.policies and self.mode.REMOVEORIGINAL:
                 jsonfile.policies[puid].remove_original = self.mode.REMOVEORIGINAL
@@ -150,6 +458,17 @@ class FileHandler:
         self.policies = jsonfile.policies
         jsonfile.name.write_text(jsonfile.model_dump_json(indent=4, exclude_none=True))
 
+    def _default_policy(self, puid: str, default_policies: Policies, blank: bool = False) -> PolicyParams | None:
+        """Return the policy that is generated for a puid, None if there is none (not a default one in strict mode)"""
+        if blank:
+            return PolicyParams(format_name=FMT2EXT[puid].name, remove_original=self.mode.REMOVEORIGINAL)
+        if puid in default_policies:
+            return default_policies[puid]
+        # if there are no default values of this filetype and not run in strict mode
+        if not self.mode.STRICT:
+            return PolicyParams(format_name=FMT2EXT[puid].name)
+        return None
+
     def _manage_policies(self, policies_path: Path | None = None, blank: bool = False, extend: bool = False) -> None:
         """
         Set the policies according to the parameters passed. either default policies, external passed policies or
@@ -182,6 +501,7 @@ class FileHandler:
         Test a policies.json with the smallest files of the directory. if puid is passed, it only tests the puid
         of the policies.
         """
+        from fileidentification.tasks.conversion import convert_file
 
         puids = [puid] if puid else [puid for puid in self.ba.puid_unique if not self.policies[puid].accepted]
 
@@ -200,22 +520,42 @@ class FileHandler:
                     secho(f"You find the file with the log in {t_sfinfo.filename.parent}")
 
     def inspect(self) -> None:
-        self.fp.LOGJSON = self.fp.TMP_DIR / f"{datetime.now(UTC).strftime('%y%m%d')}_report.json"
+        from fileidentification.tasks.inspection import probe_files
+
+        self.fp.LOGJSON = self.fp.TMP_DIR / f"{datetime.now(UTC).strftime('%y%m%d')}_report{self.fp.LOGJSON.suffix}"
         self.fp.POLJSON.unlink(missing_ok=True)
-        with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True) as prog:
-            prog.add_task(description="Probing the files ...", total=None)
-            for sfinfo in self.stack:
-                if not (sfinfo.status.removed or sfinfo.dest):
-                    inspect_file(sfinfo, self.policies, self.log_tables, self.mode.VERBOSE)
+        with self._progress("inspect", "Probing the files ...", "active") as progress:
+            probed = probe_files(
+                self._todo("inspect", self.stack.active()),
+                self.policies,
+                self.log_tables,
+                self.mode.VERBOSE,
+                self.mode.JOBS,
+                self.mode.DECODE,
+            )
+            for sfinfo, _ in probed:
+                self.stack.update(sfinfo)
+                progress.advance(sfinfo.filesize)
 
         print_diagnostic(log_tables=self.log_tables, mode=self.mode)
 
     def assert_integrity(self) -> None:
-        with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True) as prog:
-            prog.add_task(description="Probing the files ...", total=None)
-            for sfinfo in self.stack:
-                if not (sfinfo.status.removed or sfinfo.dest):
-                    assert_file_integrity(sfinfo, self.policies, self.log_tables, self.mode.VERBOSE)
+        from fileidentification.tasks.inspection import probe_files, resolve_integrity
+
+        with self._progress("integrity", "Probing the files ...", "active") as progress:
+            probed = probe_files(
+                self._todo("integrity", self.stack.active()),
+                self.policies,
+                self.log_tables,
+                self.mode.VERBOSE,
+                self.mode.JOBS,
+                self.mode.DECODE,
+            )
+            # the files are moved or renamed one by one in this thread, while the next files are probed
+            for sfinfo, res in probed:
+                resolve_integrity(sfinfo, res, self.log_tables)
+                self.stack.update(sfinfo)
+                progress.advance(sfinfo.filesize)
 
         print_diagnostic(log_tables=self.log_tables, mode=self.mode)
 
@@ -226,40 +566,142 @@ class FileHandler:
         self.remove_tmp(root_folder, to_csv)
 
     def apply_policies(self) -> None:
-        with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True) as prog:
-            prog.add_task(description="Applying policies ...")
-            for sfinfo in self.stack:
-                if not (sfinfo.status.removed or sfinfo.dest):
-                    apply_policy(sfinfo, self.policies, self.log_tables, self.mode.STRICT)
+        from fileidentification.tasks.policies import apply_policy
+
+        with self._progress("policies", "Applying policies ...", "active") as progress:
+            for sfinfo in self._todo("policies", self.stack.active()):
+                apply_policy(sfinfo, self.policies, self.log_tables, self.mode.STRICT)
+                self.stack.update(sfinfo)
+                progress.advance(sfinfo.filesize)
 
     def convert(self) -> None:
         """Convert files whose metadata status pending is True"""
+        from fileidentification.tasks.conversion_cache import ConversionCache
+        from fileidentification.tasks.scheduler import convert_files
 
-        pending: list[SfInfo] = [sfinfo for sfinfo in self.stack if sfinfo.status.pending]
+        pending = self._todo("convert", self.stack.pending())
+        first = next(pending, None)
 
-        if not pending:
+        if not first:
             print_msg("There was nothing to convert", self.mode.QUIET)
             return
 
-        with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True) as prog:
-            prog.add_task(description="Converting ...", total=None)
-            for sfinfo in pending:
-                conv_sfinfo, cmd = convert_file(sfinfo, self.policies)
-                if conv_sfinfo:
-                    msg = f"converted -> {sfinfo.tdir.stem}/{conv_sfinfo.filename.parent.name}/{conv_sfinfo.filename.name}"
-                    sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
-                    conv_sfinfo.root_folder = sfinfo.root_folder
-                    self.stack.append(conv_sfinfo)
-                else:
-                    lmsg = sfinfo.processing_logs.pop()
-                    lmsg.msg += f". cmd={cmd} "
-                    self.log_tables.processing_errors.append((lmsg, sfinfo))
+        with self._progress("convert", "Converting ...", "pending", by_bin=True) as progress:
+            # the conversions are added to the stack as they finish
+            cache = ConversionCache(self.mode.CACHE_DIR, self.mode.CACHE_SIZE) if self.mode.CACHE_DIR else None
+            converted = convert_files(chain([first], pending), self.policies, self.mode.SLOTS, self.mode.CPUS, cache)
+            for sfinfo, conv_sfinfo, cmd in converted:
+                self._add_conversion(sfinfo, conv_sfinfo, cmd)
+                self.stack.update(sfinfo)
+                progress.advance(sfinfo.filesize, self._bin(sfinfo.processed_as))
+
+    def _add_conversion(self, sfinfo: SfInfo, conv_sfinfo: SfInfo | None, cmd: list[str]) -> None:
+        """Add the converted file to the stack, or the failed conversion to the processing errors"""
+        if conv_sfinfo:
+            msg = f"converted -> {sfinfo.tdir.stem}/{conv_sfinfo.filename.parent.name}/{conv_sfinfo.filename.name}"
+            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
+            conv_sfinfo.root_folder = sfinfo.root_folder
+            self.stack.append(conv_sfinfo)
+        else:
+            lmsg = sfinfo.processing_logs.pop()
+            if lmsg.msg.startswith(FPMsg.TIMEOUT):
+                self.log_tables.diagnostics_add(sfinfo, FDMsg.TIMEOUT)
+            lmsg.msg += f". cmd={cmd} "
+            self.log_tables.processing_errors.append((lmsg, sfinfo))
+
+    def stream(
+        self,
+        root_folder: Path,
+        policies_path: Path | None,
+        blank: bool,
+        extend: bool,
+        assert_integrity: bool,
+        apply: bool,
+    ) -> None:
+        """
+        Identify, probe, apply the policies and convert at once instead of stage by stage, the files flow through
+        the stages as they are found (see streaming.stream_files). the policies are loaded before, or generated
+        for each format as it is found, and written out at the end like in a run stage by stage.
+        """
+        from fileidentification.tasks.conversion_cache import ConversionCache
+        from fileidentification.tasks.inspection import probe_files, resolve_integrity
+        from fileidentification.tasks.policies import apply_policy
+        from fileidentification.tasks.scheduler import convert_files
+        from fileidentification.tasks.streaming import stream_files
+
+        defaults = self._stream_policies(policies_path, blank, extend)
+        self._start_journal()
+
+        def inspected(sfinfos: Iterable[SfInfo]) -> Iterator[SfInfo]:
+            probed: Iterable[tuple[SfInfo, FDMsg | None]] = ((sfinfo, None) for sfinfo in sfinfos)
+            if assert_integrity:
+                decode = self.mode.DECODE
+                probed = probe_files(sfinfos, self.policies, self.log_tables, self.mode.VERBOSE, self.mode.JOBS, decode)
+            for sfinfo, res in probed:
+                resolve_integrity(sfinfo, res, self.log_tables)
+                if apply and not sfinfo.status.removed:
+                    apply_policy(sfinfo, self.policies, self.log_tables, self.mode.STRICT)
+                yield sfinfo
+
+        cache = ConversionCache(self.mode.CACHE_DIR, self.mode.CACHE_SIZE) if self.mode.CACHE_DIR else None
+
+        def converted(sfinfos: Iterable[SfInfo]) -> Iterator[tuple[SfInfo, SfInfo | None, list[str]]]:
+            return convert_files(sfinfos, self.policies, self.mode.SLOTS, self.mode.CPUS, cache)
+
+        self._collect(
+            stream_files(self._identified(root_folder, defaults, blank), inspected, converted if apply else None)
+        )
+        self.ba.duplicates = self.stack.duplicates()
+        print_siegfried_errors(ba=self.ba)
+        print_duplicates(duplicates=self.ba.duplicates, mode=self.mode)
+        self._manage_policies(policies_path, blank, extend)
+        if assert_integrity:
+            print_diagnostic(log_tables=self.log_tables, mode=self.mode)
+
+    def _stream_policies(self, policies_path: Path | None, blank: bool, extend: bool) -> Policies | None:
+        """
+        Load the policies before the files are streamed, returns the default policies that are generated for the
+        formats that are not in the loaded ones, None if the policies of the other formats are not generated
+        """
+        generate = blank or not (policies_path or self.fp.POLJSON.is_file())
+        if generate:
+            self.policies = {}
+        else:
+            self._load_policies(policies_path or self.fp.POLJSON)
+        return PoliciesFile(**json.loads(DEFAULTPOLICIES.read_text())).policies if generate or extend else None
+
+    def _identified(self, root_folder: Path, defaults: Policies | None, blank: bool) -> Iterator[SfInfo]:
+        """Identify the files in root_folder, the policy of a format that has none is generated as it is found"""
+        for sfinfo in self._identify(self._walk(root_folder), root_folder):
+            puid = sfinfo.processed_as
+            if defaults is None or not puid or puid in self.policies:
+                yield sfinfo
+                continue
+            if policy := self._default_policy(puid, defaults, blank):
+                self.policies[puid] = policy
+            yield sfinfo
+
+    def _collect(self, streamed: Iterator[tuple[SfInfo, SfInfo | None, list[str]]]) -> None:
+        """Add the streamed files and their conversions to the stack as they come through"""
+        with (
+            self._progress("stream", "Identifying, probing and converting files ...") as progress,
+            LogWriter(self.fp.LOGJSON) if self.mode.LOGFORMAT == LogFormat.JSONL else nullcontext() as log,
+        ):
+            # the stack is only touched in this thread
+            for sfinfo, conv_sfinfo, cmd in streamed:
+                self.stack.append(sfinfo)
+                self.ba.append(sfinfo)
+                if conv_sfinfo or cmd:
+                    self._add_conversion(sfinfo, conv_sfinfo, cmd)
+                    self.stack.update(sfinfo)
+                if log:
+                    log.write(sfinfo)
+                progress.advance(sfinfo.filesize, self._bin(sfinfo.processed_as))
 
     def remove_tmp(self, root_folder: Path, to_csv: bool = False) -> None:
         # move converted files from the working dir to its destination
-        with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), transient=True) as prog:
-            prog.add_task(description="Moving files ...", total=None)
-            write_logs = move_tmp(self.stack, self.policies, self.log_tables, self.mode.REMOVEORIGINAL)
+        with self._progress("move", "Moving files ...", "converted") as progress:
+            write_logs = move_tmp(self.stack, self.policies, self.log_tables, self.mode.REMOVEORIGINAL, progress)
 
         # remove empty folders in working dir
         if self.fp.TMP_DIR.is_dir():
@@ -271,8 +713,27 @@ class FileHandler:
             self.write_logs(to_csv=to_csv)
 
     def write_logs(self, to_csv: bool = False) -> None:
-        logoutput = LogOutput(files=self.stack, errors=self.log_tables.dump_errors(), duplicates=self.ba.duplicates)
-        self.fp.LOGJSON.write_text(logoutput.model_dump_json(indent=4, exclude_none=True))
+        # attach the processing errors to the current state of their sfinfos
+        self.log_tables.processing_errors = [
+            (msg, self.stack.refresh(sfinfo)) for msg, sfinfo in self.log_tables.processing_errors
+        ]
+        errors = self.log_tables.dump_errors()
+        for sfinfo in {id(sfinfo): sfinfo for sfinfo in errors or []}.values():
+            self.stack.update(sfinfo)
+
+        if self.mode.LOGFORMAT == LogFormat.JSONL:
+            with LogWriter(self.fp.LOGJSON, atomic=True) as log:
+                log.trailer = LogOutput(errors=errors, duplicates=self.ba.duplicates)
+                for sfinfo in self.stack:
+                    log.write(sfinfo)
+        else:
+            logoutput = LogOutput(files=list(self.stack), errors=errors, duplicates=self.ba.duplicates)
+            # the log replaces the one the journal of the run is based on at once
+            tmp = self.fp.LOGJSON.with_name(f".{self.fp.LOGJSON.name}.tmp")
+            tmp.write_text(logoutput.model_dump_json(indent=4, exclude_none=True))
+            tmp.replace(self.fp.LOGJSON)
+        if self.mode.INCREMENTAL:
+            write_index(self.fp.INDEXJSON, self.stack.active())
 
         print_processing_errors(log_tables=self.log_tables)
 
@@ -282,8 +743,32 @@ class FileHandler:
                 w.writeheader()
                 [w.writerow(sfinfo2csv(el)) for el in self.stack]
 
+        self.stack.close()
+        # the run is complete
+        if self.journal:
+            self.journal.close(remove=True)
         sys.exit(0)
 
+    def _load(
+        self,
+        root_folder: Path,
+        policies_path: Path | None,
+        blank: bool,
+        extend: bool,
+        assert_integrity: bool,
+        apply: bool,
+    ) -> bool:
+        """Load the files and the policies, returns True if they were streamed through the probes and conversions"""
+        if self.mode.STREAM and (assert_integrity or apply) and self._can_stream():
+            # identify, probe and convert at once
+            self.stream(root_folder, policies_path, blank, extend, assert_integrity, apply)
+            return True
+        # generate a list of SfInfo objects out of the target folder
+        self._load_sfinfos(root_folder)
+        # generate policies
+        self._manage_policies(policies_path, blank, extend)
+        return False
+
     # default run, has a typer interface for the params in identify.py
     def run(
         self,
@@ -304,34 +789,92 @@ class FileHandler:
         to_csv: bool = False,
         tmp_dir: Path | None = None,
         inspect: bool = False,
+        jobs: int = 1,
+        include: list[str] | None = None,
+        exclude: list[str] | None = None,
+        symlinks: Symlinks = Symlinks.FILES,
+        hash_algo: HashAlgo = HashAlgo.MD5,
+        use_mmap: bool = False,
+        fixity: bool = True,
+        incremental: bool = False,
+        log_format: LogFormat = LogFormat.JSON,
+        catalog: bool = False,
+        slots: list[str] | None = None,
+        cpus: int | None = None,
+        cache_dir: Path | None = None,
+        cache_size: float = 10,
+        progress_interval: float = 0,
+        decode: DecodeDepth = DecodeDepth.FULL,
+        decode_segments: int = 5,
+        decode_seconds: float = 30,
+        decode_time_budget: float | None = None,
+        decode_size_budget: float | None = None,
+        timeouts: list[str] | None = None,
+        memory_budget: float | None = None,
+        cpu_time_limit: int | None = None,
+        concurrency: int = 64,
+        stream: bool = False,
+        resume: bool = False,
+        journal: bool | None = None,
+        checkpoint_files: int = 1000,
+        checkpoint_interval: float = 10,
     ) -> None:
         root_folder = Path(root_folder)
         # set dirs / paths
-        set_filepaths(self.fp, root_folder, tmp_dir)
+        set_filepaths(self.fp, root_folder, tmp_dir, log_format)
         # set the mode
         self.mode.REMOVEORIGINAL = remove_original
         self.mode.VERBOSE = mode_verbose
         self.mode.STRICT = mode_strict
         self.mode.QUIET = mode_quiet
-        # generate a list of SfInfo objects out of the target folder
-        self._load_sfinfos(root_folder)
-        # generate policies
-        self._manage_policies(policies_path, blank, extend)
+        self.mode.JOBS = jobs
+        self.mode.INCLUDE = include or []
+        self.mode.EXCLUDE = exclude or []
+        self.mode.SYMLINKS = symlinks
+        self.mode.HASH_ALGO = hash_algo
+        self.mode.MMAP = use_mmap
+        self.mode.FIXITY = fixity
+        self.mode.INCREMENTAL = incremental
+        self.mode.LOGFORMAT = log_format
+        self.mode.CATALOG = catalog
+        self.mode.CPUS = cpus
+        self.mode.CACHE_DIR = cache_dir
+        self.mode.CACHE_SIZE = int(cache_size * 1024**3)
+        self.mode.PROGRESS_INTERVAL = progress_interval
+        self.mode.STREAM = stream
+        self.mode.RESUME = resume
+        # by default, the runs that change the files are journaled
+        self.mode.JOURNAL = resume or (journal if journal is not None else apply or convert or remove_tmp)
+        self.mode.CHECKPOINT = CheckpointParams(files=checkpoint_files, seconds=checkpoint_interval)
+        self.mode.DECODE = DecodeParams(
+            depth=decode,
+            segments=decode_segments,
+            seconds=decode_seconds,
+            time_budget=decode_time_budget,
+            size_budget=int(decode_size_budget * 1e6) if decode_size_budget else None,
+        )
+        if jobs > 1 or slots:
+            from fileidentification.tasks.scheduler import conversion_slots
+
+            self.mode.SLOTS = conversion_slots(jobs, slots)
+        self._limit_tools(timeouts, memory_budget, cpu_time_limit, concurrency)
+        self._open_stack(root_folder)
+        streamed = self._load(root_folder, policies_path, blank, extend, assert_integrity, apply)
         # probing the files
         if inspect:
             self.inspect()
-        if assert_integrity:
+        if assert_integrity and not streamed:
             self.assert_integrity()
-            if not apply:
-                # this triggers -qarx (to catch fixes with reencoding)
-                self._silenty_reencode(root_folder, to_csv)
+        if assert_integrity and not apply:
+            # this triggers -qarx (to catch fixes with reencoding)
+            self._silenty_reencode(root_folder, to_csv)
         # policies testing
         if test_puid:
             self._test_policies(puid=test_puid)
         if test_policies:
             self._test_policies()
         # apply policies
-        if apply:
+        if apply and not streamed:
             self.apply_policies()
             self.convert()
         if convert:
@@ -0,0 +1,227 @@
+import sqlite3
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+from fileidentification.definitions.models import SfInfo
+from fileidentification.tasks.stack import Stack, is_active
+
+# rows fetched per query when iterating over a view, and writes after which the changes are committed
+PAGESIZE = 1000
+COMMIT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    md5 TEXT NOT NULL,
+    processed_as TEXT,
+    removed INTEGER NOT NULL,
+    pending INTEGER NOT NULL,
+    added INTEGER NOT NULL,
+    dest TEXT,
+    derived_from TEXT,
+    parent INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_filename ON files (filename);
+CREATE INDEX IF NOT EXISTS files_md5 ON files (md5);
+CREATE INDEX IF NOT EXISTS files_processed_as ON files (processed_as);
+CREATE INDEX IF NOT EXISTS files_status ON files (pending, removed, added);
+CREATE INDEX IF NOT EXISTS files_dest ON files (dest);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent);
+"""
+COLUMNS = "id, data, parent"
+
+ACTIVE = "removed = 0 AND dest IS NULL"
+# the where clauses of the views of the stack
+VIEWS = {"active": ACTIVE, "pending": "pending = 1", "converted": "dest IS NOT NULL"}
+
+
+def _columns(sfinfo: SfInfo, parent: int | None) -> tuple[Any, ...]:
+    return (
+        f"{sfinfo.filename}",
+        sfinfo.md5,
+        sfinfo.processed_as,
+        sfinfo.status.removed,
+        sfinfo.status.pending,
+        sfinfo.status.added,
+        f"{sfinfo.dest}" if sfinfo.dest else None,
+        f"{sfinfo.derived_from.filename}" if sfinfo.derived_from else None,
+        parent,
+        # the file it is derived from is rebuilt from its row, it keeps a copy of it if it is not in the catalog
+        sfinfo.model_dump_json(exclude_none=True, exclude={"derived_from"} if parent else None),
+    )
+
+
+class Catalog(Stack):
+    """
+    A stack that keeps the sfinfos in a SQLite database instead of in memory. The sfinfos are materialised
+    when a view or lookup is queried, the stages have to pass the sfinfos they modified to update.
+    Since the catalog is persisted, it doubles as the log of the files in the root folder.
+    """
+
+    def __init__(self, path: Path, root_folder: Path, tdir: Path) -> None:
+        super().__init__(root_folder, tdir)
+        self.path = path
+        self._con = sqlite3.connect(path)
+        self._con.executescript("PRAGMA journal_mode = WAL; PRAGMA synchronous = NORMAL;" + SCHEMA)
+        self._writes = 0
+
+    def _sfinfo(self, rowid: int, data: str, parent: int | None) -> SfInfo:
+        sfinfo = SfInfo.model_validate_json(data)
+        sfinfo.rowid = rowid
+        if parent:
+            sfinfo.derived_from = self._get(parent)
+        if not sfinfo.status.removed:
+            sfinfo.set_processing_paths(self.root_folder, self.tdir, initial=False)
+        return sfinfo
+
+    def _get(self, rowid: int) -> SfInfo | None:
+        row = self._con.execute(f"SELECT {COLUMNS} FROM files WHERE id = ?", (rowid,)).fetchone()  # noqa: S608
+        return self._sfinfo(*row) if row else None
+
+    def _link(self, sfinfo: SfInfo) -> int | None:
+        """Return the row of the file sfinfo was converted from, None if it is not in the catalog"""
+        parent = sfinfo.derived_from
+        if not parent:
+            return None
+        if parent.rowid is not None and parent.rowid in self:
+            return parent.rowid
+        # e.g. a conversion read from the log, its origin is the last file with its filename and checksum
+        row = self._con.execute(
+            "SELECT id FROM files WHERE filename = ? AND md5 = ? AND id IS NOT ? ORDER BY id DESC LIMIT 1",
+            (f"{parent.filename}", parent.md5, sfinfo.rowid),
+        ).fetchone()
+        return row[0] if row else None
+
+    def _select(self, where: str = "1") -> Iterator[SfInfo]:
+        """Iterate over the rows matching where, page by page, so rows can be updated while iterating"""
+        last = 0
+        while True:
+            rows = self._con.execute(
+                f"SELECT {COLUMNS} FROM files WHERE id > ? AND {where} ORDER BY id LIMIT ?",  # noqa: S608
+                (last, PAGESIZE),
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._sfinfo(*row)
+            last = rows[-1][0]
+
+    def _query(self, where: str, *params: Any) -> list[SfInfo]:
+        """Return the sfinfos of the rows matching where, for lookups that match a few rows"""
+        rows = self._con.execute(f"SELECT {COLUMNS} FROM files WHERE {where} ORDER BY id", params)  # noqa: S608
+        return [self._sfinfo(*row) for row in rows]
+
+    def _written(self) -> None:
+        self._writes += 1
+        # a journaled catalog is committed at the checkpoints of the journal (see Journal.record)
+        if self._writes % COMMIT_EVERY == 0 and not self.journal:
+            self._con.commit()
+
+    def __len__(self) -> int:
+        count: int = self._con.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return count
+
+    def __iter__(self) -> Iterator[SfInfo]:
+        return self._select()
+
+    def __contains__(self, rowid: object) -> bool:
+        return self._con.execute("SELECT 1 FROM files WHERE id = ?", (rowid,)).fetchone() is not None
+
+    def append(self, sfinfo: SfInfo) -> None:
+        cur = self._con.execute(
+            "INSERT INTO files (filename, md5, processed_as, removed, pending, added, dest, derived_from, parent, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            _columns(sfinfo, self._link(sfinfo)),
+        )
+        sfinfo.rowid = cur.lastrowid
+        self._written()
+        if self.journal:
+            self.journal(sfinfo, False, None)
+
+    def update(self, sfinfo: SfInfo) -> None:
+        if sfinfo.rowid is None:
+            self.append(sfinfo)
+            return
+        before = self._get(sfinfo.rowid) if self.journal else None
+        self._con.execute(
+            "UPDATE files SET filename = ?, md5 = ?, processed_as = ?, removed = ?, pending = ?, added = ?, "
+            "dest = ?, derived_from = ?, parent = ?, data = ? WHERE id = ?",
+            (*_columns(sfinfo, self._link(sfinfo)), sfinfo.rowid),
+        )
+        self._written()
+        if self.journal:
+            self.journal(sfinfo, False, before)
+
+    def remove(self, sfinfos: Iterable[SfInfo]) -> None:
+        sfinfos = list(sfinfos)
+        derived = [el for sfinfo in sfinfos for el in self.derived(sfinfo)]
+        self._con.executemany("DELETE FROM files WHERE id = ?", [(sfinfo.rowid,) for sfinfo in sfinfos])
+        self._written()
+        if self.journal:
+            for sfinfo in sfinfos:
+                self.journal(sfinfo, True, None)
+        # the files converted from them keep a copy of them
+        for el in derived:
+            self.update(el)
+
+    def commit(self) -> None:
+        self._con.commit()
+
+    def close(self) -> None:
+        self._con.commit()
+        self._con.close()
+
+    # views
+    def active(self) -> Iterator[SfInfo]:
+        return self._select(VIEWS["active"])
+
+    def pending(self) -> Iterator[SfInfo]:
+        return self._select(VIEWS["pending"])
+
+    def converted(self) -> Iterator[SfInfo]:
+        return self._select(VIEWS["converted"])
+
+    def totals(self, view: str) -> dict[str | None, tuple[int, int]]:
+        rows = self._con.execute(
+            "SELECT processed_as, COUNT(*), SUM(json_extract(data, '$.filesize')) FROM files "  # noqa: S608
+            f"WHERE {VIEWS[view]} GROUP BY processed_as"
+        )
+        return {puid: (files, size or 0) for puid, files, size in rows}
+
+    # lookups
+    def by_filename(self, filename: Path) -> SfInfo | None:
+        row = self._con.execute(
+            f"SELECT {COLUMNS} FROM files WHERE filename = ? AND {ACTIVE} ORDER BY id LIMIT 1",  # noqa: S608
+            (f"{filename}",),
+        ).fetchone()
+        return self._sfinfo(*row) if row else None
+
+    def by_md5(self, md5: str) -> list[SfInfo]:
+        return self._query(f"md5 = ? AND {ACTIVE}", md5)
+
+    def by_puid(self, puid: str) -> list[SfInfo]:
+        return self._query(f"processed_as = ? AND {ACTIVE}", puid)
+
+    def parent(self, sfinfo: SfInfo) -> SfInfo | None:
+        if not sfinfo.derived_from or sfinfo.derived_from.rowid is None:
+            return None
+        parent = self._get(sfinfo.derived_from.rowid)
+        return parent if parent and is_active(parent) else None
+
+    def derived(self, sfinfo: SfInfo) -> list[SfInfo]:
+        return self._query("parent = ?", sfinfo.rowid)
+
+    def duplicates(self) -> dict[str, list[Path]]:
+        rows = self._con.execute(
+            f"SELECT md5, filename FROM files WHERE {ACTIVE} AND processed_as IS NOT NULL AND md5 IN "  # noqa: S608
+            f"(SELECT md5 FROM files WHERE {ACTIVE} AND processed_as IS NOT NULL AND md5 != '' "
+            "GROUP BY md5 HAVING COUNT(*) > 1) "
+            "ORDER BY id"
+        )
+        duplicates: dict[str, list[Path]] = {}
+        for md5, filename in rows:
+            duplicates.setdefault(md5, []).append(Path(filename))
+        return duplicates
@@ -7,7 +7,7 @@ from rich.style import Style
 from rich.table import Table
 from typer import colors, secho
 
-from fileidentification.definitions.models import BasicAnalytics, LogMsg, LogTables, Mode, Policies
+from fileidentification.definitions.models import BasicAnalytics, LogMsg, LogTables, Mode, Policies, SfInfo
 from fileidentification.definitions.settings import FMT2EXT, FDMsg
 
 
@@ -29,10 +29,7 @@ def print_fmts(puids: list[str], ba: BasicAnalytics, policies: Policies, mode: M
     table.add_column("Policy")
 
     for puid in puids:
-        bytes_size: int = 0
-        for sfinfo in ba.puid_unique[puid]:
-            bytes_size += sfinfo.filesize
-        size = _format_bite_size(bytes_size)
+        size = _format_bite_size(ba.puid_unique[puid].size)
         po = ""
         style = Style(color=colors.WHITE)
         if puid not in policies:
@@ -45,30 +42,29 @@ def print_fmts(puids: list[str], ba: BasicAnalytics, policies: Policies, mode: M
         if ba.blank and puid in ba.blank:
             po = "blank"
             style = Style(color=colors.YELLOW)
-        table.add_row(puid, f"{FMT2EXT[puid]['name']}", f"{len(ba.puid_unique[puid])}", size, po, style=style)
+        table.add_row(puid, FMT2EXT[puid].name, f"{ba.puid_unique[puid].count}", size, po, style=style)
     console = Console()
     console.print(table)
 
 
 def print_diagnostic(log_tables: LogTables, mode: Mode) -> None:
     # lists all corrupt files with the respective errors thrown
-    if log_tables.diagnostics:
-        if FDMsg.ERROR.name in log_tables.diagnostics:
-            secho("\n----------- Errors -----------", bold=True)
-            for sfinfo in log_tables.diagnostics[FDMsg.ERROR.name]:
-                secho(f"\n{_format_bite_size(sfinfo.filesize): >10}    {sfinfo.filename}", bold=True)
-                _print_logs(sfinfo.warnings)
-        if mode.VERBOSE and not mode.QUIET:
-            if FDMsg.WARNING.name in log_tables.diagnostics:
-                secho("\n----------- Warnings -----------", bold=True)
-                for sfinfo in log_tables.diagnostics[FDMsg.WARNING.name]:
-                    secho(f"\n{_format_bite_size(sfinfo.filesize): >10}    {sfinfo.filename}", bold=True)
-                    _print_logs(sfinfo.warnings)
-            if FDMsg.EXTMISMATCH.name in log_tables.diagnostics:
-                secho("\n----------- Extension mismatch -----------", bold=True)
-                for sfinfo in log_tables.diagnostics[FDMsg.EXTMISMATCH.name]:
-                    secho(f"\n{_format_bite_size(sfinfo.filesize): >10}    {sfinfo.filename}", bold=True)
-                    _print_logs(sfinfo.processing_logs)
+    diagnostics = log_tables.diagnostics
+    _print_diagnostics("Errors", diagnostics.get(FDMsg.ERROR.name, []))
+    _print_diagnostics("Timeouts", diagnostics.get(FDMsg.TIMEOUT.name, []))
+    if mode.VERBOSE and not mode.QUIET:
+        _print_diagnostics("Warnings", diagnostics.get(FDMsg.WARNING.name, []))
+        _print_diagnostics("Extension mismatch", diagnostics.get(FDMsg.EXTMISMATCH.name, []), warnings=False)
+
+
+def _print_diagnostics(title: str, sfinfos: list[SfInfo], warnings: bool = True) -> None:
+    """Print the files of a diagnostic with their warnings, or else with their processing logs"""
+    if not sfinfos:
+        return
+    secho(f"\n----------- {title} -----------", bold=True)
+    for sfinfo in sfinfos:
+        secho(f"\n{_format_bite_size(sfinfo.filesize): >10}    {sfinfo.filename}", bold=True)
+        _print_logs(sfinfo.warnings if warnings else sfinfo.processing_logs)
 
 
 def print_duplicates(duplicates: dict[str, list[Path]], mode: Mode) -> None:
@@ -76,9 +72,10 @@ def print_duplicates(duplicates: dict[str, list[Path]], mode: Mode) -> None:
         return
     if duplicates:
         secho("\n----------- Duplicates -----------", bold=True)
-        secho("\nBased on their MD5 checksum, the following files are duplicates:")
+        algo = mode.HASH_ALGO.upper()
+        secho(f"\nBased on their {algo} checksum, the following files are duplicates:")
         for k in duplicates:  # noqa: PLC0206
-            secho(f"\nMD5 {k}: ", bold=True)
+            secho(f"\n{algo} {k}: ", bold=True)
             for path in duplicates[k]:
                 secho(f"- {path}")
         secho("\n")
@@ -1,23 +1,29 @@
 import json
 from pathlib import Path
 
-import pygfried
 from typer import colors, secho
 
 from fileidentification.definitions.models import LogMsg, Policies, PolicyParams, SfInfo
-from fileidentification.definitions.settings import Bin, FPMsg
-from fileidentification.wrappers.converter import convert
+from fileidentification.definitions.settings import Bin, FPMsg, HashAlgo
+from fileidentification.tasks.conversion_cache import ConversionCache
+from fileidentification.tasks.hashing import ensure_hash
+from fileidentification.tasks.identification import identify_file
+from fileidentification.wrappers.capture import bounded_file
+from fileidentification.wrappers.converter import convert, convert_batch, target_paths
 from fileidentification.wrappers.ffmpeg import ffmpeg_media_info
 from fileidentification.wrappers.imagemagick import imagemagick_media_info
+from fileidentification.wrappers.process import timed_out
 
 
 def _add_media_info(sfinfo: SfInfo, _bin: str) -> None:
     match _bin:
         case Bin.FFMPEG:
-            streams = ffmpeg_media_info(sfinfo.filename)
+            streams = ffmpeg_media_info(sfinfo.filename, sfinfo.md5)
             sfinfo.media_info.append(LogMsg(name="ffmpeg", msg=json.dumps(streams)))
         case Bin.MAGICK:
-            sfinfo.media_info.append(LogMsg(name="imagemagick", msg=imagemagick_media_info(sfinfo.filename)))
+            sfinfo.media_info.append(
+                LogMsg(name="imagemagick", msg=imagemagick_media_info(sfinfo.filename, sfinfo.md5))
+            )
         case _:
             pass
 
@@ -32,12 +38,10 @@ def _verify(target: Path, sfinfo: SfInfo, expected: list[str]) -> SfInfo | None:
     target_sfinfo = None
     if target.is_file():
         # generate a SfInfo of the converted file
-        target_sfinfo = SfInfo(**pygfried.identify(f"{target}", detailed=True)["files"][0])  # type: ignore[arg-type]
+        target_sfinfo = identify_file(target, sfinfo.hash_algo or HashAlgo.MD5)
         # only add postprocessing information if conversion was successful
         if target_sfinfo.processed_as in expected:
-            target_sfinfo.dest = sfinfo.filename.parent
-            target_sfinfo.derived_from = sfinfo
-            sfinfo.status.pending = False
+            _derive(target_sfinfo, sfinfo)
 
         else:
             p_error = f" did expect {expected}, got {target_sfinfo.processed_as} instead"
@@ -53,24 +57,121 @@ def _verify(target: Path, sfinfo: SfInfo, expected: list[str]) -> SfInfo | None:
     return target_sfinfo
 
 
+def _derive(target_sfinfo: SfInfo, sfinfo: SfInfo) -> None:
+    """Link the converted file to its origin, which is not pending anymore"""
+    target_sfinfo.dest = sfinfo.filename.parent
+    target_sfinfo.derived_from = sfinfo
+    sfinfo.status.pending = False
+
+
+def _reuse(sfinfo: SfInfo, args: PolicyParams, cache: ConversionCache, key: str) -> tuple[SfInfo, list[str]] | None:
+    """Take the converted file from the cache, if a file with the same content was converted with the same policy"""
+    entry = cache.get(key)
+    if not entry or entry.sfinfo.processed_as not in args.expected:
+        return None
+    _, target, _ = target_paths(sfinfo, args)
+    try:
+        how = cache.place(key, target)
+    except OSError:
+        return None
+    target_sfinfo = entry.sfinfo.model_copy(update={"filename": target})
+    _derive(target_sfinfo, sfinfo)
+    msg = f"{FPMsg.REUSED} ({how} of {cache.directory / key[:2] / key})"
+    target_sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg))
+    return target_sfinfo, entry.cmd
+
+
 # file migration
-def convert_file(sfinfo: SfInfo, policies: Policies) -> tuple[SfInfo | None, list[str]]:
+def convert_file(
+    sfinfo: SfInfo,
+    policies: Policies,
+    threads: int | None = None,
+    profile: Path | None = None,
+    cache: ConversionCache | None = None,
+) -> tuple[SfInfo | None, list[str]]:
     """
     Convert a file, returns the metadata of the converted file as SfInfo
     :param sfinfo the metadata of the file to convert
     :param policies the policies for fileconversion
+    :param threads the number of threads of ffmpeg, ffmpeg decides if None
+    :param profile the user profile of soffice, the default profile if None
+    :param cache the cache of the conversions, the converted file is taken from there if it has it
     """
 
     args: PolicyParams = policies[sfinfo.processed_as]  # type: ignore[index]
+    # the working dir of the conversion and the cache are addressed by the checksum
+    ensure_hash(sfinfo)
+
+    if not cache:
+        return _finish(sfinfo, args, *convert(sfinfo, args, threads, profile))
+    key = cache.key(sfinfo, args)
+    # a duplicate that is converted at the same time waits for this conversion
+    with cache.claim(key):
+        if reused := _reuse(sfinfo, args, cache, key):
+            return reused
+        target_sfinfo, cmd = _finish(sfinfo, args, *convert(sfinfo, args, threads, profile))
+        if target_sfinfo:
+            cache.store(key, target_sfinfo, cmd)
+        return target_sfinfo, cmd
+
+
+def convert_documents(
+    sfinfos: list[SfInfo], policies: Policies, profile: Path, cache: ConversionCache | None = None
+) -> list[tuple[SfInfo | None, list[str]]]:
+    """
+    Convert documents that share the same soffice policy at once, returns the metadata of the converted files
+    :param sfinfos the metadata of the documents to convert, with distinct names
+    :param policies the policies for fileconversion
+    :param profile the user profile of soffice
+    :param cache the cache of the conversions, the converted files are taken from there if it has them
+    """
 
-    target_path, cmd, logfile_path = convert(sfinfo, args)
-
+    args: PolicyParams = policies[sfinfos[0].processed_as]  # type: ignore[index]
+    for sfinfo in sfinfos:
+        ensure_hash(sfinfo)
+
+    results: dict[int, tuple[SfInfo | None, list[str]]] = {}
+    todo = list(range(len(sfinfos)))
+    while todo:
+        # the duplicates in the batch are converted once, the others take the conversion from the cache
+        batch: list[int] = []
+        rest: list[int] = []
+        keys: set[str] = set()
+        for i in todo:
+            key = cache.key(sfinfos[i], args) if cache else None
+            if cache and key and (reused := _reuse(sfinfos[i], args, cache, key)):
+                results[i] = reused
+            elif key and key in keys:
+                rest.append(i)
+            else:
+                batch.append(i)
+                keys.add(key or "")
+        if batch:
+            converted = convert_batch([sfinfos[i] for i in batch], args, profile)
+            for i, paths in zip(batch, converted, strict=True):
+                target_sfinfo, cmd = results[i] = _finish(sfinfos[i], args, *paths)
+                if cache and target_sfinfo:
+                    cache.store(cache.key(sfinfos[i], args), target_sfinfo, cmd)
+        todo = rest
+    return [results[i] for i in range(len(sfinfos))]
+
+
+def _finish(
+    sfinfo: SfInfo, args: PolicyParams, target_path: Path, cmd: str, logfile_path: Path
+) -> tuple[SfInfo | None, list[str]]:
     # replace abs path in logs, add name
     processing_log = None
-    logtext = logfile_path.read_text().replace(f"{sfinfo.root_folder}/", "").replace(f"{sfinfo.tdir}/", "")
+    logtext = bounded_file(logfile_path).replace(f"{sfinfo.root_folder}/", "").replace(f"{sfinfo.tdir}/", "")
     if logtext != "":
         processing_log = LogMsg(name=f"{args.bin}", msg=logtext)
 
+    # the program was killed, what it wrote so far is not a conversion
+    if timed_out(logtext):
+        target_path.unlink(missing_ok=True)
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=f"{FPMsg.TIMEOUT}: {logtext.strip()}"))
+        secho(f"\tERROR conversion of {sfinfo.filename} timed out", fg=colors.RED, bold=True)
+        return None, [cmd]
+
     # create an SfInfo for target and verify output, add codec and processing logs
     target_sfinfo = _verify(target_path, sfinfo, args.expected)
     if target_sfinfo:
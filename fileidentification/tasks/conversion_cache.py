@@ -0,0 +1,163 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+from fileidentification.definitions.models import PolicyParams, SfInfo
+from fileidentification.definitions.settings import HashAlgo
+from fileidentification.tasks.hashing import hash_file
+from fileidentification.wrappers.converter import tool_version
+
+# ioctl that clones a file on filesystems with copy on write (btrfs, xfs), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+# names of the files of an entry of the cache
+OUTPUT = "output"
+ENTRY = "entry.json"
+
+
+class CacheEntry(BaseModel):
+    """The converted file of an entry, verified and with its media info and logs, and the cmd that converted it"""
+
+    sfinfo: SfInfo
+    cmd: list[str] = Field(default_factory=list)
+
+
+def place(src: Path, dst: Path) -> str:
+    """
+    Put the content of src at dst, as a reflink if the filesystem supports it, otherwise as a hardlink or as a copy.
+    returns which of them.
+    """
+    try:
+        with src.open("rb") as s, dst.open("wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        dst.unlink(missing_ok=True)
+    else:
+        return "reflink"
+    try:
+        dst.hardlink_to(src)
+    except OSError:
+        shutil.copyfile(src, dst)
+        return "copy"
+    return "hardlink"
+
+
+class ConversionCache:
+    """
+    The converted files, addressed by the checksum of their origin, the policy they were converted with and the
+    version of the program that converted them, so that a conversion is reused for duplicates and across runs.
+    Every entry is a dir with the converted file and its metadata. the least recently used entries are evicted,
+    when the cache grows beyond maxsize.
+    """
+
+    def __init__(self, directory: Path, maxsize: int) -> None:
+        self.directory = directory
+        self.maxsize = maxsize
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._claimed: dict[str, threading.Lock] = {}
+        # key -> (last use, size)
+        self._entries: dict[str, tuple[float, int]] = {}
+        for entry in self.directory.glob(f"*/*/{OUTPUT}"):
+            self._entries[entry.parent.name] = (entry.parent.stat().st_mtime, entry.stat().st_size)
+        self._size = sum(size for _, size in self._entries.values())
+        # e.g. if maxsize was reduced since the last run
+        self._shrink()
+
+    def key(self, sfinfo: SfInfo, args: PolicyParams) -> str:
+        """Return the key of the conversion of sfinfo with the policy args"""
+        parts = [
+            sfinfo.hash_algo or HashAlgo.MD5,
+            sfinfo.md5,
+            args.bin,
+            args.processing_args,
+            args.target_container,
+            tool_version(args.bin),
+        ]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    @contextmanager
+    def claim(self, key: str) -> Iterator[None]:
+        """Hold the key, so that a duplicate converted at the same time waits for the entry instead of converting"""
+        with self._lock:
+            claimed = self._claimed.setdefault(key, threading.Lock())
+        with claimed:
+            yield
+
+    def get(self, key: str) -> CacheEntry | None:
+        """Return the entry of key, None if there is none or its converted file does not match its checksum"""
+        path = self._path(key)
+        entry: CacheEntry | None = None
+        try:
+            entry = CacheEntry.model_validate_json((path / ENTRY).read_text())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            pass
+        # the entry is dropped if it is corrupt, or its converted file was modified (e.g. through a hardlink)
+        if not entry or hash_file(path / OUTPUT, entry.sfinfo.hash_algo or HashAlgo.MD5) != entry.sfinfo.md5:
+            self._evict(key)
+            return None
+        self._touch(key)
+        return entry
+
+    def place(self, key: str, dst: Path) -> str:
+        """Put the converted file of the entry of key at dst, returns how (see place)"""
+        return place(self._path(key) / OUTPUT, dst)
+
+    def store(self, key: str, sfinfo: SfInfo, cmd: list[str]) -> None:
+        """Add the converted file of sfinfo as the entry of key, unless there is one"""
+        path = self._path(key)
+        if path.is_dir():
+            return
+        # the entry is written aside and then renamed, so that a run sharing the cache never sees it half written
+        tmp = self.directory / f".tmp-{uuid.uuid4().hex}"
+        tmp.mkdir()
+        try:
+            place(sfinfo.filename, tmp / OUTPUT)
+            entry = CacheEntry(sfinfo=sfinfo.model_copy(update={"derived_from": None, "dest": None}), cmd=cmd)
+            (tmp / ENTRY).write_text(entry.model_dump_json(exclude_none=True))
+            path.parent.mkdir(exist_ok=True)
+            tmp.rename(path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self._touch(key)
+        self._shrink()
+
+    def _touch(self, key: str) -> None:
+        path = self._path(key)
+        os.utime(path)
+        with self._lock:
+            if key not in self._entries:
+                # just stored, or added by another run
+                self._entries[key] = (0, (path / OUTPUT).stat().st_size)
+                self._size += self._entries[key][1]
+            self._entries[key] = (time.time(), self._entries[key][1])
+
+    def _evict(self, key: str) -> None:
+        shutil.rmtree(self._path(key), ignore_errors=True)
+        with self._lock:
+            self._size -= self._entries.pop(key, (0, 0))[1]
+
+    def _shrink(self) -> None:
+        """Evict the least recently used entries until the cache fits into maxsize"""
+        with self._lock:
+            if self._size <= self.maxsize:
+                return
+            lru = sorted(self._entries, key=lambda key: self._entries[key][0])
+        for key in lru:
+            if self._size <= self.maxsize:
+                return
+            self._evict(key)
@@ -0,0 +1,50 @@
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from functools import partial
+
+from fileidentification.definitions.models import SfInfo
+from fileidentification.definitions.settings import HashAlgo
+from fileidentification.tasks.hashing import PARTIAL, hash_file, hash_partial
+from fileidentification.tasks.workers import ordered_map
+
+
+def hash_duplicates(
+    files: Callable[[], Iterable[SfInfo]], algo: HashAlgo = HashAlgo.MD5, jobs: int = 1, use_mmap: bool = False
+) -> Iterator[SfInfo]:
+    """
+    Hash the files that can be duplicates of each other, yields the sfinfos that got their checksum.
+    The files are grouped by size, the files of the same size by a partial hash of their head and tail
+    (see hash_partial), and only the files that still collide are fully hashed. a file that already has a
+    checksum is not hashed again, the files of its size are fully hashed to compare them with it.
+    :param files returns the files to compare, it is called twice: to count the sizes and to collect the files
+    of the sizes that collide, so the files do not have to be kept in memory at once
+    :param algo the hash algorithm
+    :param jobs the number of threads hashing the files
+    :param use_mmap if true, the files are memory mapped for hashing
+    """
+    sizes = Counter(sfinfo.filesize for sfinfo in files())
+    groups: dict[int, list[SfInfo]] = {}
+    for sfinfo in files():
+        if sizes[sfinfo.filesize] > 1:
+            groups.setdefault(sfinfo.filesize, []).append(sfinfo)
+
+    full: list[SfInfo] = []
+    partials: list[SfInfo] = []
+    for size, group in groups.items():
+        unhashed = [sfinfo for sfinfo in group if not sfinfo.md5]
+        # the partial hash of a small file covers all of it
+        if len(unhashed) < len(group) or size <= 2 * PARTIAL:
+            full.extend(unhashed)
+        else:
+            partials.extend(unhashed)
+
+    digests: dict[str, list[SfInfo]] = {}
+    hashes = ordered_map(partial(hash_partial, algo=algo), [sfinfo.path for sfinfo in partials], jobs)
+    for sfinfo, digest in zip(partials, hashes, strict=True):
+        digests.setdefault(digest, []).append(sfinfo)
+    full.extend(sfinfo for group in digests.values() if len(group) > 1 for sfinfo in group)
+
+    hashes = ordered_map(partial(hash_file, algo=algo, use_mmap=use_mmap), [sfinfo.path for sfinfo in full], jobs)
+    for sfinfo, md5 in zip(full, hashes, strict=True):
+        sfinfo.md5 = md5
+        yield sfinfo
@@ -0,0 +1,67 @@
+import hashlib
+import mmap
+from collections.abc import Iterable, Iterator
+from functools import partial
+from pathlib import Path
+
+from fileidentification.definitions.models import SfInfo
+from fileidentification.definitions.settings import HashAlgo
+from fileidentification.tasks.workers import ordered_map
+
+# files up to MAXBUF are read with a single call, larger ones in chunks of MAXBUF
+MINBUF = 64 * 1024
+MAXBUF = 4 * 1024**2
+# bytes of the head and of the tail of a file that its partial hash covers
+PARTIAL = 64 * 1024
+
+
+def hash_file(path: Path, algo: HashAlgo = HashAlgo.MD5, use_mmap: bool = False) -> str:
+    """
+    Return the hexdigest of a file. hashlib releases the GIL on the large buffers used here,
+    so several files can be hashed in parallel threads.
+    :param path the file to hash
+    :param algo the hash algorithm
+    :param use_mmap if true, the file is memory mapped and hashed without copying it into a buffer
+    """
+    hasher = hashlib.new(algo, usedforsecurity=False)
+    with open(path, "rb") as f:  # noqa: PTH123
+        size = f.seek(0, 2)
+        f.seek(0)
+        if use_mmap and size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+            return hasher.hexdigest()
+        buffer = memoryview(bytearray(min(MAXBUF, max(MINBUF, size))))
+        while n := f.readinto(buffer):
+            hasher.update(buffer[:n])
+    return hasher.hexdigest()
+
+
+def hash_files(
+    paths: Iterable[Path], algo: HashAlgo = HashAlgo.MD5, jobs: int = 1, use_mmap: bool = False
+) -> Iterator[str]:
+    """Hash the files on a pool of jobs threads, yields the hexdigests in the order of the paths"""
+    return ordered_map(partial(hash_file, algo=algo, use_mmap=use_mmap), paths, jobs)
+
+
+def hash_partial(path: Path, algo: HashAlgo = HashAlgo.MD5) -> str:
+    """
+    Return the hexdigest of the size, the head and the tail of a file, to tell apart files of the same size without
+    reading them fully. files up to 2 * PARTIAL are covered completely.
+    """
+    hasher = hashlib.new(algo, usedforsecurity=False)
+    with open(path, "rb") as f:  # noqa: PTH123
+        size = f.seek(0, 2)
+        hasher.update(size.to_bytes(8))
+        f.seek(0)
+        hasher.update(f.read(PARTIAL))
+        f.seek(max(PARTIAL, size - PARTIAL))
+        hasher.update(f.read(PARTIAL))
+    return hasher.hexdigest()
+
+
+def ensure_hash(sfinfo: SfInfo, use_mmap: bool = False) -> str:
+    """Return the checksum of a file, it is hashed first if it was not (see Mode.FIXITY)"""
+    if not sfinfo.md5:
+        sfinfo.md5 = hash_file(sfinfo.path, sfinfo.hash_algo or HashAlgo.MD5, use_mmap)
+    return sfinfo.md5
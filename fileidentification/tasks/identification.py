@@ -0,0 +1,58 @@
+from collections.abc import Iterable, Iterator
+from functools import partial
+from itertools import batched, chain
+from pathlib import Path
+from typing import Any
+
+import pygfried
+
+from fileidentification.definitions.models import SfInfo
+from fileidentification.definitions.settings import HashAlgo
+from fileidentification.tasks.hashing import hash_file
+from fileidentification.tasks.workers import ordered_map
+
+# number of files a worker identifies per task, keeps the ipc overhead small on many small files
+BATCHSIZE = 64
+
+
+def _siegfried(path: Path) -> SfInfo:
+    """Analyse a file with pygfried"""
+    record: dict[str, Any] = pygfried.identify(f"{path}", detailed=True)["files"][0]  # type: ignore[assignment]
+    return SfInfo(**record)
+
+
+def _identify_batch(paths: tuple[Path, ...]) -> list[SfInfo]:
+    return [_siegfried(path) for path in paths]
+
+
+def _add_hash(sfinfo: SfInfo, algo: HashAlgo, use_mmap: bool, fixity: bool = True) -> SfInfo:
+    sfinfo.hash_algo = None if algo == HashAlgo.MD5 else algo
+    if fixity:
+        sfinfo.md5 = hash_file(sfinfo.filename, algo, use_mmap)
+    return sfinfo
+
+
+def identify_file(path: Path, algo: HashAlgo = HashAlgo.MD5, use_mmap: bool = False) -> SfInfo:
+    """Analyse a file with pygfried and hash it, returns its metadata as SfInfo"""
+    return _add_hash(_siegfried(path), algo, use_mmap)
+
+
+def identify_files(
+    paths: Iterable[Path], jobs: int = 1, algo: HashAlgo = HashAlgo.MD5, use_mmap: bool = False, fixity: bool = True
+) -> Iterator[SfInfo]:
+    """
+    Analyse the files with pygfried, hash them and yield their metadata as SfInfo, in the order of the paths.
+    :param paths the files to analyse, can be a lazy iterator
+    :param jobs the number of workers. the files are sent in batches to jobs processes for the identification,
+    while jobs threads hash the already identified files
+    :param algo the hash algorithm
+    :param use_mmap if true, the files are memory mapped for hashing
+    :param fixity if false, the files are not hashed, see hash_duplicates
+    """
+    if jobs <= 1:
+        yield from (_add_hash(_siegfried(path), algo, use_mmap, fixity) for path in paths)
+        return
+    batches = ordered_map(_identify_batch, batched(paths, BATCHSIZE), jobs, processes=True)
+    yield from ordered_map(
+        partial(_add_hash, algo=algo, use_mmap=use_mmap, fixity=fixity), chain.from_iterable(batches), jobs
+    )
@@ -0,0 +1,46 @@
+import json
+import os
+from collections.abc import Iterable
+from datetime import datetime
+from pathlib import Path
+
+from fileidentification.definitions.models import SfInfo
+
+# size, mtime in ns, inode of a file
+IndexEntry = tuple[int, int, int]
+
+
+def index_entry(stat: os.stat_result) -> IndexEntry:
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def load_index(path: Path) -> dict[str, IndexEntry]:
+    """Load the file index (filename relative to the root folder -> size, mtime, inode), empty if there is none"""
+    if not path.is_file():
+        return {}
+    return {k: (v[0], v[1], v[2]) for k, v in json.loads(path.read_text())["files"].items()}
+
+
+def write_index(path: Path, sfinfos: Iterable[SfInfo]) -> None:
+    """Write the file index of the files in the root folder"""
+    index: dict[str, IndexEntry] = {}
+    for sfinfo in sfinfos:
+        try:
+            index[f"{sfinfo.filename}"] = index_entry((sfinfo.root_folder / sfinfo.filename).stat())
+        except OSError:
+            continue
+    path.write_text(json.dumps({"files": index}))
+
+
+def is_unchanged(filesize: int, modified: str, stat: os.stat_result, entry: IndexEntry | None) -> bool:
+    """
+    Compare a file against its entry in the index. if it has no entry (e.g. the log was written without index),
+    fall back on the size and the modification time (in seconds) reported by siegfried.
+    """
+    if entry:
+        return entry == index_entry(stat)
+    try:
+        timestamp = datetime.fromisoformat(modified).timestamp()
+    except ValueError:
+        return False
+    return filesize == stat.st_size and int(timestamp) == int(stat.st_mtime)
@@ -1,41 +1,104 @@
+from collections.abc import Iterable, Iterator
+from functools import partial
+from itertools import batched, chain
+
 from typer import colors, secho
 
-from fileidentification.definitions.models import LogMsg, LogTables, Policies, SfInfo
+from fileidentification.definitions.models import DecodeParams, LogMsg, LogTables, Policies, SfInfo
 from fileidentification.definitions.settings import FMT2EXT, Bin, FDMsg, FPMsg, REencMsg
+from fileidentification.tasks.hashing import ensure_hash
 from fileidentification.tasks.os_tasks import remove
-from fileidentification.wrappers.ffmpeg import ffmpeg_collect_warnings
-from fileidentification.wrappers.imagemagick import imagemagick_collect_warnings
+from fileidentification.tasks.workers import PREFETCH, ordered_map
+from fileidentification.wrappers.cache import MAXSIZE
+from fileidentification.wrappers.capture import error_codes
+from fileidentification.wrappers.ffmpeg import ffmpeg_collect_warnings, ffmpeg_prefetch
+from fileidentification.wrappers.imagemagick import imagemagick_collect_warnings, imagemagick_prefetch
+from fileidentification.wrappers.process import timed_out
+
+# files whose probes are prefetched at once, images per identify
+IMBATCH = 64
+
+
+def probe_files(
+    sfinfos: Iterable[SfInfo],
+    policies: Policies,
+    log_tables: LogTables,
+    verbose: bool,
+    jobs: int = 1,
+    decode: DecodeParams | None = None,
+) -> Iterator[tuple[SfInfo, FDMsg | None]]:
+    """
+    Inspect the files concurrently, yields each sfinfo with the result of its inspection in the order of sfinfos.
+    every file is inspected with its own logtables, which are merged into log_tables in that order too.
+    :param sfinfos the metadata of the files to inspect
+    :param policies the policies
+    :param log_tables the logtables
+    :param verbose if true it does more detailed inspections
+    :param jobs the number of files probed at once
+    :param decode how much of the video and audio files is decoded in verbose mode, all of it if None
+    """
+    # the files are probed in batches ahead of the inspection, which then takes their output from the cache. the
+    # batches in flight are bounded by the cache (with room for the files being inspected), so that no output is
+    # dropped before it is used
+    batchsize = max(1, min(IMBATCH, MAXSIZE // (2 * jobs * PREFETCH)))
+    prefetch = partial(_prefetch, policies=policies, verbose=verbose)
+    prefetched = ordered_map(prefetch, batched(sfinfos, batchsize), jobs)
+    probe = partial(_probe, policies=policies, verbose=verbose, decode=decode)
+    for sfinfo, res, file_log_tables in ordered_map(probe, chain.from_iterable(prefetched), jobs):
+        log_tables.merge(file_log_tables)
+        yield sfinfo, res
+
+
+def _prefetch(sfinfos: tuple[SfInfo, ...], policies: Policies, verbose: bool) -> tuple[SfInfo, ...]:
+    """Run the ffprobes of the batch at once on the engine and the images through a single identify"""
+    files: dict[str, list[SfInfo]] = {Bin.FFMPEG: [], Bin.MAGICK: []}
+    for sfinfo in sfinfos:
+        if sfinfo.processed_as and (pbin := _probe_bin(sfinfo, policies)) in files:
+            files[pbin].append(sfinfo)
+    ffmpeg_prefetch([(sfinfo.path, sfinfo.md5) for sfinfo in files[Bin.FFMPEG]])
+    imagemagick_prefetch([(sfinfo.path, sfinfo.md5) for sfinfo in files[Bin.MAGICK]], verbose)
+    return sfinfos
+
+
+def _probe(
+    sfinfo: SfInfo, policies: Policies, verbose: bool, decode: DecodeParams | None
+) -> tuple[SfInfo, FDMsg | None, LogTables]:
+    log_tables = LogTables()
+    return sfinfo, inspect_file(sfinfo, policies, log_tables, verbose, decode), log_tables
 
 
 def assert_file_integrity(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, verbose: bool) -> None:
-    res: FDMsg | None = inspect_file(sfinfo, policies, log_tables, verbose)
+    resolve_integrity(sfinfo, inspect_file(sfinfo, policies, log_tables, verbose), log_tables)
+
+
+def resolve_integrity(sfinfo: SfInfo, res: FDMsg | None, log_tables: LogTables) -> None:
+    """Move a corrupt file to the tmp dir, or fix its extension, according to the result of its inspection"""
     if res == FDMsg.ERROR:
         remove(sfinfo, log_tables)
     if res == FDMsg.EXTMISMATCH:
-        if len(FMT2EXT[sfinfo.processed_as]["file_extensions"]) == 1:  # type: ignore[index]
-            ext = "." + FMT2EXT[sfinfo.processed_as]["file_extensions"][-1]  # type: ignore[index]
+        if len(FMT2EXT[sfinfo.processed_as].file_extensions) == 1:  # type: ignore[index]
+            ext = "." + FMT2EXT[sfinfo.processed_as].file_extensions[-1]  # type: ignore[index]
             _rename(sfinfo, ext, log_tables)
         else:
             secho(f"\nWARNING: you should manually rename {sfinfo.filename}", fg=colors.YELLOW)
             secho(f"{sfinfo.processing_logs[0].msg}", fg=colors.YELLOW)
 
 
-def inspect_file(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, verbose: bool) -> FDMsg | None:
+def inspect_file(
+    sfinfo: SfInfo, policies: Policies, log_tables: LogTables, verbose: bool, decode: DecodeParams | None = None
+) -> FDMsg | None:
     if not sfinfo.processed_as:
         msg = LogMsg(name="filehandler", msg=f"{FPMsg.PUIDFAIL} for {sfinfo.filename}")
         log_tables.processing_errors.append((msg, sfinfo))
         return None
 
     # select bin out of mimetype if not specified in policies
-    pbin = policies[sfinfo.processed_as].bin if sfinfo.processed_as in policies else ""
-    if pbin == "" and sfinfo.matches[0]["mime"] != "":  # noqa: SIM102
-        if sfinfo.matches[0]["mime"].split("/")[0] in ["image", "audio", "video"]:
-            mime = sfinfo.matches[0]["mime"].split("/")[0]
-            pbin = Bin.MAGICK if mime == "image" else Bin.FFMPEG
-            msgm = f"bin not specified in policies, using {pbin} according to the file mimetype for probing"
-            sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msgm))
+    pbin = _probe_bin(sfinfo, policies)
+    if pbin and (sfinfo.processed_as not in policies or policies[sfinfo.processed_as].bin == ""):
+        msgm = f"bin not specified in policies, using {pbin} according to the file mimetype for probing"
+        sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msgm))
     # check if the file throws any error, warnings while open/processing it with the respective bin
-    if _has_error(sfinfo, pbin, log_tables, verbose):
+    if _has_error(sfinfo, pbin, log_tables, verbose, decode):
         return FDMsg.ERROR
 
     if sfinfo.errors == FDMsg.EMPTYSOURCE:
@@ -45,7 +108,7 @@ def inspect_file(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, verb
 
     # extension mismatch
     if sfinfo.matches[0]["warning"] == FDMsg.EXTMISMATCH:
-        msg_txt = f"expecting one of the following ext: {list(FMT2EXT[sfinfo.processed_as]['file_extensions'])}"
+        msg_txt = f"expecting one of the following ext: {list(FMT2EXT[sfinfo.processed_as].file_extensions)}"
         sfinfo.processing_logs.append(LogMsg(name="filehandler", msg=msg_txt))
         log_tables.diagnostics_add(sfinfo, FDMsg.EXTMISMATCH)
         return FDMsg.EXTMISMATCH
@@ -53,11 +116,21 @@ def inspect_file(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, verb
     return None
 
 
+def _probe_bin(sfinfo: SfInfo, policies: Policies) -> str:
+    """Return the bin to probe the file with, the one of the policies or else the one for its mimetype"""
+    pbin = policies[sfinfo.processed_as].bin if sfinfo.processed_as in policies else ""
+    if pbin == "" and sfinfo.matches and sfinfo.matches[0]["mime"] != "":  # noqa: SIM102
+        if sfinfo.matches[0]["mime"].split("/")[0] in ["image", "audio", "video"]:
+            mime = sfinfo.matches[0]["mime"].split("/")[0]
+            pbin = Bin.MAGICK if mime == "image" else Bin.FFMPEG
+    return pbin
+
+
 def _rename(sfinfo: SfInfo, ext: str, log_tables: LogTables) -> None:
     dest = sfinfo.path.with_suffix(ext)
     # if a file with same name and extension already there, append file hash to name
     if dest.is_file():
-        dest = sfinfo.path.parent / f"{sfinfo.path.stem}_{sfinfo.md5[:6]}{ext}"
+        dest = sfinfo.path.parent / f"{sfinfo.path.stem}_{ensure_hash(sfinfo)[:6]}{ext}"
     try:
         sfinfo.path.rename(dest)
         msg = f"did rename {sfinfo.path.name} -> {dest.name}"
@@ -68,7 +141,9 @@ def _rename(sfinfo: SfInfo, ext: str, log_tables: LogTables) -> None:
         log_tables.processing_errors.append((LogMsg(name="filehandler", msg=str(e)), sfinfo))
 
 
-def _has_error(sfinfo: SfInfo, pbin: str, log_tables: LogTables, verbose: bool) -> bool:
+def _has_error(
+    sfinfo: SfInfo, pbin: str, log_tables: LogTables, verbose: bool, decode: DecodeParams | None = None
+) -> bool:
     """
     Check if the file throws any error or warning while opening or playing.
     returns True if file is corrupt
@@ -76,18 +151,23 @@ def _has_error(sfinfo: SfInfo, pbin: str, log_tables: LogTables, verbose: bool)
     :param pbin the exec to probe the file
     :param log_tables the logtables
     :param verbose if true it does more detailed inspections
+    :param decode how much of a video or audio file is decoded in verbose mode, all of it if None
     """
 
     # get the specs and errors
     match pbin:
         case Bin.FFMPEG:
-            error, stderr, specs = ffmpeg_collect_warnings(sfinfo.path, verbose=verbose)
+            error, undecided, stderr, specs, decoded = ffmpeg_collect_warnings(sfinfo.path, verbose, sfinfo.md5, decode)
+            # so that a full decode can be run later, e.g. on the files with warnings
+            if decoded:
+                sfinfo.processing_logs.append(LogMsg(name=pbin, msg=f"{FPMsg.PARTIALDECODE}, decoded {decoded}"))
             # see if warning needs file to be re-encoded
             if any(msg in stderr for msg in REencMsg):
                 sfinfo.processing_logs.append(LogMsg(name="filehandler", msg="file flagged for reencoding"))
                 sfinfo.status.pending = True
         case Bin.MAGICK:
-            error, stderr, specs = imagemagick_collect_warnings(sfinfo.path, verbose=verbose)
+            error, stderr, specs = imagemagick_collect_warnings(sfinfo.path, verbose=verbose, md5=sfinfo.md5)
+            undecided = timed_out(stderr)
         case _:
             # returns False if bin is soffice or empty string (means no tests)
             # TODO: inspection for other files than Audio/Video/IMAGE
@@ -95,12 +175,17 @@ def _has_error(sfinfo: SfInfo, pbin: str, log_tables: LogTables, verbose: bool)
 
     if specs and not sfinfo.media_info:
         sfinfo.media_info.append(LogMsg(name=pbin, msg=specs))
-    if error:
-        sfinfo.warnings.append(LogMsg(name=pbin, msg=stderr))
+    if stderr or error:
+        sfinfo.warnings.append(LogMsg(name=pbin, msg=stderr, codes=error_codes(stderr)))
+    # the file is judged by its probe, also if the decode in verbose mode timed out
+    if error and not undecided:
         log_tables.diagnostics_add(sfinfo, FDMsg.ERROR)
         return True
+    # the file could not be probed within the timeout of the bin (it is not judged), or the decode timed out
+    if undecided or timed_out(stderr):
+        log_tables.diagnostics_add(sfinfo, FDMsg.TIMEOUT)
+        return False
     # if warnings but file is readable
     if stderr:
-        sfinfo.warnings.append(LogMsg(name=pbin, msg=stderr))
         log_tables.diagnostics_add(sfinfo, FDMsg.WARNING)
     return False
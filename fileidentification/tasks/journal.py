@@ -0,0 +1,265 @@
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from fileidentification.definitions.models import CheckpointParams, LogMsg, LogTables, SfInfo
+from fileidentification.tasks.stack import Stack
+
+JOURNALVERSION = 1
+HEADER = '{"header"'
+RESUMED = '{"resumed"'
+# bytes in which the end of a journal is read
+CHUNK = 1 << 16
+
+# the stages in the order of a run, a file that a stage journaled was handled by the stages before it as well
+STAGES = ["scan", "rescan", "duplicates", "inspect", "integrity", "policies", "convert", "stream", "move"]
+
+
+class Record(NamedTuple):
+    """
+    A change of a file: its row in the stack, the stage that made it, the fields that it changed (all of them if the
+    file was added to the stack) and whether the file was dropped from the stack, or a processing error of the file
+    with all its fields
+    """
+
+    row: int | None
+    stage: str
+    fields: dict[str, Any]
+    drop: bool = False
+    error: LogMsg | None = None
+
+
+class Journal:
+    """
+    The journal of a run. every change of a file in the stack (see Stack.journal) is appended as a json line
+    with the row of the file, the stage that made it and the fields it changed, so that a run that was interrupted
+    can be resumed (see FileHandler._resume), as well as the processing errors (see follow). the lines are written
+    and synced to disk at the checkpoints, after a number of changes or seconds, a line that was cut by a crash is
+    dropped when it is read.
+    """
+
+    def __init__(
+        self, path: Path, stack: Stack, checkpoint: CheckpointParams, base: dict[str, Any] | None = None
+    ) -> None:
+        """
+        :param path the path of the journal
+        :param stack the stack whose changes are journaled
+        :param checkpoint how often the journal is written to disk
+        :param base what the stack was loaded from before the run changed it (see base), the journal is
+        continued if None, e.g. when a run is resumed
+        """
+        self.path = path
+        self.stage = ""
+        self._stack = stack
+        self._checkpoint = checkpoint
+        self._lines: list[str] = []
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._handled = bytearray()
+        self._resumed: set[str] = set()
+        self._log_tables: LogTables | None = None
+        self._errors = 0
+        if base is None:
+            _truncate(path)
+            self._f = path.open("a")
+            self._lines.append(json.dumps({"resumed": {"created": f"{datetime.now(UTC)}"}}))
+        else:
+            self._f = path.open("w")
+            header = {"version": JOURNALVERSION, "created": f"{datetime.now(UTC)}", "base": base}
+            self._lines.append(json.dumps({"header": header}))
+        self.checkpoint()
+        if checkpoint.seconds > 0:
+            # the changes are written after the seconds even if the run waits, e.g. for a long conversion
+            threading.Thread(target=self._tick, name="fileidentification-journal", daemon=True).start()
+
+    def _tick(self) -> None:
+        while not self._closed.wait(self._checkpoint.seconds):
+            if time.monotonic() - self._last >= self._checkpoint.seconds:
+                self.checkpoint()
+
+    def follow(self, log_tables: LogTables) -> None:
+        """Journal the processing errors that are added to log_tables from here on, at the checkpoints"""
+        self._log_tables = log_tables
+        self._errors = len(log_tables.processing_errors)
+
+    def _fields(self, sfinfo: SfInfo, defaults: bool = True) -> dict[str, Any]:
+        """Return the fields of sfinfo as json, the file it is derived from as its row if it is in the stack"""
+        fields = sfinfo.model_dump(mode="json", exclude={"derived_from"}, exclude_defaults=not defaults)
+        if parent := sfinfo.derived_from:
+            linked = parent.rowid is not None and parent.rowid in self._stack
+            fields["derived_from"] = parent.rowid if linked else parent.model_dump(mode="json", exclude_none=True)
+        elif defaults:
+            fields["derived_from"] = None
+        return fields
+
+    def record(self, sfinfo: SfInfo, drop: bool = False, before: SfInfo | None = None) -> None:
+        """
+        Journal a change of a file in the stack: the fields that differ from before (all of them if None),
+        drop if it was removed from the stack
+        """
+        line: dict[str, Any] = {"row": sfinfo.rowid, "stage": self.stage}
+        if drop:
+            line["drop"] = True
+        elif before:
+            old = self._fields(before)
+            line["fields"] = {name: value for name, value in self._fields(sfinfo).items() if old.get(name) != value}
+        else:
+            line["fields"] = self._fields(sfinfo, defaults=False)
+        with self._lock:
+            self._lines.append(json.dumps(line))
+            due = len(self._lines) >= self._checkpoint.files
+        if due:
+            self.checkpoint()
+            # the stack is persisted (if it is not kept in memory) as far as it is journaled, never ahead of it
+            self._stack.commit()
+
+    def checkpoint(self, last: bool = False) -> None:
+        """Write the changes journaled since the last checkpoint and sync them to disk"""
+        with self._lock:
+            self._last = time.monotonic()
+            if self._log_tables:
+                for msg, sfinfo in self._log_tables.processing_errors[self._errors :]:
+                    # a file gets its row when it is added to the stack, e.g. after it was streamed through the stages
+                    if sfinfo.rowid is None and not last:
+                        break
+                    fields = sfinfo.model_dump(mode="json", exclude_none=True)
+                    error = {"row": sfinfo.rowid, "stage": self.stage, "error": msg.model_dump(mode="json")}
+                    self._lines.append(json.dumps({**error, "fields": fields}))
+                    self._errors += 1
+            if not self._lines or self._f.closed:
+                return
+            self._f.write("\n".join(self._lines) + "\n")
+            self._lines = []
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self, remove: bool = False) -> None:
+        """Write the last changes, remove the journal if the run is complete (its log is written)"""
+        self._closed.set()
+        self.checkpoint(last=True)
+        with self._lock:
+            self._f.close()
+        if remove:
+            self.path.unlink(missing_ok=True)
+
+    def handle(self, stage: str, sfinfo: SfInfo) -> None:
+        """Remember the stage of the run that is resumed that changed a file last, e.g. while it is replayed"""
+        rowid = sfinfo.rowid or 0
+        if rowid >= len(self._handled):
+            self._handled.extend(bytes(rowid + 1 - len(self._handled)))
+        if stage in STAGES:
+            self._handled[rowid] = STAGES.index(stage) + 1
+
+    def unhandled(self, stage: str, sfinfos: Iterator[SfInfo]) -> Iterator[SfInfo]:
+        """
+        Return the sfinfos without the ones the run that is resumed handled in stage (or in a stage after it).
+        only the first time per stage, e.g. the conversions that failed are converted again with --convert
+        """
+        if stage in self._resumed or not self._handled:
+            return sfinfos
+        self._resumed.add(stage)
+        return (sfinfo for sfinfo in sfinfos if not self.handled(stage, sfinfo))
+
+    def handled(self, stage: str, sfinfo: SfInfo) -> bool:
+        """Return True if the run that is resumed handled the file in stage (or in a stage after it)"""
+        rowid = sfinfo.rowid or 0
+        return rowid < len(self._handled) and self._handled[rowid] > STAGES.index(stage)
+
+
+def _truncate(path: Path) -> None:
+    """Cut the line that the run that was interrupted did not write completely, if any"""
+    with path.open("rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - CHUNK, 0)
+            f.seek(start)
+            if (newline := f.read(end - start).rfind(b"\n")) >= 0:
+                f.truncate(start + newline + 1)
+                return
+            end = start
+        f.truncate(0)
+
+
+def base(path: Path | None, catalog: bool) -> dict[str, Any]:
+    """
+    Return what the stack of a run was loaded from, before the changes in the journal: the catalog, the log at path
+    (with its size and modification time, to tell if it was written after the journal) or nothing
+    """
+    if catalog:
+        return {"catalog": True}
+    if not path:
+        return {}
+    stat = path.stat()
+    return {"log": f"{path}", "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_base(path: Path) -> dict[str, Any] | None:
+    """Return the base of the journal at path (see base), None if it cannot be read"""
+    try:
+        with path.open() as f:
+            header = f.readline()
+    except OSError:
+        return None
+    if not header.startswith(HEADER):
+        return None
+    if json.loads(header)["header"]["version"] > JOURNALVERSION:
+        raise ValueError(f"{path} was written by a newer version of fileidentification")  # noqa: EM102, TRY003
+    base: dict[str, Any] = json.loads(header)["header"]["base"]
+    return base
+
+
+def read_journal(path: Path) -> Iterator[Record | None]:
+    """
+    Read the changes in the journal at path one by one, yields None where the run was resumed: the rows of the
+    changes after it are the rows of the stack as it was rebuilt from the changes before it.
+    """
+    with path.open() as f:
+        for line in f:
+            if line.startswith(RESUMED):
+                yield None
+            elif line.strip() and not line.startswith(HEADER):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line of a journal that was interrupted while writing
+                    return
+                error = LogMsg(**record["error"]) if "error" in record else None
+                yield Record(record["row"], record["stage"], record.get("fields", {}), "drop" in record, error)
+
+
+def replay(stack: Stack, record: Record, rows: dict[int | None, int | None]) -> SfInfo | None:
+    """
+    Apply a change in the journal to the stack, returns the sfinfo after it (None if the file was dropped)
+    :param stack the stack as it was loaded by the run that is resumed, with the changes before record
+    :param record the change, see read_journal
+    :param rows the rows of the run that is resumed -> the rows of the stack, the rows the change adds are added
+    """
+    rowid = rows.get(record.row, record.row if record.row in stack else None)
+    current = stack.get(rowid) if rowid is not None else None
+    if record.drop:
+        if current:
+            stack.remove([current])
+        return None
+    fields = dict(record.fields)
+    parent = fields.pop("derived_from", current.derived_from if current else None)
+    data = current.model_dump(mode="json", exclude={"derived_from"}) if current else {}
+    sfinfo = SfInfo.model_validate({**data, **fields})
+    sfinfo.rowid = rowid
+    if isinstance(parent, int):
+        parent_row = rows.get(parent, parent if parent in stack else None)
+        sfinfo.derived_from = stack.get(parent_row) if parent_row is not None else None
+    elif isinstance(parent, dict):
+        sfinfo.derived_from = SfInfo.model_validate(parent)
+    else:
+        sfinfo.derived_from = parent
+    if not sfinfo.status.removed:
+        sfinfo.set_processing_paths(stack.root_folder, stack.tdir, initial=False)
+    stack.update(sfinfo)
+    rows[record.row] = sfinfo.rowid
+    return sfinfo
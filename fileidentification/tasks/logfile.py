@@ -0,0 +1,101 @@
+import json
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Self
+
+from fileidentification.definitions.models import LogOutput, SfInfo
+from fileidentification.definitions.settings import LogFormat
+
+LOGVERSION = 1
+HEADER = '{"header"'
+TRAILER = '{"trailer"'
+
+
+class LogWriter:
+    """
+    Write a log as json lines: a header record, one sfinfo per line and a trailer record with the duplicates
+    and the processing errors. the trailer is only written if the writer exits without an exception,
+    so a log without trailer is incomplete.
+    """
+
+    def __init__(self, path: Path, atomic: bool = False) -> None:
+        """
+        :param path the path of the log
+        :param atomic if true, the log is written to a tmp file that replaces path once it is complete,
+        otherwise the records are written directly to path (and can be read back after a crash)
+        """
+        self.path = path
+        self.trailer = LogOutput(duplicates=None)
+        self.count = 0
+        self._dest = path.with_name(f".{path.name}.tmp") if atomic else path
+        self._f = self._dest.open("w")
+        self._write({"header": {"version": LOGVERSION, "created": f"{datetime.now(UTC)}"}})
+
+    def _write(self, record: dict[str, Any]) -> None:
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write(self, sfinfo: SfInfo) -> None:
+        self._f.write(sfinfo.model_dump_json(exclude_none=True) + "\n")
+        self.count += 1
+
+    def close(self, complete: bool = True) -> None:
+        if complete:
+            self._write({"trailer": {"count": self.count, **self.trailer.model_dump(mode="json", exclude_none=True)}})
+        self._f.close()
+        if complete and self._dest != self.path:
+            self._dest.replace(self.path)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> None:
+        self.close(complete=exc_type is None)
+
+
+class LogReader:
+    """
+    Read a log as a stream of sfinfos. the json lines log is parsed line by line, the (legacy) json log as a whole.
+    the duplicates and errors are available in trailer once all sfinfos are read.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.trailer: LogOutput | None = None
+
+    @property
+    def complete(self) -> bool:
+        return self.trailer is not None
+
+    def __iter__(self) -> Iterator[SfInfo]:
+        if self.path.suffix == f".{LogFormat.JSON}":
+            log = json.loads(self.path.read_text())
+            self.trailer = LogOutput(duplicates=log.get("duplicates"), errors=log.get("errors"))
+            yield from (SfInfo(**metadata) for metadata in log["files"])
+            return
+
+        with self.path.open() as f:
+            for line in f:
+                if line.startswith(HEADER):
+                    if json.loads(line)["header"]["version"] > LOGVERSION:
+                        raise ValueError(f"{self.path} was written by a newer version of fileidentification")  # noqa: EM102, TRY003
+                elif line.startswith(TRAILER):
+                    self.trailer = LogOutput(**json.loads(line)["trailer"])
+                elif line.strip():
+                    try:
+                        sfinfo = SfInfo.model_validate_json(line)
+                    except ValueError:
+                        # the last line of a log that was interrupted while writing
+                        return
+                    yield sfinfo
+
+
+def find_log(path: Path) -> Path | None:
+    """Return path if the log exists, otherwise the log in the other format if that exists"""
+    for candidate in [path, *(path.with_suffix(f".{fmt}") for fmt in LogFormat)]:
+        if candidate.is_file():
+            return candidate
+    return None
@@ -5,7 +5,18 @@ from pathlib import Path
 from typer import colors, secho
 
 from fileidentification.definitions.models import FilePaths, LogMsg, LogTables, Policies, SfInfo
-from fileidentification.definitions.settings import LOGJSON, POLJSON, RMV_DIR, TMP_DIR
+from fileidentification.definitions.settings import (
+    CATALOG,
+    INDEXJSON,
+    JOURNAL,
+    LOGJSON,
+    POLJSON,
+    RMV_DIR,
+    TMP_DIR,
+    LogFormat,
+)
+from fileidentification.tasks.progress import StageProgress
+from fileidentification.tasks.stack import Stack
 
 
 def remove(sfinfo: SfInfo, log_tables: LogTables) -> None:
@@ -22,40 +33,51 @@ def remove(sfinfo: SfInfo, log_tables: LogTables) -> None:
         log_tables.processing_errors.append((LogMsg(name="filehandler", msg=str(e)), sfinfo))
 
 
-def move_tmp(stack: list[SfInfo], policies: Policies, log_tables: LogTables, remove_original: bool) -> bool:
+def move_tmp(
+    stack: Stack,
+    policies: Policies,
+    log_tables: LogTables,
+    remove_original: bool,
+    progress: StageProgress | None = None,
+) -> bool:
     write_logs: bool = False
 
-    for sfinfo in stack:
-        # if it has a dest, it needs to be moved
-        if sfinfo.dest:
-            write_logs = True
-            # remove the original if its mentioned and flag it accordingly
-            if policies[sfinfo.derived_from.processed_as].remove_original or remove_original:  # type: ignore[index, union-attr]
-                derived_from = next(sfi for sfi in stack if sfi.filename == sfinfo.derived_from.filename)  # type: ignore[union-attr]
-                if derived_from.path.is_file():
-                    remove(derived_from, log_tables)
-            # create absolute filepath
-            abs_dest = sfinfo.root_folder / sfinfo.dest / sfinfo.filename.name
-            # append hash to filename if the path already exists
-            if abs_dest.is_file():
-                abs_dest = Path(abs_dest.parent, f"{sfinfo.filename.stem}_{sfinfo.md5[:6]}{sfinfo.filename.suffix}")
-            # move the file
-            try:
-                shutil.move(sfinfo.filename, abs_dest)
-                if sfinfo.filename.parent.is_dir():
-                    shutil.rmtree(sfinfo.filename.parent)
-                # set relative path in sfinfo.filename, set flags
-                sfinfo.filename = sfinfo.dest / abs_dest.name
-                sfinfo.status.added = True
-                sfinfo.dest = None
-            except OSError as e:
-                secho(f"{e}", fg=colors.RED)
-                log_tables.processing_errors.append((LogMsg(name="filehandler", msg=str(e)), sfinfo))
+    # if it has a dest, it needs to be moved
+    for sfinfo in stack.converted():
+        write_logs = True
+        # remove the original if its mentioned and flag it accordingly
+        if policies[sfinfo.derived_from.processed_as].remove_original or remove_original:  # type: ignore[index, union-attr]
+            derived_from = stack.parent(sfinfo)
+            if derived_from and derived_from.path.is_file():
+                remove(derived_from, log_tables)
+                stack.update(derived_from)
+        # create absolute filepath
+        abs_dest = sfinfo.root_folder / sfinfo.dest / sfinfo.filename.name  # type: ignore[operator]
+        # append hash to filename if the path already exists
+        if abs_dest.is_file():
+            abs_dest = Path(abs_dest.parent, f"{sfinfo.filename.stem}_{sfinfo.md5[:6]}{sfinfo.filename.suffix}")
+        # move the file
+        try:
+            shutil.move(sfinfo.filename, abs_dest)
+            if sfinfo.filename.parent.is_dir():
+                shutil.rmtree(sfinfo.filename.parent)
+            # set relative path in sfinfo.filename, set flags
+            sfinfo.filename = sfinfo.dest / abs_dest.name  # type: ignore[operator]
+            sfinfo.status.added = True
+            sfinfo.dest = None
+            stack.update(sfinfo)
+        except OSError as e:
+            secho(f"{e}", fg=colors.RED)
+            log_tables.processing_errors.append((LogMsg(name="filehandler", msg=str(e)), sfinfo))
+        if progress:
+            progress.advance(sfinfo.filesize)
 
     return write_logs
 
 
-def set_filepaths(fp: FilePaths, root_folder: Path, tmp_dir: Path | None = None) -> None:
+def set_filepaths(
+    fp: FilePaths, root_folder: Path, tmp_dir: Path | None = None, log_format: LogFormat = LogFormat.JSON
+) -> None:
     # assert rootfolder
     if root_folder.__fspath__() == "." or not root_folder.exists():
         secho("root folder not found", fg=colors.RED)
@@ -71,5 +93,8 @@ def set_filepaths(fp: FilePaths, root_folder: Path, tmp_dir: Path | None = None)
     if not fp.TMP_DIR.is_dir():
         fp.TMP_DIR.mkdir(parents=True)
 
-    fp.LOGJSON = fp.TMP_DIR / LOGJSON
+    fp.LOGJSON = (fp.TMP_DIR / LOGJSON).with_suffix(f".{log_format}")
     fp.POLJSON = fp.TMP_DIR / POLJSON
+    fp.INDEXJSON = fp.TMP_DIR / INDEXJSON
+    fp.CATALOG = fp.TMP_DIR / CATALOG
+    fp.JOURNAL = fp.TMP_DIR / JOURNAL
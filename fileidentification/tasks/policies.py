@@ -1,7 +1,10 @@
+import json
+from typing import Any
+
 from typer import colors, secho
 
 from fileidentification.definitions.models import LogMsg, LogTables, Policies, SfInfo
-from fileidentification.definitions.settings import PLMsg
+from fileidentification.definitions.settings import Bin, PLMsg
 from fileidentification.tasks.os_tasks import remove
 from fileidentification.wrappers.ffmpeg import ffmpeg_media_info
 
@@ -34,9 +37,18 @@ def apply_policy(sfinfo: SfInfo, policies: Policies, log_tables: LogTables, stri
         return
 
 
+def _streams(sfinfo: SfInfo) -> dict[str, Any] | None:
+    """Return the streams of the file, from its media info if it was probed during inspection"""
+    for info in sfinfo.media_info:
+        if info.name == Bin.FFMPEG:
+            streams: dict[str, Any] | None = json.loads(info.msg)
+            return streams
+    return ffmpeg_media_info(sfinfo.path, sfinfo.md5)
+
+
 def _has_invalid_streams(sfinfo: SfInfo, puid: str) -> bool:
     """Return true if video and audio codec differ from archival standards"""
-    streams = ffmpeg_media_info(sfinfo.path)
+    streams = _streams(sfinfo)
     if not streams:
         secho(f"\t{sfinfo.filename} throwing errors. consider file", fg=colors.RED, bold=True)
         return False
@@ -0,0 +1,154 @@
+import json
+import sys
+import time
+from types import TracebackType
+from typing import Any, Self
+
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    DownloadColumn,
+    Progress,
+    ProgressColumn,
+    SpinnerColumn,
+    Task,
+    TaskID,
+    TextColumn,
+    TimeRemainingColumn,
+    TransferSpeedColumn,
+)
+from rich.text import Text
+
+# seconds between the progress lines, if the output is not a terminal. none by default, a run that is not
+# attached to a terminal (e.g. a cron job) keeps stderr for the errors
+INTERVAL = 0.0
+
+
+class _Counter:
+    """The files and bytes done of a stage or a bin, out of their totals (None if unknown)"""
+
+    def __init__(self, files: int | None, size: int | None) -> None:
+        self.files = 0
+        self.size = 0
+        self.files_total = files
+        self.size_total = size
+
+    def stats(self, elapsed: float) -> dict[str, Any]:
+        files_per_s = self.files / elapsed if elapsed else 0.0
+        bytes_per_s = self.size / elapsed if elapsed else 0.0
+        # the eta is estimated by the bytes, the files if their size is unknown
+        eta: float | None = None
+        if self.size_total and bytes_per_s:
+            eta = max(self.size_total - self.size, 0) / bytes_per_s
+        elif self.files_total and files_per_s:
+            eta = max(self.files_total - self.files, 0) / files_per_s
+        return {
+            "files": self.files,
+            "files_total": self.files_total,
+            "bytes": self.size,
+            "bytes_total": self.size_total,
+            "files_per_s": round(files_per_s, 2),
+            "mb_per_s": round(bytes_per_s / 1e6, 2),
+            "eta_s": round(eta) if eta is not None else None,
+        }
+
+
+class _FilesColumn(ProgressColumn):
+    """The files done (out of their total) and the files per second"""
+
+    def render(self, task: Task) -> Text:
+        files, total = task.fields["files"], task.fields["files_total"]
+        rate = files / task.elapsed if task.elapsed else 0.0
+        done = f"{files}/{total}" if total is not None else f"{files}"
+        return Text(f"{done} files {rate:.1f}/s", style="progress.download")
+
+
+class StageProgress:
+    """
+    Progress of a stage in files and bytes, with the throughput and the eta. On a terminal it is shown as
+    a progress bar, with a bar per bin if the totals are broken down by bins. Otherwise, it writes a json line
+    to stderr every interval seconds and when the stage is done, e.g. for a scheduler
+    (see README, Options: --progress-interval).
+    :param stage the name of the stage in the json lines
+    :param description the description of the progress bar
+    :param totals the number of files and their size in bytes, None if unknown (e.g. while scanning)
+    :param bins the number of files and their size in bytes per bin
+    :param interval seconds between the json lines, 0 to not write them
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        description: str,
+        totals: tuple[int, int] | None = None,
+        bins: dict[str, tuple[int, int]] | None = None,
+        interval: float = INTERVAL,
+    ) -> None:
+        self.stage = stage
+        self.interval = interval
+        self.total = _Counter(*(totals or (None, None)))
+        self.bins = {name: _Counter(*bin_totals) for name, bin_totals in (bins or {}).items()}
+        self._start = time.monotonic()
+        self._last = self._start
+        self._progress: Progress | None = None
+        self._tasks: dict[str | None, TaskID] = {}
+        console = Console(stderr=True)
+        if console.is_terminal:
+            self._progress = Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                BarColumn(),
+                _FilesColumn(),
+                DownloadColumn(),
+                TransferSpeedColumn(),
+                TimeRemainingColumn(),
+                console=console,
+                transient=True,
+            )
+            rows: list[tuple[str | None, str, _Counter]] = [(None, description, self.total)]
+            rows.extend((name, f"  {name}", counter) for name, counter in self.bins.items())
+            for name, desc, counter in rows:
+                self._tasks[name] = self._progress.add_task(
+                    desc, total=counter.size_total, files=0, files_total=counter.files_total
+                )
+
+    def __enter__(self) -> Self:
+        if self._progress:
+            self._progress.start()
+        else:
+            self._write()
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> None:
+        if self._progress:
+            self._progress.stop()
+        else:
+            self._write(done=exc_type is None)
+
+    def advance(self, size: int, bin_name: str | None = None) -> None:
+        """Count a file of size bytes as done, of the bin bin_name if the stage has bins"""
+        counters: list[tuple[str | None, _Counter]] = [(None, self.total)]
+        if bin_name in self.bins:
+            counters.append((bin_name, self.bins[bin_name]))
+        for name, counter in counters:
+            counter.files += 1
+            counter.size += size
+            if self._progress:
+                self._progress.update(self._tasks[name], advance=size, files=counter.files)
+        if not self._progress and time.monotonic() - self._last >= self.interval:
+            self._write()
+
+    def _write(self, done: bool = False) -> None:
+        """Write the progress as a json line to stderr"""
+        if not self.interval:
+            return
+        self._last = time.monotonic()
+        elapsed = self._last - self._start
+        line: dict[str, Any] = {"stage": self.stage, "done": done, "elapsed_s": round(elapsed, 1)}
+        line.update(self.total.stats(elapsed))
+        if self.bins:
+            line["bins"] = {name: counter.stats(elapsed) for name, counter in self.bins.items()}
+        sys.stderr.write(f"{json.dumps(line)}\n")
+        sys.stderr.flush()
@@ -0,0 +1,135 @@
+import os
+import sys
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+from pathlib import Path
+from queue import Queue
+from tempfile import TemporaryDirectory
+
+from typer import colors, secho
+
+from fileidentification.definitions.models import Policies, PolicyParams, SfInfo
+from fileidentification.definitions.settings import Bin
+from fileidentification.tasks.conversion import convert_documents, convert_file
+from fileidentification.tasks.conversion_cache import ConversionCache
+from fileidentification.tasks.workers import PREFETCH
+
+# every soffice slot runs with its own user profile, LibreOffice does not run concurrently on a shared one
+SOFFICESLOTS = 1
+# documents converted by one soffice invocation
+SOFFICEBATCH = 16
+
+Converted = tuple[SfInfo, SfInfo | None, list[str]]
+
+
+def conversion_slots(jobs: int, specs: list[str] | None = None) -> dict[str, int]:
+    """
+    Return the number of conversions that run at once per bin, none if the files are converted one by one.
+    :param jobs the number of parallel workers, the default for ffmpeg and magick
+    :param specs bin=n to overwrite the default of a bin, e.g. ffmpeg=2
+    """
+    if jobs <= 1 and not specs:
+        return {}
+    slots: dict[str, int] = {Bin.FFMPEG: jobs, Bin.MAGICK: jobs, Bin.SOFFICE: SOFFICESLOTS}
+    for spec in specs or []:
+        name, _, n = spec.partition("=")
+        if name not in slots or not n.isdigit() or int(n) < 1:
+            secho(f"invalid slots {spec}, expected one of {[f'{b}=n' for b in slots]}", fg=colors.RED)
+            sys.exit(1)
+        slots[name] = int(n)
+    return slots
+
+
+def ffmpeg_threads(slots: dict[str, int], cpus: int | None = None) -> int | None:
+    """Return the threads per ffmpeg process, so that the ffmpeg slots share the cpu budget"""
+    if Bin.FFMPEG not in slots:
+        return None
+    return max(1, (cpus or os.cpu_count() or 1) // slots[Bin.FFMPEG])
+
+
+def _batches(sfinfos: Iterable[SfInfo], policies: Policies) -> Iterator[list[SfInfo]]:
+    """
+    Group the documents that share the same soffice policy into batches of distinct names,
+    the other files are passed on one by one
+    """
+    batches: dict[str, list[SfInfo]] = {}
+    for sfinfo in sfinfos:
+        args = policies.get(f"{sfinfo.processed_as}")
+        if not args or args.bin != Bin.SOFFICE:
+            yield [sfinfo]
+            continue
+        key = f"{args.processing_args} {args.target_container}"
+        batch = batches.setdefault(key, [])
+        if any(el.filename.stem == sfinfo.filename.stem for el in batch):
+            yield batch
+            batch = batches[key] = []
+        batch.append(sfinfo)
+        if len(batch) == SOFFICEBATCH:
+            yield batches.pop(key)
+    yield from batches.values()
+
+
+@contextmanager
+def _profile(profiles: Queue[Path]) -> Iterator[Path]:
+    """Take a soffice user profile that is not in use"""
+    profile = profiles.get()
+    try:
+        yield profile
+    finally:
+        profiles.put(profile)
+
+
+def convert_files(
+    sfinfos: Iterable[SfInfo],
+    policies: Policies,
+    slots: dict[str, int],
+    cpus: int | None = None,
+    cache: ConversionCache | None = None,
+) -> Iterator[Converted]:
+    """
+    Convert the files with a pool of workers per bin, yields each sfinfo with the sfinfo of its converted file
+    (None if the conversion failed) and the cmd as soon as its conversion is done. documents are converted in
+    batches, each soffice worker with its own user profile.
+    :param sfinfos the metadata of the files to convert
+    :param policies the policies for fileconversion
+    :param slots the number of conversions that run at once per bin, the files are converted one by one if empty
+    :param cpus the cpu budget, the ffmpeg processes get their share of it as threads
+    :param cache the cache of the conversions, which are reused for duplicates and across runs
+    """
+    threads = ffmpeg_threads(slots, cpus)
+
+    with TemporaryDirectory(prefix="fileidentification_soffice_") as tmp:
+        profiles: Queue[Path] = Queue()
+        for i in range(slots.get(Bin.SOFFICE, 1)):
+            profiles.put(Path(tmp) / f"profile_{i}")
+
+        def run(batch: list[SfInfo]) -> list[Converted]:
+            if len(batch) == 1 and policies.get(f"{batch[0].processed_as}", PolicyParams()).bin != Bin.SOFFICE:
+                return [(batch[0], *convert_file(batch[0], policies, threads, cache=cache))]
+            with _profile(profiles) as profile:
+                converted = convert_documents(batch, policies, profile, cache)
+            return [(sfinfo, *res) for sfinfo, res in zip(batch, converted, strict=True)]
+
+        if not slots:
+            for batch in _batches(sfinfos, policies):
+                yield from run(batch)
+            return
+
+        with ExitStack() as stack:
+            pools = {name: stack.enter_context(ThreadPoolExecutor(n)) for name, n in slots.items()}
+            # bins without a slot (e.g. inkscape) share a single worker
+            default = stack.enter_context(ThreadPoolExecutor(1))
+
+            def submit(batch: list[SfInfo]) -> Future[list[Converted]]:
+                pool = pools.get(f"{policies[batch[0].processed_as].bin}", default)  # type: ignore[index]
+                return pool.submit(run, batch)
+
+            it = _batches(sfinfos, policies)
+            running = {submit(batch) for batch in islice(it, sum(slots.values()) * PREFETCH)}
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                running |= {submit(batch) for batch in islice(it, len(done))}
+                for future in done:
+                    yield from future.result()
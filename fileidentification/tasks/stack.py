@@ -0,0 +1,354 @@
+import sys
+from collections.abc import Callable, Hashable, Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+from fileidentification.definitions.models import LogMsg, SfInfo, Status
+
+# the flags of the status of a record
+REMOVED, PENDING, ADDED = 1, 2, 4
+
+# the fields of a sfinfo that a record keeps as json
+COLD = {"matches", "media_info", "warnings", "processing_logs"}
+
+
+def is_active(sfinfo: SfInfo) -> bool:
+    """Return true if the file is in the root folder, i.e. it is neither removed nor a converted file in the tmp dir"""
+    return not (sfinfo.status.removed or sfinfo.dest)
+
+
+class Cold(BaseModel):
+    """The fields of a sfinfo that are only read when it is materialised"""
+
+    matches: list[dict[str, Any]] = Field(default_factory=list)
+    media_info: list[LogMsg] = Field(default_factory=list[LogMsg])
+    warnings: list[LogMsg] = Field(default_factory=list[LogMsg])
+    processing_logs: list[LogMsg] = Field(default_factory=list[LogMsg])
+
+
+class FileRecord:
+    """
+    The compact form of a sfinfo in the stack. The puids and folders are interned, the checksum is kept as bytes
+    and the matches and logs as json, which is only parsed when the sfinfo is materialised.
+    derived_from is the row of the file it was converted from, or that sfinfo as json if it is not in the stack.
+    """
+
+    __slots__ = (
+        "cold",
+        "derived_from",
+        "dest",
+        "errors",
+        "filesize",
+        "flags",
+        "folder",
+        "hash_algo",
+        "md5",
+        "modified",
+        "name",
+        "processed_as",
+    )
+
+    def __init__(self, sfinfo: SfInfo, derived_from: int | bytes | None) -> None:
+        self.folder = sys.intern(f"{sfinfo.filename.parent}")
+        self.name = sfinfo.filename.name
+        self.filesize = sfinfo.filesize
+        self.modified = sfinfo.modified
+        self.errors = sys.intern(sfinfo.errors)
+        self.md5 = _pack_hex(sfinfo.md5)
+        self.hash_algo = sfinfo.hash_algo
+        self.flags = REMOVED * sfinfo.status.removed + PENDING * sfinfo.status.pending + ADDED * sfinfo.status.added
+        self.processed_as = sys.intern(sfinfo.processed_as) if sfinfo.processed_as else None
+        self.dest = sys.intern(f"{sfinfo.dest}") if sfinfo.dest else None
+        self.derived_from = derived_from
+        cold = sfinfo.model_dump_json(include=COLD, exclude_defaults=True)
+        self.cold = cold.encode() if cold != "{}" else None
+
+    @property
+    def active(self) -> bool:
+        return not (self.flags & REMOVED or self.dest)
+
+
+def _pack_hex(md5: str) -> bytes | str:
+    """Return the checksum as bytes if it is a lowercase hex digest (half the size), otherwise as is"""
+    try:
+        packed = bytes.fromhex(md5)
+    except ValueError:
+        return md5
+    return packed if packed.hex() == md5 else md5
+
+
+def _unpack_hex(md5: bytes | str) -> str:
+    return md5.hex() if isinstance(md5, bytes) else md5
+
+
+def _statuses(record: FileRecord) -> tuple[str, ...]:
+    statuses = ["active"] if record.active else []
+    if record.flags & PENDING:
+        statuses.append("pending")
+    if record.dest:
+        statuses.append("converted")
+    return tuple(statuses)
+
+
+# the keys under which a record is indexed, per index
+INDEXES: dict[str, Callable[[FileRecord], tuple[Hashable, ...]]] = {
+    "filename": lambda record: ((record.folder, record.name),),
+    "md5": lambda record: (record.md5,),
+    "puid": lambda record: (record.processed_as,) if record.processed_as else (),
+    "status": _statuses,
+    # the link of a converted file to the row of the file it is derived from
+    "derived_from": lambda record: (record.derived_from,) if isinstance(record.derived_from, int) else (),
+}
+
+# a bucket of an index is a single row, or the rows in the order they were added
+Bucket = int | dict[int, None]
+
+
+def _add(index: dict[Hashable, Bucket], key: Hashable, rowid: int) -> None:
+    bucket = index.get(key)
+    if bucket is None:
+        index[key] = rowid
+    elif isinstance(bucket, int):
+        index[key] = {bucket: None, rowid: None}
+    else:
+        bucket[rowid] = None
+
+
+def _discard(index: dict[Hashable, Bucket], key: Hashable, rowid: int) -> None:
+    bucket = index[key]
+    if isinstance(bucket, int):
+        del index[key]
+        return
+    del bucket[rowid]
+    if len(bucket) == 1:
+        index[key] = next(iter(bucket))
+
+
+def _rows(bucket: Bucket | None) -> list[int]:
+    if bucket is None:
+        return []
+    return [bucket] if isinstance(bucket, int) else list(bucket)
+
+
+class Stack:
+    """
+    The sfinfos of the files the filehandler processes, kept in memory as compact records (see FileRecord).
+    The stages iterate over one of the views (active, pending, converted) and pass the sfinfos they modified to
+    update, which stores them. The sfinfos are materialised from their records when a view or lookup is queried,
+    like in a stack that is not kept in memory (see Catalog). The records are indexed (see INDEXES), the views and
+    lookups do not scan the whole stack. The changes are passed to journal if it is set (see journal.Journal).
+    """
+
+    def __init__(self, root_folder: Path = Path(), tdir: Path = Path()) -> None:
+        self.root_folder = root_folder.parent if root_folder.is_file() else root_folder
+        self.tdir = tdir
+        # records a change of a file, e.g. Journal.record, with True if it was removed from the stack and the sfinfo
+        # before the change (None if it was added)
+        self.journal: Callable[[SfInfo, bool, SfInfo | None], None] | None = None
+        self._records: dict[int, FileRecord] = {}
+        self._indexes: dict[str, dict[Hashable, Bucket]] = {name: {} for name in INDEXES}
+        self._rowid = 0
+        self._refreshed: dict[int, SfInfo] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[SfInfo]:
+        return self._materialise(list(self._records))
+
+    def __contains__(self, rowid: object) -> bool:
+        return rowid in self._records
+
+    def _index(self, rowid: int, old: FileRecord | None, new: FileRecord | None) -> None:
+        for name, keys in INDEXES.items():
+            index = self._indexes[name]
+            old_keys = keys(old) if old else ()
+            new_keys = keys(new) if new else ()
+            for key in old_keys:
+                if key not in new_keys:
+                    _discard(index, key, rowid)
+            for key in new_keys:
+                if key not in old_keys:
+                    _add(index, key, rowid)
+
+    def _link(self, sfinfo: SfInfo) -> int | bytes | None:
+        """Return the row of the file sfinfo was converted from, or that sfinfo as json if it is not in the stack"""
+        parent = sfinfo.derived_from
+        if not parent:
+            return None
+        if parent.rowid in self._records:
+            return parent.rowid
+        # e.g. a conversion read from the log, its origin is the last file with its filename and checksum
+        md5 = _pack_hex(parent.md5)
+        for rowid in reversed(self._lookup("filename", (f"{parent.filename.parent}", parent.filename.name))):
+            if self._records[rowid].md5 == md5:
+                return rowid
+        return parent.model_dump_json(exclude_none=True).encode()
+
+    def _get(self, rowid: int) -> SfInfo | None:
+        """Return the sfinfo of the row, None if it is not in the stack"""
+        record = self._records.get(rowid)
+        if record is None:
+            return None
+        cold = Cold.model_validate_json(record.cold) if record.cold else Cold()
+        if isinstance(record.derived_from, int):
+            derived_from = self._get(record.derived_from)
+        elif record.derived_from:
+            derived_from = SfInfo.model_validate_json(record.derived_from)
+        else:
+            derived_from = None
+        sfinfo = SfInfo(
+            filename=Path(record.folder, record.name),
+            filesize=record.filesize,
+            modified=record.modified,
+            errors=record.errors,
+            md5=_unpack_hex(record.md5),
+            hash_algo=record.hash_algo,
+            matches=cold.matches,
+            status=Status(
+                removed=bool(record.flags & REMOVED),
+                pending=bool(record.flags & PENDING),
+                added=bool(record.flags & ADDED),
+            ),
+            processed_as=record.processed_as,
+            media_info=cold.media_info,
+            warnings=cold.warnings,
+            processing_logs=cold.processing_logs,
+            derived_from=derived_from,
+            dest=Path(record.dest) if record.dest else None,
+            root_folder=self.root_folder,
+            tdir=self.tdir,
+            rowid=rowid,
+        )
+        if not sfinfo.dest:
+            sfinfo.path = self.root_folder / sfinfo.filename
+        return sfinfo
+
+    def _materialise(self, rowids: list[int]) -> Iterator[SfInfo]:
+        """Materialise the rows one by one, skipping the rows that were removed in the meantime"""
+        for rowid in rowids:
+            if sfinfo := self._get(rowid):
+                yield sfinfo
+
+    def _lookup(self, name: str, key: Hashable) -> list[int]:
+        return _rows(self._indexes[name].get(key))
+
+    def append(self, sfinfo: SfInfo) -> None:
+        self._rowid += 1
+        sfinfo.rowid = self._rowid
+        record = self._records[sfinfo.rowid] = FileRecord(sfinfo, self._link(sfinfo))
+        self._index(sfinfo.rowid, None, record)
+        if self.journal:
+            self.journal(sfinfo, False, None)
+
+    def extend(self, sfinfos: Iterable[SfInfo]) -> None:
+        for sfinfo in sfinfos:
+            self.append(sfinfo)
+
+    def update(self, sfinfo: SfInfo) -> None:
+        """Store the changes made on sfinfo"""
+        if sfinfo.rowid not in self._records:
+            self.append(sfinfo)
+            return
+        before = self._get(sfinfo.rowid) if self.journal else None
+        old = self._records[sfinfo.rowid]
+        new = self._records[sfinfo.rowid] = FileRecord(sfinfo, self._link(sfinfo))
+        self._index(sfinfo.rowid, old, new)
+        if self.journal:
+            self.journal(sfinfo, False, before)
+
+    def get(self, rowid: int) -> SfInfo | None:
+        """Return the sfinfo of the row, None if it is not in the stack"""
+        return self._get(rowid)
+
+    def refresh(self, sfinfo: SfInfo) -> SfInfo:
+        """Return the current state of sfinfo in the stack, a row is refreshed to the same object"""
+        if sfinfo.rowid is None:
+            return sfinfo
+        if sfinfo.rowid not in self._refreshed:
+            self._refreshed[sfinfo.rowid] = self._get(sfinfo.rowid) or sfinfo
+        return self._refreshed[sfinfo.rowid]
+
+    def remove(self, sfinfos: Iterable[SfInfo]) -> None:
+        """Drop the sfinfos from the stack"""
+        for sfinfo in sfinfos:
+            if sfinfo.rowid not in self._records:
+                continue
+            derived = self.derived(sfinfo)
+            self._index(sfinfo.rowid, self._records.pop(sfinfo.rowid), None)
+            if self.journal:
+                self.journal(sfinfo, True, None)
+            # the files converted from it keep a copy of it
+            for el in derived:
+                el.derived_from = sfinfo
+                self.update(el)
+
+    def commit(self) -> None:
+        """Persist the changes of the stack, if it is not kept in memory"""
+
+    def close(self) -> None:
+        """Persist the stack, if it is not kept in memory"""
+
+    # views
+    def active(self) -> Iterator[SfInfo]:
+        """Return the files in the root folder"""
+        return self._materialise(self._lookup("status", "active"))
+
+    def pending(self) -> Iterator[SfInfo]:
+        """Return the files that are pending for conversion"""
+        return self._materialise(self._lookup("status", "pending"))
+
+    def converted(self) -> Iterator[SfInfo]:
+        """Return the converted files in the tmp dir that need to be moved to their destination"""
+        return self._materialise(self._lookup("status", "converted"))
+
+    def totals(self, view: str) -> dict[str | None, tuple[int, int]]:
+        """Return the number of files and their size in bytes per puid of a view (active, pending or converted)"""
+        totals: dict[str | None, tuple[int, int]] = {}
+        for rowid in self._lookup("status", view):
+            record = self._records[rowid]
+            files, size = totals.get(record.processed_as, (0, 0))
+            totals[record.processed_as] = (files + 1, size + record.filesize)
+        return totals
+
+    # lookups
+    def _active(self, rowids: list[int]) -> list[SfInfo]:
+        return list(self._materialise([rowid for rowid in rowids if self._records[rowid].active]))
+
+    def by_filename(self, filename: Path) -> SfInfo | None:
+        """Return the active sfinfo with the filename (relative to the root folder)"""
+        return next(iter(self._active(self._lookup("filename", (f"{filename.parent}", filename.name)))), None)
+
+    def by_md5(self, md5: str) -> list[SfInfo]:
+        """Return the active sfinfos with the checksum md5"""
+        return self._active(self._lookup("md5", _pack_hex(md5)))
+
+    def by_puid(self, puid: str) -> list[SfInfo]:
+        """Return the active sfinfos processed as puid"""
+        return self._active(self._lookup("puid", puid))
+
+    def parent(self, sfinfo: SfInfo) -> SfInfo | None:
+        """Return the active sfinfo of the file that sfinfo was converted from"""
+        if not sfinfo.derived_from or sfinfo.derived_from.rowid is None:
+            return None
+        parent = self._get(sfinfo.derived_from.rowid)
+        return parent if parent and is_active(parent) else None
+
+    def derived(self, sfinfo: SfInfo) -> list[SfInfo]:
+        """Return the sfinfos of the files converted from sfinfo"""
+        return list(self._materialise(self._lookup("derived_from", sfinfo.rowid)))
+
+    def duplicates(self) -> dict[str, list[Path]]:
+        """Return the filenames of the active files that share the same checksum"""
+        duplicates: dict[str, list[Path]] = {}
+        for md5, bucket in self._indexes["md5"].items():
+            # the files that are not hashed (see Mode.FIXITY)
+            if isinstance(bucket, int) or not md5:
+                continue
+            records = [self._records[rowid] for rowid in bucket]
+            filenames = [Path(r.folder, r.name) for r in records if r.active and r.processed_as]
+            if len(filenames) > 1:
+                duplicates[_unpack_hex(md5)] = filenames  # type: ignore[arg-type]
+        return duplicates
@@ -0,0 +1,116 @@
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import suppress
+from queue import Empty, Full, Queue
+
+from fileidentification.definitions.models import SfInfo
+from fileidentification.tasks.scheduler import Converted
+
+# files that wait between two stages, a stage that is ahead blocks until the next one takes them
+QUEUESIZE = 256
+# seconds after which a blocked stage checks whether the run stopped
+POLL = 0.2
+
+
+class _Stop(Exception):  # noqa: N818
+    """The consumer of the stream stopped, e.g. on an error, the stages end"""
+
+
+class _Channel[T]:
+    """A bounded queue between two stages, that ends with None or with the error of the stage that feeds it"""
+
+    def __init__(self, stop: threading.Event, size: int) -> None:
+        self._queue: Queue[T | BaseException | None] = Queue(size)
+        self._stop = stop
+
+    def put(self, item: T | BaseException | None) -> None:
+        while not self._stop.is_set():
+            with suppress(Full):
+                self._queue.put(item, timeout=POLL)
+                return
+        raise _Stop
+
+    def __iter__(self) -> Iterator[T]:
+        while not self._stop.is_set():
+            try:
+                item = self._queue.get(timeout=POLL)
+            except Empty:
+                continue
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+        raise _Stop
+
+
+def _stage[T](name: str, feed: Callable[[], None], out: _Channel[T]) -> None:
+    """Run feed in a thread of its own, an error of it is passed on to the next stage through out"""
+
+    def target() -> None:
+        try:
+            feed()
+        except _Stop:
+            return
+        except BaseException as e:  # noqa: BLE001
+            with suppress(_Stop):
+                out.put(e)
+
+    threading.Thread(target=target, name=f"fileidentification-{name}", daemon=True).start()
+
+
+def stream_files(
+    sfinfos: Iterable[SfInfo],
+    probe: Callable[[Iterable[SfInfo]], Iterator[SfInfo]] | None,
+    convert: Callable[[Iterable[SfInfo]], Iterator[Converted]] | None,
+    size: int = QUEUESIZE,
+) -> Iterator[Converted]:
+    """
+    Pass the files through the stages at once: the identification (sfinfos, e.g. a lazy iterator over the tree),
+    the probes and the conversions. Every stage runs in a thread of its own with its own workers and hands the
+    files on through a bounded queue, so that a stage that is ahead waits for the next one (back-pressure) and the
+    files in flight are bounded. yields each sfinfo with the sfinfo of its converted file (None if it was not
+    converted) and the cmd as soon as it is through, the files that are not pending skip the conversions.
+    :param sfinfos the metadata of the files
+    :param probe the stage that probes the files and applies the policies, yields each sfinfo when done
+    :param convert the stage that converts the pending files, see scheduler.convert_files
+    :param size the number of files that wait between two stages
+    """
+    stop = threading.Event()
+    identified: _Channel[SfInfo] = _Channel(stop, size)
+    pending: _Channel[SfInfo] = _Channel(stop, size)
+    out: _Channel[Converted] = _Channel(stop, size)
+
+    def identify() -> None:
+        for sfinfo in sfinfos:
+            identified.put(sfinfo)
+        identified.put(None)
+
+    def inspect() -> None:
+        for sfinfo in probe(identified) if probe else identified:
+            if convert and sfinfo.status.pending:
+                pending.put(sfinfo)
+            else:
+                out.put((sfinfo, None, []))
+        pending.put(None)
+
+    def conversions() -> None:
+        if convert:
+            for converted in convert(pending):
+                out.put(converted)
+        else:
+            # the inspection puts all files into out
+            for _ in pending:
+                pass
+        # the inspection put its other files into out before it ended pending
+        out.put(None)
+
+    # an error of a stage is passed on from stage to stage, up to the consumer
+    _stage("identify", identify, identified)
+    _stage("inspect", inspect, pending)
+    _stage("convert", conversions, out)
+    try:
+        yield from out
+    finally:
+        # the stages end as soon as they hand on their next file, a running conversion is not aborted
+        stop.set()
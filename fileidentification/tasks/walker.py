@@ -0,0 +1,78 @@
+import os
+from collections.abc import Iterable, Iterator
+from fnmatch import fnmatch
+from pathlib import Path
+
+from typer import colors, secho
+
+from fileidentification.definitions.settings import Symlinks
+
+
+def _matches(relpath: str, name: str, patterns: list[str]) -> bool:
+    return any(fnmatch(relpath, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+
+def _scandir(folder: str) -> list[os.DirEntry[str]]:
+    try:
+        with os.scandir(folder) as it:
+            return sorted(it, key=lambda e: e.name)
+    except OSError as e:
+        secho(f"{e}", fg=colors.RED)
+        return []
+
+
+def _first_visit(entry: os.DirEntry[str], visited: set[tuple[int, int]]) -> bool:
+    """Return false if the folder a symlink points to was already walked (guards against symlink loops)"""
+    stat = entry.stat()
+    if (stat.st_dev, stat.st_ino) in visited:
+        return False
+    visited.add((stat.st_dev, stat.st_ino))
+    return True
+
+
+def walk_files(
+    root_folder: Path,
+    skip: Iterable[Path] = (),
+    include: Iterable[str] = (),
+    exclude: Iterable[str] = (),
+    symlinks: Symlinks = Symlinks.FILES,
+) -> Iterator[Path]:
+    """
+    Walk the root_folder with os.scandir and lazily yield the files in it, sorted by name within each folder.
+    The dirent type information is reused, so there is no extra stat call per entry unless symlinks are followed.
+    :param root_folder the folder to walk
+    :param skip folders that are not descended into (e.g. the tmp dir of the filehandler)
+    :param include glob patterns, if given, only files matching one of them are yielded
+    :param exclude glob patterns, files and folders matching one of them are skipped
+    :param symlinks how to treat symbolic links: skip them, add linked files, or also follow linked folders
+    """
+    includes, excludes = list(include), list(exclude)
+    skip_dirs = {path.absolute() for path in skip}
+    follow = symlinks == Symlinks.FOLLOW
+    visited: set[tuple[int, int]] = set()
+    if follow:
+        stat = root_folder.stat()
+        visited.add((stat.st_dev, stat.st_ino))
+
+    folders = [os.fspath(root_folder)]
+    # the paths of the entries start with the root_folder, the relative path is sliced off them
+    prefix = len(folders[0].rstrip(os.sep)) + 1
+    while folders:
+        subfolders: list[str] = []
+        for entry in _scandir(folders.pop()):
+            relpath = entry.path[prefix:] if includes or excludes else ""
+            if excludes and _matches(relpath, entry.name, excludes):
+                continue
+            is_link = entry.is_symlink()
+            if is_link and symlinks == Symlinks.SKIP:
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=follow):
+                    if Path(entry.path).absolute() not in skip_dirs and (not is_link or _first_visit(entry, visited)):
+                        subfolders.append(entry.path)
+                elif entry.is_file() and (not includes or _matches(relpath, entry.name, includes)):
+                    yield Path(entry.path)
+            except OSError as e:
+                secho(f"{e}", fg=colors.RED)
+        # reversed, so the subfolders are popped in sorted order
+        folders.extend(reversed(subfolders))
@@ -0,0 +1,37 @@
+import multiprocessing
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+# how many items per worker are submitted ahead of the one that is yielded next
+PREFETCH = 4
+
+
+def ordered_map[T, R](fn: Callable[[T], R], items: Iterable[T], jobs: int, processes: bool = False) -> Iterator[R]:
+    """
+    Apply fn on the items with a pool of workers and yield the results in the order of the items.
+    Only a bounded number of items is in flight, so items can be a lazy iterator.
+    :param fn the function to apply, it must be picklable (defined at module level) if processes is set
+    :param items the items to process
+    :param jobs the number of workers, if 1 or less, the items are processed serially in the calling thread
+    :param processes if true it uses a process pool, otherwise a thread pool
+    """
+    if jobs <= 1:
+        yield from map(fn, items)
+        return
+
+    # pygfried embeds the go runtime, which does not survive a fork
+    executor: Executor = (
+        ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("spawn"))
+        if processes
+        else ThreadPoolExecutor(jobs)
+    )
+
+    with executor:
+        it = iter(items)
+        window: deque[Future[R]] = deque(executor.submit(fn, item) for item in islice(it, jobs * PREFETCH))
+        while window:
+            future = window.popleft()
+            window.extend(executor.submit(fn, item) for item in islice(it, 1))
+            yield future.result()
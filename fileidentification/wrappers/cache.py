@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from pathlib import Path
+from typing import Any
+
+from fileidentification.wrappers.process import run as run_tool
+
+# number of probe results that are kept, the least recently used are dropped first
+MAXSIZE = 4096
+
+_results: OrderedDict[Hashable, Any] = OrderedDict()
+_running: dict[Hashable, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def cached[R](key: Hashable | None, run: Callable[[], R]) -> R:
+    """
+    Return the result of run for key. run is only called once per key, also if several threads ask for the same key
+    at once, the others wait for its result. if key is None, run is called without caching.
+    """
+    if key is None:
+        return run()
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]  # type: ignore[no-any-return]
+        running = _running.setdefault(key, threading.Lock())
+    with running:
+        with _lock:
+            if key in _results:
+                return _results[key]  # type: ignore[no-any-return]
+        result = run()
+        prime(key, result)
+        with _lock:
+            _running.pop(key, None)
+    return result
+
+
+def is_cached(key: Hashable) -> bool:
+    with _lock:
+        return key in _results
+
+
+def prime(key: Hashable, value: Any) -> None:
+    """Store the result for key, e.g. of a probe that ran for several keys at once"""
+    with _lock:
+        _results[key] = value
+        if len(_results) > MAXSIZE:
+            _results.popitem(last=False)
+
+
+def probe_key(probe: str, file: Path, md5: str | None) -> Hashable | None:
+    """
+    Return the cache key of a probe on file with checksum md5. if the file is not hashed (see --no-fixity), the
+    probe is cached by its path, size and modification time instead, None if it cannot be read.
+    """
+    if md5:
+        return probe, md5
+    try:
+        stat = file.stat()
+    except OSError:
+        return None
+    return probe, f"{file}", stat.st_size, stat.st_mtime_ns
+
+
+def cached_run(key: Hashable | None, file: Path, cmd: list[str], bin_: str) -> tuple[str, str]:
+    """
+    Run the probe cmd of a program of bin_ on file, returns its stdout and stderr, cached by key. if the output is
+    taken from a probe on another file with the same content (e.g. a duplicate), the path of that file is replaced
+    by file.
+    """
+
+    def run() -> tuple[Path, str, str]:
+        res = run_tool(cmd, bin_)
+        return file, res.stdout, res.stderr
+
+    probed, stdout, stderr = cached(key, run)
+    return stdout.replace(f"{probed}", f"{file}"), stderr.replace(f"{probed}", f"{file}")
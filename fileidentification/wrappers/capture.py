@@ -0,0 +1,128 @@
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+# distinct messages that are kept from the start of the output, and the most recent ones after them
+HEAD = 20
+TAIL = 20
+# chars of a line that are kept
+MAXLINE = 400
+# bytes in which a file is read
+CHUNK = 1 << 16
+
+# the parts of a line that vary between the repetitions of a message, e.g. "error while decoding MB 12 7"
+_VARYING = re.compile(rb"0x[0-9a-fA-F]+|(?<![\w./-])[-+]?\d+(?:\.\d+)?(?![\w/-])")
+# the error codes in the lines of ffmpeg (the component that reports, the error number of ffprobe -show_error)
+# and of imagemagick (the severity, the module and the handler)
+_CODES = [
+    re.compile(r"^\[([^\s@\]]+) @ 0x[0-9a-fA-F]+\]"),
+    re.compile(r"^(code=-?\d+)$"),
+    re.compile(r"@ ((?:error|warning)/[\w.-]+/\w+)"),
+]
+_REPEATED = re.compile(r"^  \[\.\.\. (\d+) times in total")
+
+
+class _Message:
+    """A message with its first and its last line and how often it occurred"""
+
+    def __init__(self, line: bytes) -> None:
+        self.first = line
+        self.last = line
+        self.count = 1
+
+    def render(self) -> str:
+        first = self.first.decode(errors="replace")[:MAXLINE]
+        if self.count == 1:
+            return f"{first}\n"
+        last = f", the last: {self.last.decode(errors='replace')[:MAXLINE]}" if self.last != self.first else ""
+        return f"{first}\n  [... {self.count} times in total{last}]\n"
+
+
+class Capture:
+    """
+    Bounded capture of the output of a program, written to it in chunks as it comes (see process.run).
+    Repetitions of a message (the same line up to numbers and addresses, e.g. ffmpeg printing "error while
+    decoding MB x y" for every broken macroblock of a video) are collapsed into a count with the first and the last
+    occurrence. the first HEAD messages are kept, of the later ones the TAIL most recent, and the lines are cut
+    after MAXLINE chars, so that the output of a file is bounded in memory and in the log.
+    """
+
+    def __init__(self) -> None:
+        self._partial = b""
+        self._head: dict[bytes, _Message] = {}
+        self._tail: OrderedDict[bytes, _Message] = OrderedDict()
+        self._omitted = 0
+        # the messages dropped from the tail, a message that recurs after it was dropped is counted again
+        self._dropped = 0
+
+    def write(self, data: bytes) -> int:
+        block, _, partial = (self._partial + data).replace(b"\r", b"\n").rpartition(b"\n")
+        # the last line is not complete yet, a line without end is cut
+        self._partial = partial[: MAXLINE * 4]
+        lines = block.split(b"\n")
+        # the numbers are masked in the whole block at once, the masks keep the newlines
+        for line, key in zip(lines, _VARYING.sub(b"#", block).split(b"\n"), strict=True):
+            self._add(line, key)
+        return len(data)
+
+    def _add(self, line: bytes, key: bytes) -> None:
+        if not key.strip():
+            return
+        key, line = key[: MAXLINE * 4], line[: MAXLINE * 4]
+        if message := self._head.get(key):
+            message.last = line
+            message.count += 1
+        elif message := self._tail.get(key):
+            message.last = line
+            message.count += 1
+            self._tail.move_to_end(key)
+        elif len(self._head) < HEAD:
+            self._head[key] = _Message(line)
+        else:
+            self._tail[key] = _Message(line)
+            if len(self._tail) > TAIL:
+                _, dropped = self._tail.popitem(last=False)
+                self._omitted += dropped.count
+                self._dropped += 1
+
+    def getvalue(self) -> str:
+        """Return the captured output, the collapsed messages with their counts"""
+        if self._partial:
+            self._add(self._partial, _VARYING.sub(b"#", self._partial))
+            self._partial = b""
+        text = "".join(message.render() for message in self._head.values())
+        if self._omitted:
+            text += f"  [... {self._omitted} lines of {self._dropped} other messages omitted]\n"
+        return text + "".join(message.render() for message in self._tail.values())
+
+
+def bounded(text: str) -> str:
+    """Return text as a Capture keeps it, e.g. the output of several programs that was split per file"""
+    capture = Capture()
+    capture.write(text.encode())
+    return capture.getvalue()
+
+
+def bounded_file(path: Path) -> str:
+    """Return the content of a file (e.g. the log of a conversion) as a Capture keeps it"""
+    capture = Capture()
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK):
+            capture.write(chunk)
+    return capture.getvalue()
+
+
+def error_codes(text: str) -> dict[str, int] | None:
+    """Return the error codes in the captured output of a program and how often they occurred, None if there are none"""
+    codes: dict[str, int] = {}
+    found: list[str] = []
+    for line in text.splitlines():
+        if repeated := _REPEATED.match(line):
+            # the codes of the line before occurred as often as it was repeated
+            for code in found:
+                codes[code] += int(repeated.group(1)) - 1
+            continue
+        found = [match.group(1) for pattern in _CODES if (match := pattern.search(line.strip()))]
+        for code in found:
+            codes[code] = codes.get(code, 0) + 1
+    return codes or None
@@ -1,56 +1,139 @@
 import platform
 import shlex
-import subprocess
+import tempfile
+from functools import cache
 from pathlib import Path
 
 from fileidentification.definitions.models import PolicyParams, SfInfo
 from fileidentification.definitions.settings import PDFSETTINGS, Bin, LOPath
+from fileidentification.wrappers.process import run, timed_out
 
 SOFFICE = LOPath.Linux if platform.system() == LOPath.Linux.name else LOPath.Darwin
 
 
-def convert(sfinfo: SfInfo, args: PolicyParams) -> tuple[Path, str, Path]:
+def working_dir(sfinfo: SfInfo) -> Path:
+    """Return the working dir of the conversion of a file in the tmp dir"""
+    return Path(sfinfo.tdir / f"{sfinfo.filename.name}_{sfinfo.md5[:6]}")
+
+
+def target_paths(sfinfo: SfInfo, args: PolicyParams) -> tuple[Path, Path, Path]:
+    """Return the working dir, the target path and the log path of the conversion of a file"""
+    wdir = working_dir(sfinfo)
+    if not wdir.exists():
+        wdir.mkdir(parents=True)
+    return wdir, wdir / f"{sfinfo.filename.stem}.{args.target_container}", wdir / f"{sfinfo.filename.stem}.log"
+
+
+@cache
+def tool_version(bin_: str) -> str:
+    """Return the first line of the version of the program of a bin, empty if it does not run"""
+    cmds = {Bin.FFMPEG: ["ffmpeg", "-version"], Bin.MAGICK: ["magick", "-version"], Bin.SOFFICE: [SOFFICE, "--version"]}
+    if bin_ not in cmds:
+        return ""
+    try:
+        res = run(cmds[bin_], bin_)  # type: ignore[index]
+    except OSError:
+        return ""
+    return next(iter(res.stdout.splitlines()), "")
+
+
+def _soffice(args: PolicyParams, profile: Path | None) -> list[str]:
+    """Return the soffice cmd up to the input files, with its own user profile if given"""
+    cmd: list[str] = [SOFFICE]
+    if profile:
+        cmd.append(f"-env:UserInstallation={profile.as_uri()}")
+    # add the version if its pdf
+    if args.target_container == "pdf":
+        return [*cmd, *shlex.split(args.processing_args), f"pdf{PDFSETTINGS}"]
+    return [*cmd, *shlex.split(args.processing_args), args.target_container]
+
+
+def convert(
+    sfinfo: SfInfo, args: PolicyParams, threads: int | None = None, profile: Path | None = None
+) -> tuple[Path, str, Path]:
     """
     Convert a file to the desired format passed by the args
 
     :params sfinfo the metadata object of the file
     :params args the arguments how to convert ('bin', 'processing_args', 'target_container')
+    :params threads the number of threads of ffmpeg, unless the processing_args set them
+    :params profile the user profile of soffice, the default profile if None
 
-    :returns the constructed target path, the cmd run and the log path
+    :returns the constructed target path, the cmd run (that can be rerun) and the log path
     """
 
-    wdir = Path(sfinfo.tdir / f"{sfinfo.filename.name}_{sfinfo.md5[:6]}")
-    if not wdir.exists():
-        wdir.mkdir(parents=True)
-
-    target = Path(wdir / f"{sfinfo.filename.stem}.{args.target_container}")
-    logfile_path = Path(wdir / f"{sfinfo.filename.stem}.log")
+    wdir, target, logfile_path = target_paths(sfinfo, args)
+    processing_args = shlex.split(args.processing_args)
 
-    # set input, outputfile and log for shell
-    inputfile = shlex.quote(str(sfinfo.path))
-    outfile = shlex.quote(str(target))
-    logfile = shlex.quote(str(logfile_path))
-
-    cmd: str = ""
+    cmd: list[str] = []
     match args.bin:
         # construct command if its ffmpeg
         case Bin.FFMPEG:
-            cmd = f"ffmpeg -y -i {inputfile} {args.processing_args} {outfile} 2> {logfile}"
+            if threads and "-threads" not in processing_args:
+                processing_args += ["-threads", f"{threads}"]
+            cmd = ["ffmpeg", "-y", "-i", f"{sfinfo.path}", *processing_args, f"{target}"]
         # construct command if its imagemagick
         case Bin.MAGICK:
-            cmd = f"magick {args.processing_args} {inputfile} {outfile} 2> {logfile}"
+            cmd = ["magick", *processing_args, f"{sfinfo.path}", f"{target}"]
         # construct command if its inkscape
         # case Bin.INCSCAPE:
-        # cmd = f'inkscape --export-filename={outfile} {args["processing_args"]} {inputfile} 2> {logfile}'
+        # cmd = ["inkscape", f"--export-filename={target}", *processing_args, f"{sfinfo.path}"]
         # construct command if its LibreOffice
         case Bin.SOFFICE:
-            cmd = f"{SOFFICE} {args.processing_args} {args.target_container} {inputfile} "
-            # add the version if its pdf
-            if args.target_container == "pdf":
-                cmd = f"{SOFFICE} {args.processing_args} 'pdf{PDFSETTINGS}' {inputfile} "
-            cmd = cmd + f"--outdir {shlex.quote(str(wdir))} >> {logfile} 2>&1"
+            cmd = [*_soffice(args, profile), f"{sfinfo.path}", "--outdir", f"{wdir}"]
+
+    # the log of an earlier conversion of the file is replaced
+    logfile_path.write_bytes(b"")
+    if cmd:
+        # the [error]output is streamed to the logfile
+        res = run(cmd, args.bin, logfile=logfile_path)
+        if timed_out(res.stderr):
+            with logfile_path.open("a") as f:
+                f.write(res.stderr)
+
+    # the profile is removed after the conversions
+    if profile and args.bin == Bin.SOFFICE:
+        cmd = _soffice_cmd(sfinfo, args)
+    return target, shlex.join(cmd), logfile_path
+
+
+def _soffice_cmd(sfinfo: SfInfo, args: PolicyParams) -> list[str]:
+    """Return the soffice cmd that converts the file on its own into its working dir, with the default profile"""
+    return [*_soffice(args, None), f"{sfinfo.path}", "--outdir", f"{working_dir(sfinfo)}"]
+
+
+def convert_batch(sfinfos: list[SfInfo], args: PolicyParams, profile: Path) -> list[tuple[Path, str, Path]]:
+    """
+    Convert documents that share the same policy with a single soffice invocation, which saves its startup per file.
+    soffice writes the files into a common dir, from where they are moved to their working dir. the documents must
+    have distinct names (stems).
+
+    :params sfinfos the metadata objects of the documents
+    :params args the arguments how to convert ('bin', 'processing_args', 'target_container')
+    :params profile the user profile of soffice
+
+    :returns the constructed target path, the cmd that converts the document on its own and the log path per document
+    """
+
+    paths = [target_paths(sfinfo, args) for sfinfo in sfinfos]
+    with tempfile.TemporaryDirectory(dir=sfinfos[0].tdir, prefix=".soffice_") as bdir:
+        argv = [*_soffice(args, profile), *(f"{sfinfo.path}" for sfinfo in sfinfos), "--outdir", bdir]
+        res = run(argv, Bin.SOFFICE, bound=False)
+        lines = (res.stdout + res.stderr).splitlines(keepends=True)
 
-    # run cmd in shell (and as a string, so [error]output is redirected to logfile)
-    subprocess.run(cmd, check=False, shell=True)
+        for sfinfo, (_, target, logfile_path) in zip(sfinfos, paths, strict=True):
+            output = Path(bdir) / target.name
+            if output.is_file():
+                output.replace(target)
+            # soffice names the input file in the lines about it, the other lines go to the failed conversions
+            own = [line.replace(f"{output}", f"{target}") for line in lines if f"{sfinfo.path}" in line]
+            if not own and not target.is_file():
+                own = [line for line in lines if not any(f"{other.path}" in line for other in sfinfos)]
+            with logfile_path.open("a") as f:
+                f.writelines(own)
 
-    return target, cmd, logfile_path
+    # the common dir and the profile are removed after the batch, the cmd of a single document can be rerun
+    return [
+        (target, shlex.join(_soffice_cmd(sfinfo, args)), logfile_path)
+        for sfinfo, (_, target, logfile_path) in zip(sfinfos, paths, strict=True)
+    ]
@@ -1,48 +1,162 @@
 import json
 import subprocess
+import time
 from pathlib import Path
+from subprocess import CompletedProcess
 from typing import Any
 
+from fileidentification.definitions.models import DecodeParams
+from fileidentification.definitions.settings import Bin, DecodeDepth
+from fileidentification.wrappers.cache import cached, is_cached, prime, probe_key
+from fileidentification.wrappers.process import run, run_many, timed_out
 
-def ffmpeg_collect_warnings(file: Path, verbose: bool) -> tuple[bool, str, str]:
+
+def ffmpeg_collect_warnings(
+    file: Path, verbose: bool, md5: str | None = None, decode: DecodeParams | None = None
+) -> tuple[bool, bool, str, str, str]:
     """
     Check for errors with ffprobe -show_error or ffmpeg dropping frames.
-    Returns True if file is corrupt, stdout, technical metadata of the video
+    Returns True if file is corrupt, True if ffprobe timed out (the file cannot be judged), stdout, technical
+    metadata of the video and, if it was not decoded completely in verbose mode, how much of it was decoded
+    :param decode how much of the file is decoded in verbose mode, all of it if None
     """
 
-    cmd = ["ffprobe", "-hide_banner", "-show_error", str(file)]
-    res = subprocess.run(cmd, check=False, capture_output=True, text=True)
-    std_out = res.stdout.replace(f"{file.parent}/", "")
+    error, streams, duration = ffmpeg_probe(file, md5)
+    std_out = error.replace(f"{file.parent}/", "")
+    partial = ""
+    # the file cannot be judged, a decode would most likely hang too
+    if timed_out(error):
+        return False, True, std_out, "", partial
 
     if verbose:
-        cmd_verbose = ["ffmpeg", "-v", "error", "-i", str(file), "-f", "null", "-"]
-        res_verbose = subprocess.run(cmd_verbose, check=False, capture_output=True, text=True)
-        # ffmpeg catches errors in stderr, map the errors to stdout
-        std_out = res_verbose.stderr.replace(f"{file.parent}/", "")
+        decode = decode or DecodeParams()
+        key = probe_key(f"ffmpeg {decode.model_dump_json()}", file, md5)
+        probed, stderr, partial = cached(key, lambda: _decode(file, decode, duration))
+        # ffmpeg catches errors in stderr, map the errors to stdout. the output can be of a file with the same content
+        std_out = stderr.replace(f"{probed}", f"{file}").replace(f"{file.parent}/", "")
 
-    streams = ffmpeg_media_info(file)
     specs = json.dumps(streams) if streams else ""
 
-    # rely on ffprobe whether file is corrupt
-    if res.stdout:
-        return True, std_out, specs
-    return False, std_out, specs
+    # rely on ffprobe whether file is corrupt, also if the decode timed out
+    return bool(error), False, std_out, specs, partial
+
+
+def _decode_cmds(file: Path, decode: DecodeParams, duration: float | None) -> tuple[list[list[str]], str]:
+    """Return the ffmpeg cmds that decode the file as far as decode says, and how far if not completely"""
+    base, null = ["ffmpeg", "-v", "error"], ["-f", "null", "-"]
+    seconds = decode.seconds
+    # the size budget in seconds, estimated by the bitrate of the file
+    budget = decode.size_budget * duration / file.stat().st_size if decode.size_budget and duration else None
+
+    if decode.depth == DecodeDepth.SEGMENTS and duration and duration > decode.segments * seconds:
+        seconds = min(seconds, budget / decode.segments) if budget else seconds
+        step = (duration - seconds) / max(decode.segments - 1, 1)
+        cmds = [
+            [*base, "-ss", f"{i * step:.3f}", "-t", f"{seconds:.3f}", "-i", f"{file}", *null]
+            for i in range(decode.segments)
+        ]
+        return cmds, f"{decode.segments} segments of {seconds:.0f}s"
+    # the segments of a file of unknown duration are its ends
+    if (decode.depth == DecodeDepth.ENDS and (not duration or duration > 2 * seconds)) or (
+        decode.depth == DecodeDepth.SEGMENTS and not duration
+    ):
+        seconds = min(seconds, budget / 2) if budget else seconds
+        cmds = [
+            [*base, "-t", f"{seconds:.3f}", "-i", f"{file}", *null],
+            [*base, "-sseof", f"-{seconds:.3f}", "-i", f"{file}", *null],
+        ]
+        return cmds, f"the first and the last {seconds:.0f}s"
+
+    cmd, partial = [*base, "-i", f"{file}", *null], ""
+    if decode.depth == DecodeDepth.KEYFRAMES:
+        cmd, partial = [*base, "-skip_frame", "nokey", "-i", f"{file}", *null], "the keyframes"
+    if budget and duration and duration > budget:
+        cmd[cmd.index("-i") : cmd.index("-i")] = ["-t", f"{budget:.3f}"]
+        partial = f"{partial or 'all frames'} of the first {budget:.0f}s"
+    return [cmd], partial
+
+
+def _decode(file: Path, decode: DecodeParams, duration: float | None) -> tuple[Path, str, str]:
+    """
+    Decode the file with ffmpeg as far as decode says, within its time budget.
+    Returns the file, the errors ffmpeg printed to stderr and how far the file was decoded if not completely
+    """
+    cmds, partial = _decode_cmds(file, decode, duration)
+    deadline = time.monotonic() + decode.time_budget if decode.time_budget else None
+    stderr = ""
+    for cmd in cmds:
+        try:
+            timeout = max(deadline - time.monotonic(), 0) if deadline else None
+            res = run(cmd, Bin.FFMPEG, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            stderr += e.stderr if isinstance(e.stderr, str) else ""
+            partial = f"{partial or 'all frames'}, stopped after the time budget of {decode.time_budget:.0f}s"
+            break
+        stderr += res.stderr
+        if timed_out(res.stderr):
+            break
+    return file, stderr, partial
 
 
-def ffmpeg_media_info(file: Path) -> dict[str, Any] | None:
-    cmd: list[str] = [
+def ffmpeg_media_info(file: Path, md5: str | None = None) -> dict[str, Any] | None:
+    return ffmpeg_probe(file, md5)[1]
+
+
+def ffmpeg_probe(file: Path, md5: str | None = None) -> tuple[str, dict[str, Any] | None, float | None]:
+    """
+    Probe a file with a single ffprobe for its errors, its streams and its duration. Returns the errors as
+    ffprobe -show_error prints them, the streams (None if ffprobe failed) and the duration in seconds (None if
+    unknown). The result is cached by md5 (see probe_key), so files with the same content are probed once.
+    """
+    return cached(probe_key("ffprobe", file, md5), lambda: _ffprobe(file))
+
+
+def ffmpeg_prefetch(files: list[tuple[Path, str]]) -> None:
+    """
+    Probe the files with ffprobe all at once (as many as the engine runs at once) and cache the results (see
+    probe_key), so that the probes overlap, e.g. on slow storage, and ffmpeg_probe takes them from the cache
+    :param files the path and checksum of the files, an empty checksum if they are not hashed
+    """
+    # probe one file per content, unless it was probed before
+    keys = ((probe_key("ffprobe", path, md5), path) for path, md5 in reversed(files))
+    paths = {key: path for key, path in keys if key and not is_cached(key)}
+    results = run_many([_ffprobe_cmd(path) for path in paths.values()], Bin.FFMPEG)
+    for key, res in zip(paths, results, strict=True):
+        prime(key, _parse_ffprobe(res))
+
+
+def _ffprobe(file: Path) -> tuple[str, dict[str, Any] | None, float | None]:
+    return _parse_ffprobe(run(_ffprobe_cmd(file), Bin.FFMPEG))
+
+
+def _ffprobe_cmd(file: Path) -> list[str]:
+    return [
         "ffprobe",
         str(file),
         "-hide_banner",
+        "-show_error",
         "-show_entries",
         "stream=index,codec_name,codec_long_name,profile,"
         "codec_tag,pix_fmt,color_space,coded_width,coded_height,r_frame_rate,bit_rate,channels,channel_layout,"
-        "sample_aspect_ratio,display_aspect_ratio",
+        "sample_aspect_ratio,display_aspect_ratio:format=duration",
         "-output_format",
         "json",
     ]
-    res = subprocess.run(cmd, check=False, capture_output=True)
-    if res.returncode == 0:
-        streams: dict[str, Any] = json.loads(res.stdout)["streams"]
-        return streams
-    return None
+
+
+def _parse_ffprobe(res: CompletedProcess[str]) -> tuple[str, dict[str, Any] | None, float | None]:
+    if timed_out(res.stderr):
+        return res.stderr, None, None
+    try:
+        output: dict[str, Any] = json.loads(res.stdout)
+    except ValueError:
+        output = {}
+    error = ""
+    if "error" in output:
+        error = "[ERROR]\n" + "".join(f"{k}={v}\n" for k, v in output["error"].items()) + "[/ERROR]\n"
+    streams: dict[str, Any] | None = output.get("streams") if res.returncode == 0 else None
+    try:
+        duration: float | None = float(output["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        duration = None
+    return error, streams, duration
@@ -1,22 +1,32 @@
-import subprocess
 from pathlib import Path
 
-from fileidentification.definitions.settings import ErrMsgIM
+from fileidentification.definitions.settings import Bin, ErrMsgIM
+from fileidentification.wrappers.cache import cached_run, is_cached, prime, probe_key
+from fileidentification.wrappers.capture import bounded
+from fileidentification.wrappers.process import run
 
+IMFORMAT = "%m %wx%h %g %z-bit %[channels]"
+# separate the fields and the records (one per frame) in the output of a batched identify
+FIELDSEP = "\x1f"
+RECORDSEP = "\x1e"
 
-def imagemagick_collect_warnings(file: Path, verbose: bool) -> tuple[bool, str, str]:
+
+def _identify(verbose: bool) -> list[str]:
+    if verbose:
+        return ["identify", "-verbose", "-regard-warnings", "-format", IMFORMAT]
+    return ["identify", "-format", IMFORMAT]
+
+
+def imagemagick_collect_warnings(file: Path, verbose: bool, md5: str | None = None) -> tuple[bool, str, str]:
     """
     Check for errors with magick identify.
     Returns True if file is corrupt, stdout, technical metadata of the image
     """
 
-    cmd = ["identify", "-format", "%m %wx%h %g %z-bit %[channels]", str(file)]
-    if verbose:
-        cmd = ["identify", "-verbose", "-regard-warnings", "-format", "%m %wx%h %g %z-bit %[channels]", str(file)]
-
-    res = subprocess.run(cmd, check=False, capture_output=True, text=True)
-    specs = res.stdout.replace(f"{file.parent}/", "")
-    std_err = res.stderr.replace(f"{file.parent}/", "")
+    cmd = [*_identify(verbose), str(file)]
+    stdout, stderr = cached_run(probe_key(" ".join(cmd[:-1]), file, md5), file, cmd, Bin.MAGICK)
+    specs = stdout.replace(f"{file.parent}/", "")
+    std_err = stderr.replace(f"{file.parent}/", "")
 
     # check if the warnings have an error that the file is not or only partially readable
     if std_err and any(msg in std_err for msg in ErrMsgIM):
@@ -24,7 +34,48 @@ def imagemagick_collect_warnings(file: Path, verbose: bool) -> tuple[bool, str,
     return False, std_err, specs
 
 
-def imagemagick_media_info(file: Path) -> str:
-    cmd = ["identify", "-ping", "-format", "%m %wx%h %g %z-bit %[channels]", str(file)]
-    res = subprocess.run(cmd, check=False, capture_output=True, text=True)
-    return res.stdout.replace(f"{file}/", "")
+def imagemagick_prefetch(files: list[tuple[Path, str]], verbose: bool) -> None:
+    """
+    Probe images with a single identify and cache the output per file, so that imagemagick_collect_warnings
+    does not spawn an identify per image. the warnings are attributed to the files by their path, the files
+    without output are left for imagemagick_collect_warnings, as well as the warnings that name none of them (e.g.
+    of a format without a delegate). if all files have output, such a warning could be of any of them and none of
+    them is cached.
+    :param files the path and checksum of the images, an empty checksum if they are not hashed
+    :param verbose if true it does more detailed inspections
+    """
+    cmd = _identify(verbose)
+    probe = " ".join(cmd)
+    # probe one file per content, unless it was probed before
+    keys = ((probe_key(probe, path, md5), path) for path, md5 in reversed(files))
+    paths = {key: path for key, path in keys if key and not is_cached(key)}
+    if not paths:
+        return
+    cmd[-1] += f"{FIELDSEP}%i{RECORDSEP}"
+    res = run([*cmd, *(str(path) for path in paths.values())], Bin.MAGICK, bound=False)
+
+    stdout: dict[str, str] = {}
+    for record in res.stdout.split(RECORDSEP):
+        specs, _, name = record.partition(FIELDSEP)
+        if name:
+            stdout[name] = stdout.get(name, "") + specs
+    stderr: dict[str, list[str]] = {}
+    unattributed = False
+    for line in res.stderr.splitlines(keepends=True):
+        if names := [f"{path}" for path in paths.values() if f"{path}" in line]:
+            stderr.setdefault(max(names, key=len), []).append(line)
+        else:
+            unattributed = True
+    # the files without output are probed again, with their warnings
+    if unattributed and all(f"{path}" in stdout for path in paths.values()):
+        return
+
+    for key, path in paths.items():
+        if f"{path}" in stdout:
+            prime(key, (path, stdout[f"{path}"], bounded("".join(stderr.get(f"{path}", [])))))
+
+
+def imagemagick_media_info(file: Path, md5: str | None = None) -> str:
+    cmd = ["identify", "-ping", "-format", IMFORMAT, str(file)]
+    stdout, _ = cached_run(probe_key(" ".join(cmd[:-1]), file, md5), file, cmd, Bin.MAGICK)
+    return stdout.replace(f"{file}/", "")
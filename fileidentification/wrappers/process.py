@@ -0,0 +1,183 @@
+import asyncio
+import io
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+from collections.abc import Callable, Coroutine
+from contextlib import suppress
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from typer import colors, secho
+
+from fileidentification.definitions.models import ToolLimits
+from fileidentification.definitions.settings import Bin
+from fileidentification.wrappers.capture import Capture
+
+# the line that ends the stderr of a program that was killed after the timeout of its bin
+TIMEDOUT = "[TIMEOUT]"
+
+# bytes in which the output of a program is read
+CHUNK = 1 << 16
+
+# the limits of the programs, set once per run (see configure)
+_limits = ToolLimits()
+# the engine the programs run on, started with the first program
+_running: "_Engine | None" = None
+_lock = threading.Lock()
+
+
+def configure(limits: ToolLimits) -> None:
+    """Set the limits of the programs that are run from now on"""
+    global _limits  # noqa: PLW0603
+    _limits = limits
+    with _lock:
+        if _running:
+            # no program waits for the semaphore between the stages
+            _running.semaphore = asyncio.Semaphore(limits.concurrency)
+
+
+def tool_timeouts(specs: list[str] | None) -> dict[str, float]:
+    """
+    Return the timeout in seconds per bin
+    :param specs bin=seconds to set the timeout of a bin, e.g. ffmpeg=3600, or seconds to set it for all bins
+    """
+    bins = [Bin.FFMPEG, Bin.MAGICK, Bin.SOFFICE]
+    timeouts: dict[str, float] = {}
+    for spec in specs or []:
+        name, _, seconds = spec.rpartition("=")
+        try:
+            timeout = float(seconds)
+        except ValueError:
+            timeout = 0
+        if (name and name not in bins) or timeout <= 0:
+            secho(f"invalid timeout {spec}, expected seconds or one of {[f'{b}=seconds' for b in bins]}", fg=colors.RED)
+            sys.exit(1)
+        timeouts.update({name: timeout} if name else dict.fromkeys(bins, timeout))
+    return timeouts
+
+
+def timed_out(output: str | None) -> bool:
+    """Return True if output is the stderr of a program that was killed after the timeout of its bin"""
+    return TIMEDOUT in (output or "")
+
+
+def _limited(cmd: list[str]) -> list[str]:
+    """Prefix cmd with the rlimits of the programs, if any (ulimit is a no op where the shell does not support it)"""
+    ulimits = []
+    if _limits.memory:
+        ulimits.append(f"ulimit -v {_limits.memory // 1024} 2>/dev/null;")
+    if _limits.cpu_time:
+        ulimits.append(f"ulimit -t {_limits.cpu_time} 2>/dev/null;")
+    if not ulimits:
+        return cmd
+    # the shell only sets the rlimits and then replaces itself with the program
+    return ["sh", "-c", f'{" ".join(ulimits)} exec "$@"', "sh", *cmd]
+
+
+def _env(bin_: str) -> dict[str, str] | None:
+    """Return the environment of a program, imagemagick gets its share of the memory limit as resource limits"""
+    if bin_ != Bin.MAGICK or not _limits.memory:
+        return None
+    # the pixel cache that does not fit into the heap and the memory map goes to disk, instead of beyond the rlimit
+    return os.environ | {"MAGICK_MEMORY_LIMIT": f"{_limits.memory // 4}", "MAGICK_MAP_LIMIT": f"{_limits.memory // 4}"}
+
+
+class _Engine:
+    """
+    An event loop in a thread of its own, on which the programs of all threads run, at most as many at once as
+    the concurrency of the limits. the threads wait for their programs without holding a thread of the engine,
+    so many probes can be in flight, e.g. on slow storage.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = asyncio.Semaphore(_limits.concurrency)
+        threading.Thread(target=self.loop.run_forever, name="fileidentification-engine", daemon=True).start()
+
+    def submit[R](self, coro: Coroutine[Any, Any, R]) -> R:
+        """Run coro on the loop, returns its result once it is done"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+def _engine() -> _Engine:
+    global _running  # noqa: PLW0603
+    with _lock:
+        if _running is None:
+            _running = _Engine()
+        return _running
+
+
+async def _pump(stream: asyncio.StreamReader | None, sink: Callable[[bytes], object]) -> None:
+    """Write the output of a program to sink as it comes, in chunks"""
+    while stream and (chunk := await stream.read(CHUNK)):
+        sink(chunk)
+
+
+def _text(output: io.BytesIO | Capture) -> str:
+    return output.getvalue() if isinstance(output, Capture) else output.getvalue().decode(errors="replace")
+
+
+async def _execute(
+    cmd: list[str], bin_: str, budget: float | None, sink: BinaryIO | None, bound: bool = True
+) -> subprocess.CompletedProcess[str]:
+    limit = _limits.timeouts.get(bin_)
+    deadline = min((t for t in (limit, budget) if t is not None), default=None)
+    # the stderr of a probe can be a line per broken frame, it is collapsed as it comes
+    stdout, stderr = io.BytesIO(), Capture() if bound else io.BytesIO()
+    async with _engine().semaphore:
+        proc = await asyncio.create_subprocess_exec(
+            *_limited(cmd),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=_env(bin_),
+            start_new_session=True,
+        )
+        done = asyncio.gather(
+            proc.wait(), _pump(proc.stdout, (sink or stdout).write), _pump(proc.stderr, (sink or stderr).write)
+        )
+        try:
+            await asyncio.wait_for(asyncio.shield(done), deadline)
+        except TimeoutError as e:
+            # the program could have started child processes (e.g. soffice)
+            with suppress(ProcessLookupError):
+                os.killpg(proc.pid, signal.SIGKILL)
+            await done
+            if budget is not None and (limit is None or budget <= limit):
+                raise subprocess.TimeoutExpired(cmd, budget, _text(stdout), _text(stderr)) from e
+            err = f"{_text(stderr)}\n{TIMEDOUT} {bin_} was killed after {limit:g}s: {shlex.join(cmd)}\n"
+            return subprocess.CompletedProcess(cmd, await proc.wait(), _text(stdout), err)
+    return subprocess.CompletedProcess(cmd, await proc.wait(), _text(stdout), _text(stderr))
+
+
+def run(
+    cmd: list[str], bin_: str, timeout: float | None = None, logfile: Path | None = None, bound: bool = True
+) -> subprocess.CompletedProcess[str]:
+    """
+    Run a program of bin_ on the engine, within the limits of the programs and in a process group of its own.
+    If it runs longer than the timeout of its bin, the process group is killed and TIMEDOUT is appended to its stderr.
+    :param cmd the program and its arguments, it is not run in a shell
+    :param bin_ the bin of the program
+    :param timeout seconds after which the process group is killed and subprocess.TimeoutExpired is raised,
+    e.g. the budget of a probe, unless the timeout of the bin is shorter
+    :param logfile the file the stdout and stderr of the program are appended to as they come, instead of
+    capturing them, the stderr then only says if the program timed out
+    :param bound collapse the repeated messages of the stderr (see capture.Capture), unset it if the stderr is
+    about several files and split per file afterwards
+    """
+    if not logfile:
+        return _engine().submit(_execute(cmd, bin_, timeout, None, bound))
+    with logfile.open("ab") as f:
+        return _engine().submit(_execute(cmd, bin_, timeout, f))
+
+
+def run_many(cmds: list[list[str]], bin_: str) -> list[subprocess.CompletedProcess[str]]:
+    """Run the programs of bin_ at once (as many as the concurrency of the limits allows), see run"""
+
+    async def gather() -> list[subprocess.CompletedProcess[str]]:
+        return await asyncio.gather(*(_execute(cmd, bin_, None, None) for cmd in cmds))
+
+    return _engine().submit(gather()) if cmds else []
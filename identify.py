@@ -3,7 +3,7 @@ from typing import Annotated
 
 import typer
 
-from fileidentification.filehandling import FileHandler
+from fileidentification.definitions.settings import DecodeDepth, HashAlgo, LogFormat, Symlinks
 
 
 def main(
@@ -96,7 +96,184 @@ def main(
     mode_quiet: Annotated[bool, typer.Option("--quiet", "-q", help="just print errors and warnings.")] = False,
     to_csv: Annotated[bool, typer.Option("--csv", help="get a csv out of the log.json.")] = False,
     inspect: Annotated[bool, typer.Option("--inspect", help="inspect the files without any modification.")] = False,
+    jobs: Annotated[
+        int,
+        typer.Option("--jobs", "-j", min=1, help="number of parallel workers used to analyse the files."),
+    ] = 1,
+    include: Annotated[
+        list[str] | None,
+        typer.Option("--include", help="glob pattern of the files to analyse, can be passed multiple times."),
+    ] = None,
+    exclude: Annotated[
+        list[str] | None,
+        typer.Option("--exclude", help="glob pattern of the files and folders to skip, can be passed multiple times."),
+    ] = None,
+    symlinks: Annotated[
+        Symlinks,
+        typer.Option(
+            "--symlinks",
+            help="skip symbolic links, add linked files (default) or also follow linked folders.",
+        ),
+    ] = Symlinks.FILES,
+    hash_algo: Annotated[
+        HashAlgo,
+        typer.Option("--hash", help="hash algorithm for the checksum of the files (default md5)."),
+    ] = HashAlgo.MD5,
+    use_mmap: Annotated[bool, typer.Option("--mmap", help="memory map the files for hashing.")] = False,
+    fixity: Annotated[
+        bool,
+        typer.Option(
+            "--fixity/--no-fixity",
+            help="hash all files (default), or only the files that can be duplicates of each other.",
+        ),
+    ] = True,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            "--incremental",
+            "-u",
+            help="if there is a log: analyse new and changed files in the selected root_folder, flag vanished ones.",
+        ),
+    ] = False,
+    log_format: Annotated[
+        LogFormat,
+        typer.Option(
+            "--log-format",
+            help="write the log as json (default) or as json lines, which is streamed while processing.",
+        ),
+    ] = LogFormat.JSON,
+    catalog: Annotated[
+        bool,
+        typer.Option(
+            "--catalog",
+            help="keep the metadata of the files in a sqlite catalog in the tmp dir instead of in memory.",
+        ),
+    ] = False,
+    slots: Annotated[
+        list[str] | None,
+        typer.Option(
+            "--slots",
+            help="number of conversions that run at once per bin, e.g. --slots ffmpeg=2. "
+            "defaults to --jobs for ffmpeg and magick, and 1 for soffice.",
+        ),
+    ] = None,
+    cpus: Annotated[
+        int | None,
+        typer.Option(
+            "--cpus",
+            min=1,
+            help="cpu budget of the conversions, shared among the ffmpeg processes as threads. defaults to all cpus.",
+        ),
+    ] = None,
+    cache_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--cache-dir",
+            help="reuse the conversions of files with the same content and policy from this dir, across runs.",
+        ),
+    ] = None,
+    cache_size: Annotated[
+        float,
+        typer.Option("--cache-size", min=0, help="size of the conversion cache in GB (default 10)."),
+    ] = 10,
+    progress_interval: Annotated[
+        float,
+        typer.Option(
+            "--progress-interval",
+            min=0,
+            help="write json progress lines to stderr every that many seconds, if it is not a terminal (default off).",
+        ),
+    ] = 0,
+    decode: Annotated[
+        DecodeDepth,
+        typer.Option(
+            "--decode",
+            help="how much of a video or audio file is decoded in verbose mode: all of it (default), the keyframes, "
+            "evenly spaced segments or the first and the last seconds.",
+        ),
+    ] = DecodeDepth.FULL,
+    decode_segments: Annotated[
+        int, typer.Option("--decode-segments", min=1, help="number of segments of --decode segments (default 5).")
+    ] = 5,
+    decode_seconds: Annotated[
+        float,
+        typer.Option("--decode-seconds", min=1, help="seconds of a segment, of the start and of the end (default 30)."),
+    ] = 30,
+    decode_time_budget: Annotated[
+        float | None,
+        typer.Option("--decode-time-budget", min=1, help="seconds after which the decode of a file is stopped."),
+    ] = None,
+    decode_size_budget: Annotated[
+        float | None,
+        typer.Option("--decode-size-budget", min=1, help="MB of a file that are decoded at most."),
+    ] = None,
+    timeouts: Annotated[
+        list[str] | None,
+        typer.Option(
+            "--timeout",
+            help="seconds after which ffmpeg, magick or soffice is killed, for all or per bin, e.g. ffmpeg=3600. "
+            "can be passed multiple times.",
+        ),
+    ] = None,
+    memory_budget: Annotated[
+        float | None,
+        typer.Option(
+            "--memory-budget",
+            min=0.1,
+            help="memory in GB of the external programs that run at once, each one gets its share as limit.",
+        ),
+    ] = None,
+    cpu_time_limit: Annotated[
+        int | None,
+        typer.Option("--cpu-time-limit", min=1, help="seconds of cpu time of an external program."),
+    ] = None,
+    concurrency: Annotated[
+        int,
+        typer.Option(
+            "--concurrency", min=1, help="number of external programs that run at once, e.g. probes of slow storage."
+        ),
+    ] = 64,
+    stream: Annotated[
+        bool,
+        typer.Option(
+            "--stream",
+            help="identify, probe and convert the files at once, the conversions start while the tree is scanned.",
+        ),
+    ] = False,
+    resume: Annotated[
+        bool,
+        typer.Option(
+            "--resume",
+            help="continue an interrupted run from its journal, pass the options of the interrupted run.",
+        ),
+    ] = False,
+    journal: Annotated[
+        bool | None,
+        typer.Option(
+            "--journal/--no-journal",
+            help="journal the changes of the files, so that an interrupted run can be resumed. "
+            "on by default with -a, -r and --convert.",
+            show_default=False,
+        ),
+    ] = None,
+    checkpoint_files: Annotated[
+        int,
+        typer.Option(
+            "--checkpoint-files",
+            help="write the journal of the run to disk after the changes of this many files.",
+        ),
+    ] = 1000,
+    checkpoint_interval: Annotated[
+        float,
+        typer.Option(
+            "--checkpoint-interval",
+            help="write the journal of the run to disk after this many seconds, 0 to only write it per files.",
+        ),
+    ] = 10,
 ) -> None:
+    # imported here, so that --help and invalid arguments do not load the stages
+    from fileidentification.filehandling import FileHandler
+
     fh = FileHandler()
     fh.run(
         root_folder=root_folder,
@@ -116,6 +293,35 @@ def main(
         mode_quiet=mode_quiet,
         to_csv=to_csv,
         inspect=inspect,
+        jobs=jobs,
+        include=include,
+        exclude=exclude,
+        symlinks=symlinks,
+        hash_algo=hash_algo,
+        use_mmap=use_mmap,
+        fixity=fixity,
+        incremental=incremental,
+        log_format=log_format,
+        catalog=catalog,
+        slots=slots,
+        cpus=cpus,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        progress_interval=progress_interval,
+        decode=decode,
+        decode_segments=decode_segments,
+        decode_seconds=decode_seconds,
+        decode_time_budget=decode_time_budget,
+        decode_size_budget=decode_size_budget,
+        timeouts=timeouts,
+        memory_budget=memory_budget,
+        cpu_time_limit=cpu_time_limit,
+        concurrency=concurrency,
+        stream=stream,
+        resume=resume,
+        journal=journal,
+        checkpoint_files=checkpoint_files,
+        checkpoint_interval=checkpoint_interval,
     )
 
 
@@ -1,5 +1,6 @@
 import json
 from pathlib import Path
+from typing import Annotated
 
 import requests  # type: ignore[import-untyped]
 import typer
@@ -7,7 +8,8 @@ from bs4 import BeautifulSoup
 from lxml import etree, objectify  # type: ignore[import-untyped]
 from typer import colors, secho
 
-from fileidentification.definitions.settings import FMTJSN, DroidSigURL
+from fileidentification.definitions.formats import compile_index
+from fileidentification.definitions.settings import FMTINDEX, FMTJSN, DroidSigURL
 
 
 def write_fmt2ext(link: str) -> None:
@@ -52,13 +54,22 @@ def write_fmt2ext(link: str) -> None:
         puids[puid] = format_info
 
     FMTJSN.write_text(json.dumps(puids, indent=4, ensure_ascii=False))
+    compile_index(FMTJSN, FMTINDEX)
     secho(
-        f"extensions and names updated to {link[-8:-4]} in {FMTJSN}",
+        f"extensions and names updated to {link[-8:-4]} in {FMTJSN} and {FMTINDEX}",
         fg=colors.GREEN,
     )
 
 
-def update_signatures() -> None:
+def update_signatures(
+    index_only: Annotated[
+        bool, typer.Option("--index-only", help=f"just recompile {FMTINDEX.name} from {FMTJSN.name}")
+    ] = False,
+) -> None:
+    if index_only:
+        compile_index(FMTJSN, FMTINDEX)
+        secho(f"compiled {FMTINDEX}", fg=colors.GREEN)
+        return
     # get the latest signaturefile link
     secho(f"... updating {FMTJSN}")
     url = DroidSigURL.NALIST